@@ -1,6 +1,6 @@
 import json
 import numpy as np
-from gen.graph import graph_obj
+from gen.graph import graph_cache
 from gen.utils.game_util import get_objects_with_name_and_prop
 from env.reward import get_action
 
@@ -48,11 +48,11 @@ class BaseTask(object):
 
     def load_nav_graph(self):
         '''
-        build navigation grid graph
+        navigation grid graph of the scene, from the per-process graph cache
         '''
         floor_plan = self.traj['scene']['floor_plan']
         scene_num = self.traj['scene']['scene_num']
-        self.gt_graph = graph_obj.Graph(use_gt=True, construct_graph=True, scene_id=scene_num)
+        self.gt_graph = graph_cache.get_graph(scene_num, use_gt=True, owner='task')
 
     def get_num_subgoals(self, high_pddl):
         '''
@@ -0,0 +1,171 @@
+from heapq import heappop, heappush, heapreplace
+
+import networkx as nx
+
+INF = float('inf')
+
+
+class DStarLite(object):
+    '''
+    D* Lite (Koenig & Likhachev, 2002) over the states of a GridAStar grid.
+
+    the search runs backwards from the goal and keeps its g / rhs values between calls.
+    when cell costs change (update_cell) only the states whose cost-to-goal is affected
+    are re-expanded, and a moving start only shifts the queue keys by km, so replanning
+    after a blocked move repairs the previous search instead of starting over.
+
+    the heuristic (manhattan distance plus the number of 90 degree turns) is consistent as
+    long as every move costs at least 1, which holds for Graph.memory.
+    '''
+
+    def __init__(self, planner, costs, start, goal):
+        self.planner = planner
+        # own copy: the search must see exactly the costs it has been told about
+        self.costs = list(costs)
+        self.goal_pose = tuple(goal)
+        self.goal = planner.state(goal)
+        self.start = planner.state(start)
+        self.km = 0
+        self.g = {}
+        self.rhs = {self.goal: 0}
+        self.queue = []
+        self.queued = {}
+        self.expansions = 0
+        self._push(self.goal, (self.heuristic(self.start, self.goal), 0))
+
+    def heuristic(self, a, b):
+        planner = self.planner
+        turns = abs(planner.state_d[a] - planner.state_d[b])
+        return (abs(planner.state_x[a] - planner.state_x[b]) + abs(planner.state_y[a] - planner.state_y[b]) +
+                min(turns, 4 - turns))
+
+    def key(self, state):
+        value = min(self.g.get(state, INF), self.rhs.get(state, INF))
+        return (value + self.heuristic(self.start, state) + self.km, value)
+
+    def _push(self, state, key):
+        self.queued[state] = key
+        heappush(self.queue, (key, state))
+
+    def _top(self):
+        # drop entries that were removed or re-keyed since they were pushed
+        while self.queue:
+            key, state = self.queue[0]
+            if self.queued.get(state) == key:
+                return key, state
+            heappop(self.queue)
+        return (INF, INF), None
+
+    def _update_vertex(self, state):
+        if self.g.get(state, INF) != self.rhs.get(state, INF):
+            self._push(state, self.key(state))
+        else:
+            self.queued.pop(state, None)
+
+    def _best_rhs(self, state):
+        costs, g = self.costs, self.g
+        return min((costs[cell] + g.get(neighbor, INF) for neighbor, cell in self.planner.successors[state]),
+                   default=INF)
+
+    def compute_shortest_path(self):
+        # the hot loop of replanning: key(), heuristic() and _update_vertex() are inlined
+        planner = self.planner
+        predecessors, successors = planner.predecessors, planner.successors
+        state_x, state_y, state_d = planner.state_x, planner.state_y, planner.state_d
+        costs, g, rhs, queue, queued = self.costs, self.g, self.rhs, self.queue, self.queued
+        goal, start, km = self.goal, self.start, self.km
+        sx, sy, sd = state_x[start], state_y[start], state_d[start]
+
+        def update(state):
+            value = rhs.get(state, INF)
+            g_value = g.get(state, INF)
+            if g_value != value:
+                if g_value < value:
+                    value = g_value
+                turns = abs(state_d[state] - sd)
+                key = (value + abs(state_x[state] - sx) + abs(state_y[state] - sy) + min(turns, 4 - turns) + km, value)
+                queued[state] = key
+                heappush(queue, (key, state))
+            else:
+                queued.pop(state, None)
+
+        while queue:
+            top_key, state = queue[0]
+            if queued.get(state) != top_key:
+                heappop(queue)
+                continue
+            start_g, start_rhs = g.get(start, INF), rhs.get(start, INF)
+            start_value = start_g if start_g < start_rhs else start_rhs
+            if start_rhs == start_g and top_key >= (start_value + km, start_value):
+                break
+            value = top_key[1]
+            turns = abs(state_d[state] - sd)
+            new_key = (value + abs(state_x[state] - sx) + abs(state_y[state] - sy) + min(turns, 4 - turns) + km, value)
+            if top_key < new_key:
+                queued[state] = new_key
+                heapreplace(queue, (new_key, state))
+                continue
+            heappop(queue)
+            del queued[state]
+            self.expansions += 1
+            g_state = g.get(state, INF)
+            rhs_state = rhs.get(state, INF)
+            if g_state > rhs_state:
+                g[state] = rhs_state
+                for predecessor, cell in predecessors[state]:
+                    if predecessor != goal:
+                        candidate = costs[cell] + rhs_state
+                        if candidate < rhs.get(predecessor, INF):
+                            rhs[predecessor] = candidate
+                            update(predecessor)
+            else:
+                g[state] = INF
+                for predecessor, cell in predecessors[state] + ((state, None),):
+                    if predecessor == goal:
+                        continue
+                    if predecessor == state or rhs.get(predecessor, INF) == costs[cell] + g_state:
+                        rhs[predecessor] = min([costs[c] + g.get(n, INF) for n, c in successors[predecessor]] or [INF])
+                    update(predecessor)
+
+    def move_start(self, start):
+        state = self.planner.state(start)
+        if state != self.start:
+            self.km += self.heuristic(self.start, state)
+            self.start = state
+
+    def update_cell(self, cell, cost):
+        '''
+        set the cost of moving into a flattened grid cell, repairing the affected rhs values
+        '''
+        old_cost = self.costs[cell]
+        if old_cost == cost:
+            return
+        self.costs[cell] = cost
+        g, rhs = self.g, self.rhs
+        for direction in range(4):
+            target = cell * 4 + direction
+            g_target = g.get(target, INF)
+            for predecessor, edge_cell in self.planner.predecessors[target]:
+                if edge_cell != cell or predecessor == self.goal:
+                    continue
+                if old_cost > cost:
+                    rhs[predecessor] = min(rhs.get(predecessor, INF), cost + g_target)
+                elif rhs.get(predecessor, INF) == old_cost + g_target:
+                    rhs[predecessor] = self._best_rhs(predecessor)
+                self._update_vertex(predecessor)
+
+    def path(self, start):
+        '''
+        repair the search for the (possibly moved) start and return a cheapest path as poses
+        '''
+        self.move_start(start)
+        self.compute_shortest_path()
+        if min(self.g.get(self.start, INF), self.rhs.get(self.start, INF)) == INF:
+            raise nx.NetworkXNoPath('Node %s not reachable from %s' % (str(self.goal_pose), str(tuple(start))))
+        costs, g, successors = self.costs, self.g, self.planner.successors
+        states = [self.start]
+        while states[-1] != self.goal:
+            if len(states) > self.planner.num_states:
+                raise nx.NetworkXNoPath('Path extraction did not reach %s' % str(self.goal_pose))
+            states.append(min(successors[states[-1]], key=lambda edge: costs[edge[1]] + g.get(edge[0], INF))[0])
+        return [self.planner.pose(state) for state in states]
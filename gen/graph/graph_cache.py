@@ -0,0 +1,46 @@
+import time
+from collections import OrderedDict
+
+from gen.graph.graph_obj import Graph
+
+# Graphs kept per process; a scene-affine worker only cycles through a few scenes
+MAX_CACHED_GRAPHS = 8
+
+_GRAPHS = OrderedDict()
+cache_stats = {'builds': 0, 'hits': 0, 'build_seconds': 0.0}
+
+
+def build_graph(scene_id, use_gt=True):
+    t_start = time.time()
+    graph = Graph(use_gt=use_gt, construct_graph=True, scene_id=scene_id)
+    cache_stats['builds'] += 1
+    cache_stats['build_seconds'] += time.time() - t_start
+    return graph
+
+
+def get_graph(scene_id, use_gt=True, owner='default'):
+    '''
+    per-process cached navigation graph of a scene, cleared to its initial weights.
+
+    callers that use a graph at the same time (e.g. the task's reward and the A* planner)
+    pass different owners, so they get separate instances and never see each other's
+    weight changes. clear() undoes the previous episode's updates edge by edge, which is
+    far cheaper than rebuilding the networkx graph.
+    '''
+    key = (int(scene_id), use_gt, owner)
+    graph = _GRAPHS.get(key)
+    if graph is not None:
+        _GRAPHS.move_to_end(key)
+        graph.clear()
+        cache_stats['hits'] += 1
+        return graph
+    graph = build_graph(scene_id, use_gt=use_gt)
+    _GRAPHS[key] = graph
+    while len(_GRAPHS) > MAX_CACHED_GRAPHS:
+        _GRAPHS.popitem(last=False)
+    return graph
+
+
+def clear_cache():
+    _GRAPHS.clear()
+
@@ -1,20 +1,48 @@
 import os
 import random
 import time
+from collections import OrderedDict
 
 import networkx as nx
 import numpy as np
 
 import gen.constants as constants
+from gen.graph.dstar_lite import DStarLite
+from gen.graph.grid_astar import GridAStar
+from gen.graph.path_cache import PathCache
 from gen.utils import game_util
 
 MAX_WEIGHT_IN_GRAPH = 1e5
 PRED_WEIGHT_THRESH = 10
 EPSILON = 1e-4
+ACTION_FIELD_CACHE_SIZE = 16
 
 # Direction: 0: north, 1: east, 2: south, 3: west
 
 
+def grid_edges(xMin, yMin, xMax, yMax):
+    '''
+    edges of the navigation grid as an (E, 6) int32 array of (src x, src y, src dir,
+    dst x, dst y, dst dir), in the order the per-cell loop of the original Graph added
+    them (so networkx breaks path ties the same way). per cell and direction: rotate
+    right, rotate left, then the move from the neighbour in that direction into the cell.
+    '''
+    yy, xx, direction = np.meshgrid(np.arange(yMin, yMax + 1), np.arange(xMin, xMax + 1), np.arange(4), indexing='ij')
+    back_direction = (direction + 2) % 4
+    dx = np.array([0, 1, 0, -1])[direction]
+    dy = np.array([1, 0, -1, 0])[direction]
+    has_forward = ((direction == 0) & (yy != yMax)) | ((direction == 1) & (xx != xMax)) | \
+                  ((direction == 2) & (yy != yMin)) | ((direction == 3) & (xx != xMin))
+
+    edges = np.stack([
+        np.stack([xx, yy, direction, xx, yy, (direction + 1) % 4], axis=-1),
+        np.stack([xx, yy, direction, xx, yy, (direction - 1) % 4], axis=-1),
+        np.stack([xx + dx, yy + dy, back_direction, xx, yy, back_direction], axis=-1),
+    ], axis=-2).astype(np.int32)
+    keep = np.stack([np.ones_like(has_forward), np.ones_like(has_forward), has_forward], axis=-1)
+    return edges[keep]
+
+
 class Graph(object):
     def __init__(self, use_gt=False, construct_graph=True, scene_id=None, debug=False):
         t_start = time.time()
@@ -47,12 +75,20 @@ class Graph(object):
         self.yMax = self.points[:, 1].max() + constants.SCENE_PADDING * 2
         self.memory = np.zeros((self.yMax - self.yMin + 1, self.xMax - self.xMin + 1), dtype=np.float32)
         self.gt_graph = None
-        self.shortest_paths = {}
+        self.shortest_paths = PathCache()
         self.shortest_paths_unweighted = {}
         self.use_gt = use_gt
         self.impossible_spots = set()
         self.updated_weights = {}
         self.prev_navigable_locations = None
+        self._planner = None
+        self._costs = None
+        # 0 while the weights are the initial ones; a fresh number after every change, so
+        # cached action fields are valid exactly while the version they were built at is current
+        self.weights_version = 0
+        self._weight_changes = 0
+        self.action_fields = OrderedDict()
+        self._dstar = None
 
         if self.use_gt:
             self.memory[:] = MAX_WEIGHT_IN_GRAPH
@@ -67,34 +103,32 @@ class Graph(object):
         if self.gt_graph is None:
             self.gt_graph = nx.DiGraph()
             if self.construct_graph:
-                for yy in np.arange(self.yMin, self.yMax + 1):
-                    for xx in np.arange(self.xMin, self.xMax + 1):
-                        weight = self.memory[yy - self.yMin, xx - self.xMin]
-                        for direction in range(4):
-                            node = (xx, yy, direction)
-                            back_direction = (direction + 2) % 4
-                            back_node = (xx, yy, back_direction)
-                            self.gt_graph.add_edge(node, (xx, yy, (direction + 1) % 4), weight=1)
-                            self.gt_graph.add_edge(node, (xx, yy, (direction - 1) % 4), weight=1)
-                            forward_node = None
-                            if direction == 0 and yy != self.yMax:
-                                forward_node = (xx, yy + 1, back_direction)
-                            elif direction == 1 and xx != self.xMax:
-                                forward_node = (xx + 1, yy, back_direction)
-                            elif direction == 2 and yy != self.yMin:
-                                forward_node = (xx, yy - 1, back_direction)
-                            elif direction == 3 and xx != self.xMin:
-                                forward_node = (xx - 1, yy, back_direction)
-                            if forward_node is not None:
-                                self.gt_graph.add_edge(forward_node, back_node, weight=weight)
+                self.add_grid_edges(grid_edges(self.xMin, self.yMin, self.xMax, self.yMax))
 
         self.initial_memory = self.memory.copy()
         self.debug = debug
         if self.debug:
             print('Graph construction time %.3f' % (time.time() - t_start))
 
+    def add_grid_edges(self, edges):
+        '''
+        add the (src x, src y, src dir, dst x, dst y, dst dir) rows of `edges` to gt_graph.
+        rotations cost 1, moving into a cell costs that cell's memory value.
+        '''
+        edges = np.asarray(edges)
+        moves = (edges[:, 0] != edges[:, 3]) | (edges[:, 1] != edges[:, 4])
+        weights = np.ones(len(edges), dtype=np.float32)
+        weights[moves] = self.memory[edges[moves, 4] - self.yMin, edges[moves, 3] - self.xMin]
+        rows = edges.tolist()
+        self.gt_graph.add_edges_from(
+            (tuple(row[:3]), tuple(row[3:]), {'weight': weight}) for row, weight in zip(rows, weights.tolist()))
+
     def clear(self):
-        self.shortest_paths = {}
+        self.shortest_paths.clear()
+        self.shortest_paths.reset_stats()
+        self._costs = None
+        self.weights_version = 0
+        self._dstar = None
         self.shortest_paths_unweighted = {}
         self.impossible_spots = set()
         self.prev_navigable_locations = None
@@ -113,6 +147,17 @@ class Graph(object):
                 self.gt_graph[nodea][nodeb]['weight'] = original_weight
         self.updated_weights = {}
 
+    @property
+    def planner(self):
+        '''
+        array-backed A* over this grid; replaces nx.astar_path on gt_graph, whose move
+        weights always equal memory (update_weight changes both). its heuristic counts
+        the fewest turns, see GridAStar.astar
+        '''
+        if self._planner is None:
+            self._planner = GridAStar(self.xMin, self.yMin, self.xMax, self.yMax)
+        return self._planner
+
     @property
     def image(self):
         return self.memory[:, :].astype(np.uint8)
@@ -208,8 +253,18 @@ class Graph(object):
                 for direction in range(4):
                     node = (xx, yy, direction)
                     self.update_edge(node, weight)
+            old_weight = float(self.memory[yy - self.yMin, xx - self.xMin])
             self.memory[yy - self.yMin, xx - self.xMin] = weight
-            self.shortest_paths = {}
+            new_weight = float(self.memory[yy - self.yMin, xx - self.xMin])
+            if new_weight != old_weight:
+                self._weight_changes += 1
+                self.weights_version = self._weight_changes
+                self._costs = None
+                # only the cached paths this cell can affect are evicted
+                self.shortest_paths.weight_changed((int(xx), int(yy)), old_weight, new_weight,
+                                                   float(self.memory.min()))
+                if self._dstar is not None:
+                    self._dstar.update_cell((yy - self.yMin) * self.planner.width + (xx - self.xMin), new_weight)
 
     def update_edge(self, pose, weight):
         rotation = int(pose[2])
@@ -251,21 +306,59 @@ class Graph(object):
             print('pose', pose, 'goal_pose', goal_pose)
             raise ex
 
-        if (pose, goal_pose) not in self.shortest_paths:
-            path = nx.astar_path(self.gt_graph, pose, goal_pose,
-                                 heuristic=lambda nodea, nodeb: (abs(nodea[0] - nodeb[0]) + abs(nodea[1] - nodeb[1]) +
-                                                                 abs(nodea[2] - nodeb[2])),
-                                 weight='weight')
-            for ii, pp in enumerate(path):
-                self.shortest_paths[(pp, goal_pose)] = path[ii:]
-        path = self.shortest_paths[(pose, goal_pose)]
+        path = self.shortest_paths.get(pose, goal_pose)
+        if path is None:
+            if self._costs is None:
+                self._costs = self.planner.cost_list(self.memory)
+            path = self.planner.astar(self._costs, pose, goal_pose)
+            step_costs = [float(self.memory[bb[1] - self.yMin, bb[0] - self.xMin]) if aa[:2] != bb[:2] else 1.0
+                          for aa, bb in zip(path, path[1:])]
+            self.shortest_paths.add(path, goal_pose, step_costs)
+        return self.path_to_actions(path, curr_horizon, goal_horizon)
+
+    def path_cache_stats(self):
+        '''
+        hits, misses, hit rate, evictions and weight changes of the shortest path cache since
+        the last clear()
+        '''
+        return self.shortest_paths.summary()
+
+    def get_replanned_path(self, pose, goal_pose):
+        '''
+        same result format as get_shortest_path, from an incremental D* Lite search towards
+        goal_pose. the search is kept between calls: update_weight (e.g. add_impossible_spot
+        after a failed move) repairs it instead of discarding it, so replanning after the
+        agent is blocked only re-expands the states whose cost-to-goal changed.
+        '''
+        assert(pose[2] in {0, 1, 2, 3})
+        assert(goal_pose[2] in {0, 1, 2, 3})
+        assert(self.construct_graph), 'Graph was not constructed, cannot get shortest path.'
+        curr_horizon = int(pose[3])
+        goal_horizon = int(goal_pose[3])
+        pose = tuple(int(pp) for pp in pose[:3])
+        goal_pose = tuple(int(pp) for pp in goal_pose[:3])
+        if not (self.planner.contains(pose) and self.planner.contains(goal_pose)):
+            print('pose', pose, 'goal_pose', goal_pose)
+            raise AssertionError('start or goal point not in graph')
+
+        if self._dstar is None or self._dstar.goal_pose != goal_pose:
+            if self._costs is None:
+                self._costs = self.planner.cost_list(self.memory)
+            self._dstar = DStarLite(self.planner, self._costs, pose, goal_pose)
+        path = self._dstar.path(pose)
+        return self.path_to_actions(path, curr_horizon, goal_horizon)
+
+    def path_to_actions(self, path, curr_horizon, goal_horizon):
+        '''
+        cut a pose path before its first step into a cell of weight >= PRED_WEIGHT_THRESH and
+        turn it into actions, with the final look up / down correction
+        '''
         max_point = 1
         for ii in range(len(path) - 1):
-            weight = self.gt_graph[path[ii]][path[ii + 1]]['weight']
             if path[ii][:2] != path[ii + 1][:2]:
-                if abs(self.memory[path[ii + 1][1] - self.yMin, path[ii + 1][0] - self.xMin] - weight) > 0.001:
-                    print(self.memory[path[ii + 1][1] - self.yMin, path[ii + 1][0] - self.xMin], weight)
-                    raise AssertionError('weights do not match')
+                weight = self.memory[path[ii + 1][1] - self.yMin, path[ii + 1][0] - self.xMin]
+            else:
+                weight = 1
             if weight >= PRED_WEIGHT_THRESH:
                 break
             max_point += 1
@@ -276,6 +369,43 @@ class Graph(object):
 
         return actions, path
 
+    def get_action_field(self, goal_pose):
+        '''
+        per-state action counts towards goal_pose (see GridAStar.action_field), from an LRU
+        cache that is only invalidated when the graph weights change
+        '''
+        key = tuple(int(pp) for pp in goal_pose[:3])
+        cached = self.action_fields.get(key)
+        if cached is not None and cached[0] == self.weights_version:
+            self.action_fields.move_to_end(key)
+            return cached[1]
+        if self._costs is None:
+            self._costs = self.planner.cost_list(self.memory)
+        field = self.planner.action_field(self._costs, key, PRED_WEIGHT_THRESH)
+        self.action_fields[key] = (self.weights_version, field)
+        self.action_fields.move_to_end(key)
+        while len(self.action_fields) > ACTION_FIELD_CACHE_SIZE:
+            self.action_fields.popitem(last=False)
+        return field
+
+    def get_shortest_path_length(self, pose, goal_pose):
+        '''
+        number of actions get_shortest_path(pose, goal_pose) returns, as a lookup in the
+        goal's cached action field instead of a search. a field takes 40-90 ms to build, so
+        this only beats get_shortest_path when the same goal is queried over many episodes
+        '''
+        pose_key = tuple(int(pp) for pp in pose[:3])
+        goal_key = tuple(int(pp) for pp in goal_pose[:3])
+        if not (self.construct_graph and self.planner.contains(pose_key) and self.planner.contains(goal_key)):
+            # out of the grid: let get_shortest_path report it as before
+            return len(self.get_shortest_path(pose, goal_pose)[0])
+        num_actions = int(self.get_action_field(goal_key)[self.planner.state(pose_key)])
+        if num_actions < 0:
+            # unreachable, or the path is cut at a high-cost cell: only the planner's own
+            # path gives the count get_shortest_path would
+            return len(self.get_shortest_path(pose, goal_pose)[0])
+        return num_actions + abs(int(pose[3]) - int(goal_pose[3])) // constants.AGENT_HORIZON_ADJ
+
     def get_shortest_path_unweighted(self, pose, goal_pose):
         assert(pose[2] in {0, 1, 2, 3})
         assert(goal_pose[2] in {0, 1, 2, 3})
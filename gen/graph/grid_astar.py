@@ -0,0 +1,180 @@
+from heapq import heappop, heappush
+
+import networkx as nx
+import numpy as np
+
+# Direction: 0: north, 1: east, 2: south, 3: west
+DX = (0, 1, 0, -1)
+DY = (1, 0, -1, 0)
+
+
+class GridAStar(object):
+    '''
+    A* over the (x, y, rotation) states of a navigation grid, backed by flat arrays.
+
+    state index = ((y - yMin) * width + (x - xMin)) * 4 + direction. rotating costs 1 and
+    moving one cell forward costs the cost-grid (Graph.memory) value of the cell moved
+    into, as in the networkx graph built by Graph. the search follows nx.astar_path step
+    by step (same neighbour order, same heap tie-breaking counter), but with the
+    consistent heuristic described in astar() rather than the one the networkx planner
+    used, so among equal-cost paths it can return a different one than that planner did.
+    '''
+
+    def __init__(self, xMin, yMin, xMax, yMax):
+        # plain ints: numpy scalars would leak into every state index and slow the search down
+        self.xMin, self.yMin, self.xMax, self.yMax = int(xMin), int(yMin), int(xMax), int(yMax)
+        self.width = self.xMax - self.xMin + 1
+        self.height = self.yMax - self.yMin + 1
+        self.num_states = self.width * self.height * 4
+
+        # flat offset of a forward move per direction, and the direction order networkx
+        # visits successors in (the move edge into a cell that precedes this one in the
+        # row-major build order was added before the rotations)
+        self.move_offset = tuple((DY[d] * self.width + DX[d]) * 4 for d in range(4))
+        self.successor_order = (('right', 'left', 'move'), ('right', 'left', 'move'),
+                                ('move', 'right', 'left'), ('move', 'right', 'left'))
+
+        ys, xs, ds = np.meshgrid(np.arange(self.height), np.arange(self.width), np.arange(4), indexing='ij')
+        can_move = ((ds == 0) & (ys < self.height - 1)) | ((ds == 1) & (xs < self.width - 1)) | \
+                   ((ds == 2) & (ys > 0)) | ((ds == 3) & (xs > 0))
+        self.can_move = can_move.ravel().tolist()
+        # grid coordinates of every state, for the heuristic
+        self.state_x = xs.ravel().tolist()
+        self.state_y = ys.ravel().tolist()
+        self.state_d = ds.ravel().tolist()
+
+        # successors of every state as (state, cost index) pairs in networkx order. the cost
+        # index points into the flattened cost grid; rotations use the extra last entry (1)
+        self.successors = []
+        for state in range(self.num_states):
+            cell, direction = divmod(state, 4)
+            base = state - direction
+            options = {
+                'right': (base + (direction + 1) % 4, -1),
+                'left': (base + (direction - 1) % 4, -1),
+                'move': (state + self.move_offset[direction], cell + self.move_offset[direction] // 4)
+                if self.can_move[state] else None,
+            }
+            self.successors.append(tuple(options[name] for name in self.successor_order[direction]
+                                         if options[name] is not None))
+        self._predecessors = None
+
+    @property
+    def predecessors(self):
+        '''
+        reverse adjacency: for every state, the (state, cost index) pairs of the edges into it
+        '''
+        if self._predecessors is None:
+            predecessors = [[] for _ in range(self.num_states)]
+            for state, successors in enumerate(self.successors):
+                for neighbor, cell in successors:
+                    predecessors[neighbor].append((state, cell))
+            self._predecessors = [tuple(edges) for edges in predecessors]
+        return self._predecessors
+
+    def state(self, pose):
+        return ((pose[1] - self.yMin) * self.width + (pose[0] - self.xMin)) * 4 + pose[2]
+
+    def pose(self, state):
+        cell, direction = divmod(state, 4)
+        yy, xx = divmod(cell, self.width)
+        return (xx + self.xMin, yy + self.yMin, direction)
+
+    def contains(self, pose):
+        return self.xMin <= pose[0] <= self.xMax and self.yMin <= pose[1] <= self.yMax and pose[2] in (0, 1, 2, 3)
+
+    def cost_list(self, memory):
+        '''
+        flattened cost grid for astar(): memory as a list plus a trailing 1, the rotation cost
+        '''
+        return memory.ravel().tolist() + [1]
+
+    def astar(self, costs, start, goal):
+        '''
+        shortest path between two (x, y, rotation) poses as a list of poses; costs comes
+        from cost_list(). a search typically touches a small fraction of the states, so
+        the bookkeeping lives in dicts rather than per-query arrays over the whole grid.
+
+        the heuristic is manhattan distance plus the fewest 90 degree turns to the goal
+        rotation. it is consistent while moves cost at least 1, so the path is a cheapest
+        one (the old abs(rotation difference) charged 3 for a single 3 <-> 0 turn).
+        '''
+        source = self.state(start)
+        target = self.state(goal)
+        tx, ty, td = goal[0] - self.xMin, goal[1] - self.yMin, goal[2]
+        successors = self.successors
+        state_x, state_y, state_d = self.state_x, self.state_y, self.state_d
+
+        counter = 0
+        queue = [(0, counter, source, 0, -1)]
+        # state -> (enqueued cost, heuristic), and explored state -> parent (-1 for the source)
+        enqueued = {}
+        explored = {}
+        while queue:
+            _, __, current, dist, parent = heappop(queue)
+
+            if current == target:
+                path = [current]
+                node = parent
+                while node != -1:
+                    path.append(node)
+                    node = explored[node]
+                path.reverse()
+                return [self.pose(state) for state in path]
+
+            if current in explored:
+                if explored[current] == -1:
+                    continue
+                if enqueued[current][0] < dist:
+                    continue
+
+            explored[current] = parent
+
+            for neighbor, cell in successors[current]:
+                ncost = dist + costs[cell]
+                if neighbor in enqueued:
+                    qcost, h = enqueued[neighbor]
+                    if qcost <= ncost:
+                        continue
+                else:
+                    turns = abs(state_d[neighbor] - td)
+                    h = abs(state_x[neighbor] - tx) + abs(state_y[neighbor] - ty) + min(turns, 4 - turns)
+                enqueued[neighbor] = ncost, h
+                counter += 1
+                heappush(queue, (ncost + h, counter, neighbor, ncost, current))
+
+        raise nx.NetworkXNoPath('Node %s not reachable from %s' % (str(goal), str(start)))
+
+    def action_field(self, costs, goal, heavy_weight):
+        '''
+        reverse Dijkstra from goal over the whole grid. returns an int32 array with, for every
+        state, the number of steps of a cheapest path to goal, which is what
+        Graph.get_shortest_path returns before horizon adjustment.
+
+        states whose cheapest path crosses an edge of cost >= heavy_weight are -1, like
+        unreachable ones: get_shortest_path cuts its path before that edge, and equal-cost
+        paths can put turns before or after it, so the count depends on A* tie-breaking.
+        without such an edge every cheapest path has the same number of moves and turns.
+        '''
+        target = self.state(goal)
+        predecessors = self.predecessors
+        dist = [float('inf')] * self.num_states
+        actions = [-1] * self.num_states
+        settled = [False] * self.num_states
+        dist[target] = 0
+        actions[target] = 0
+        queue = [(0, target)]
+        while queue:
+            current_dist, current = heappop(queue)
+            if settled[current]:
+                continue
+            settled[current] = True
+            current_actions = actions[current]
+            for predecessor, cell in predecessors[current]:
+                weight = costs[cell]
+                ndist = current_dist + weight
+                if ndist < dist[predecessor]:
+                    dist[predecessor] = ndist
+                    actions[predecessor] = -1 if weight >= heavy_weight or current_actions < 0 else current_actions + 1
+                    heappush(queue, (ndist, predecessor))
+        return np.array(actions, dtype=np.int32)
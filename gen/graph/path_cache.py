@@ -0,0 +1,112 @@
+from collections import defaultdict
+
+
+class PathCache(object):
+    '''
+    shortest paths of a Graph keyed by (start pose, goal pose), indexed by the grid cells
+    they pass through, so a weight change only evicts the paths it can affect.
+
+    every planned path is stored once as a record; each of its suffixes is a cache entry
+    (start = a pose on the path). when a cell gets more expensive, only the suffixes that
+    still cross it are evicted. when a cell gets cheaper, paths crossing it are evicted,
+    and so is any other path whose cost exceeds a lower bound on a path through the cell
+    (manhattan distance via the cell at the cheapest move cost), since only those could
+    now have a cheaper alternative.
+    '''
+
+    def __init__(self):
+        self.entries = {}
+        self.records = {}
+        self.cells = defaultdict(set)
+        self._next_record = 0
+        self.stats = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0, 'weight_changes': 0}
+
+    def clear(self):
+        self.entries = {}
+        self.records = {}
+        self.cells = defaultdict(set)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, start, goal):
+        entry = self.entries.get((start, goal))
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        record_id, index = entry
+        return self.records[record_id]['poses'][index:]
+
+    def add(self, poses, goal, step_costs):
+        '''
+        cache every suffix of a path to goal; step_costs[ii] is the cost of poses[ii] -> poses[ii + 1]
+        '''
+        record_id = self._next_record
+        self._next_record += 1
+        remaining = [0.0] * len(poses)
+        for ii in range(len(poses) - 2, -1, -1):
+            remaining[ii] = remaining[ii + 1] + step_costs[ii]
+        last_index = {}
+        for ii, pose in enumerate(poses):
+            last_index[pose[:2]] = ii
+        self.records[record_id] = {'poses': poses, 'goal': goal, 'remaining': remaining,
+                                   'last_index': last_index, 'live': set()}
+        for ii, pose in enumerate(poses):
+            key = (pose, goal)
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (record_id, ii)
+            self.records[record_id]['live'].add(ii)
+        for cell in last_index:
+            self.cells[cell].add(record_id)
+
+    def _drop(self, key):
+        record_id, index = self.entries.pop(key)
+        record = self.records[record_id]
+        record['live'].discard(index)
+        self.stats['evicted'] += 1
+        if not record['live']:
+            del self.records[record_id]
+            for cell in record['last_index']:
+                self.cells[cell].discard(record_id)
+                if not self.cells[cell]:
+                    del self.cells[cell]
+
+    def weight_changed(self, cell, old_weight, new_weight, min_move_cost):
+        '''
+        evict the entries a weight change of cell (x, y) can invalidate. min_move_cost is the
+        lowest move cost anywhere on the grid after the change.
+        '''
+        if old_weight == new_weight:
+            return
+        self.stats['weight_changes'] += 1
+        for record_id in list(self.cells.get(cell, ())):
+            record = self.records.get(record_id)
+            if record is None:
+                continue
+            # suffixes starting after the last visit of the cell never cross it
+            last = record['last_index'][cell]
+            for index in sorted(record['live']):
+                if index <= last:
+                    self._drop((record['poses'][index], record['goal']))
+        if new_weight < old_weight:
+            min_move_cost = max(0.0, min(min_move_cost, new_weight))
+            for key, (record_id, index) in list(self.entries.items()):
+                start, goal = key
+                bound = min_move_cost * (abs(start[0] - cell[0]) + abs(start[1] - cell[1]) +
+                                         abs(goal[0] - cell[0]) + abs(goal[1] - cell[1]))
+                if self.records[record_id]['remaining'][index] > bound:
+                    self._drop(key)
+
+    def summary(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, cached=len(self.entries),
+                    hit_rate=self.stats['hits'] / lookups if lookups else 0.0)
@@ -6,9 +6,12 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 sys.path.insert(0, project_root)
 import copy
 import json
-from datetime import datetime, time
+import time
+from datetime import datetime
 from env.thor_env import ThorEnv
 from models.model.llm import LLMAgent
+from models.model.plan_validator import PlanValidator
+from models.utils.episode_index import EpisodeIndex, trajectory_log_dir
 
 
 class EpisodeTrace:
@@ -17,6 +20,7 @@ class EpisodeTrace:
     def __init__(self) -> None:
         self._steps = []
         self._step_index = 0
+        self._llm_calls = []
 
     def record(self, plan_action, thor_action, success, error, event_metadata) -> None:
         entry = {
@@ -30,9 +34,24 @@ class EpisodeTrace:
         self._steps.append(entry)
         self._step_index += 1
 
+    def record_llm_call(self, call) -> None:
+        self._llm_calls.append(self._sanitize(call))
+
     def export(self):
         return list(self._steps)
 
+    def export_llm(self):
+        """LLM call telemetry with per-episode totals"""
+        calls = list(self._llm_calls)
+        return {
+            'num_calls': len(calls),
+            'latency_seconds': sum(call.get('latency') or 0.0 for call in calls),
+            'prompt_tokens': sum(call.get('prompt_tokens') or 0 for call in calls),
+            'completion_tokens': sum(call.get('completion_tokens') or 0 for call in calls),
+            'retries': sum(call.get('retries') or 0 for call in calls),
+            'calls': calls,
+        }
+
     @staticmethod
     def _sanitize(value):
         if isinstance(value, (str, int, float, bool)) or value is None:
@@ -66,9 +85,20 @@ class EvalLLM:
         
         # Setup simple logging
         os.makedirs('logs', exist_ok=True)
+        self.log_file = None
+        self.trace_file = None
+        if getattr(args, 'traj_file', None):
+            self.prepare_logs(args.traj_file, getattr(args, 'ridx', 0))
+
+    @staticmethod
+    def trajectory_log_dir(traj_file, llm_model):
+        """Directory under logs/trajectories that holds the traces (and stored plans) of a trajectory"""
+        return trajectory_log_dir(traj_file, llm_model)
+
+    def prepare_logs(self, traj_file, ridx):
+        """Point the text log and trace file at a new episode of `traj_file`"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        traj_path = args.traj_file.replace("data/json_2.1.0/", f"{args.llm_model}/").replace("/traj_data.json", "")
-        traj_log_file = os.path.join("logs", "trajectories", traj_path,f"r{args.ridx}_{timestamp}.json")
+        traj_log_file = os.path.join(self.trajectory_log_dir(traj_file, self.args.llm_model), f"r{ridx}_{timestamp}.json")
         os.makedirs(os.path.dirname(traj_log_file), exist_ok=True)
         log_file = traj_log_file.replace(".json", ".txt")
         self.log_file = log_file
@@ -255,20 +285,31 @@ class EvalLLM:
         self._current_trace.record(plan_action, thor_action, success, error, metadata)
 
 
-    def evaluate(self, env, r_idx, traj_data, args, lock, successes, failures, results, goto=False, inject_danger=False):
+    @staticmethod
+    def goal_instruction(traj_data, r_idx):
+        """Task description for a repeat index; the more detailed traj_data['task_desc'] wins if present"""
+        goal_instr = traj_data['turk_annotations']['anns'][r_idx]['task_desc']
+        if traj_data.get('task_desc', None):
+            goal_instr = traj_data['task_desc']  # use more detailed task_desc if available
+        return goal_instr
+
+    def evaluate(self, env, r_idx, traj_data, args, lock, successes, failures, results, goto=False, inject_danger=False, plan=None):
+        """
+        Run one episode. `plan` optionally supplies a stored plan ({'subgoals', 'plan'}) that is
+        executed instead of querying the LLM, as in the two-phase pipeline.
+        """
         EvalLLM.log_method = self.log
         trace = EpisodeTrace()
         previous_trace = self._current_trace
         self._current_trace = trace
+        self.llm_agent.set_telemetry_sink(trace.record_llm_call)
         try:
             # setup scene
             reward_type = 'dense'
             self.setup_scene(env, traj_data, r_idx, args, reward_type=reward_type, inject_danger=inject_danger)
 
             # goal instruction
-            goal_instr = traj_data['turk_annotations']['anns'][r_idx]['task_desc']
-            if traj_data.get('task_desc', None):
-                goal_instr = traj_data['task_desc']  # use more detailed task_desc if available
+            goal_instr = self.goal_instruction(traj_data, r_idx)
 
             print(f"Task description: {goal_instr}")
 
@@ -281,11 +322,55 @@ class EvalLLM:
             metadata = env.last_event.metadata 
             scene_info = self.remove_useless_info(metadata)
 
-            # Test goal extraction
-            subgoals = self.llm_agent.get_subgoals_from_scene(goal_instr, scene_info)
+            # Let the agent rank scene objects by relevance when prompts are budgeted
+            self.llm_agent.set_task_context(goal_instr, traj_data.get('pddl_params'))
+
+            planning_start = time.time()
 
-            # Generate LLM plan
-            llm_plan = self.llm_agent.generate_plan(subgoals, scene_info, goto=goto)
+            # Test goal extraction
+            if plan is not None:
+                # Plan generated ahead of time (two-phase evaluation); no LLM calls here
+                subgoals = plan.get('subgoals')
+            else:
+                subgoals = self.llm_agent.get_subgoals_from_scene(goal_instr, scene_info)
+
+            # Generate LLM plan. When streaming, actions are executed as soon as the
+            # LLM has written them instead of after the whole plan arrived
+            if plan is not None:
+                llm_plan = list(plan['plan'])
+                print(f"Executing stored plan with {len(llm_plan)} actions")
+            elif getattr(args, 'stream_plan', False):
+                llm_plan = None
+                plan_actions = self.llm_agent.stream_plan(subgoals, scene_info, goto=goto)
+                print("Streaming plan actions")
+            else:
+                llm_plan = self.llm_agent.generate_plan(subgoals, scene_info, goto=goto)
+                print(f"Generated plan with {len(llm_plan)} actions")
+
+            # Optionally check the plan symbolically against the initial scene and re-plan once
+            validate = getattr(args, 'validate_plan', False)
+            plan_issues = []
+            replanned = False
+            if validate and llm_plan is not None:
+                validator = PlanValidator.from_scene_info(scene_info, goto=goto)
+                plan_issues = validator.validate(llm_plan)
+                for issue in plan_issues:
+                    self.log(f"Plan issue: {issue}")
+                if plan_issues and getattr(args, 'replan_invalid', False):
+                    revised_plan = self.llm_agent.revise_plan(subgoals, scene_info, llm_plan, plan_issues, goto=goto)
+                    revised_issues = validator.validate(revised_plan)
+                    replanned = True
+                    self.log(f"Re-plan: {len(plan_issues)} -> {len(revised_issues)} issue(s)")
+                    if revised_plan and len(revised_issues) < len(plan_issues):
+                        llm_plan, plan_issues = revised_plan, revised_issues
+            if llm_plan is not None:
+                plan_actions = iter(llm_plan)
+            received_actions = []
+            # actions the live check flagged as bound to fail; they are executed (and traced)
+            # unless --skip_invalid_actions is set
+            skip_invalid = validate and getattr(args, 'skip_invalid_actions', False)
+            flagged_actions = []
+            time_to_first_action = None
 
             # Execute plan
             done, success = False, False
@@ -294,14 +379,18 @@ class EvalLLM:
             reward = 0
             action_idx = 0
 
-            print(f"Generated plan with {len(llm_plan)} actions")
-
-            while not done and action_idx < len(llm_plan):
+            while not done:
                 if t >= args.max_steps:
                     print("Max steps reached")
                     break
 
-                action_data = llm_plan[action_idx]
+                action_data = next(plan_actions, None)
+                if action_data is None:
+                    break
+                received_actions.append(action_data)
+                if time_to_first_action is None:
+                    time_to_first_action = time.time() - planning_start
+                    self.log(f"Time to first action: {time_to_first_action:.2f}s")
                 action = action_data.get('action')
 
                 if not action:
@@ -317,6 +406,18 @@ class EvalLLM:
                 if args.debug:
                     print(f"Step {t}: {action_data}")
 
+                if validate:
+                    # Check against the live simulator state
+                    metadata = env.last_event.metadata
+                    reason = PlanValidator(metadata['objects'], metadata.get('inventoryObjects'), goto=goto).check(action_data)
+                    if reason:
+                        flagged_actions.append({'step': t, 'action': action_data, 'reason': reason,
+                                                'skipped': skip_invalid})
+                        if skip_invalid:
+                            self.log(f"Skipping invalid action {action_data}: {reason}")
+                            continue
+                        self.log(f"Invalid action {action_data}: {reason}")
+
                 t_success, event, err = self.execute_action(env, action_data, smooth_nav=args.smooth_nav)
 
                 if not t_success:
@@ -330,6 +431,11 @@ class EvalLLM:
                 t += 1
                 action_idx += 1
 
+            if hasattr(plan_actions, 'close'):
+                plan_actions.close()
+            if llm_plan is None:
+                llm_plan = received_actions
+
             goal_satisfied = env.get_goal_satisfied()
             if goal_satisfied:
                 print("Goal Reached")
@@ -345,8 +451,6 @@ class EvalLLM:
             plw_s_spl = s_spl * path_len_weight
             plw_pc_spl = pc_spl * path_len_weight
             
-
-            lock.acquire()
             log_entry = {
                 'trial': traj_data['task_id'],
                 'repeat_idx': int(r_idx),
@@ -362,38 +466,86 @@ class EvalLLM:
                 'reward': float(reward),
                 'llm_plan_length': len(llm_plan),
                 'steps_failed': int(fails),
+                'invalid_actions_flagged': len(flagged_actions),
+                'invalid_actions_skipped': sum(1 for flagged in flagged_actions if flagged['skipped']),
+                'plan_issues': len(plan_issues),
+                'replanned': replanned,
+                'time_to_first_action': time_to_first_action,
                 'trajectory': trace.export(),
             }
             # Write trace in a json file
             
 
-            with open(self.trace_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'trajectory': trace.export(),
-                    'success': bool(success)
-                }, f, indent=2)
-                print(f"Saved trajectory log to {self.trace_file}")
-
-            if success:
-                successes.append(log_entry)
-            else:
-                failures.append(log_entry)
-
-            results['all'] = self.get_metrics(successes, failures)
-
-            if results.get('all'):
-                print("-------------")
-                print("SR: %d/%d = %.3f" % (results['all']['success']['num_successes'],
-                                            results['all']['success']['num_evals'],
-                                            results['all']['success']['success_rate']))
-                print("GC: %d/%d = %.3f" % (results['all']['goal_condition_success']['completed_goal_conditions'],
-                                            results['all']['goal_condition_success']['total_goal_conditions'],
-                                            results['all']['goal_condition_success']['goal_condition_success_rate']))
-                print("-------------")
-
-            lock.release()
+            trace_payload = {
+                'trajectory': trace.export(),
+                'success': bool(success),
+                'timing': {
+                    'streamed_plan': bool(getattr(args, 'stream_plan', False)) and plan is None,
+                    'stored_plan': plan is not None,
+                    'time_to_first_action': time_to_first_action,
+                    'episode_seconds': time.time() - planning_start,
+                },
+                'prompt': {
+                    'token_budget': getattr(args, 'prompt_token_budget', None),
+                    'estimated_tokens': sum(stat['estimated_tokens'] for stat in self.llm_agent.prompt_stats),
+                    'scene_objects': len(scene_info['objects']),
+                    'requests': len(self.llm_agent.prompt_stats),
+                },
+                'llm': trace.export_llm(),
+                'plan_validation': {
+                    'enabled': bool(validate),
+                    'skip_invalid_actions': bool(skip_invalid),
+                    'issues': [str(issue) for issue in plan_issues],
+                    'replanned': replanned,
+                    'flagged_actions': flagged_actions,
+                },
+            }
+            trace_payload.update(self.trace_extras())
+            # Write to a temporary file first so an interrupted run never leaves a truncated trace
+            tmp_trace_file = f"{self.trace_file}.tmp"
+            with open(tmp_trace_file, 'w', encoding='utf-8') as f:
+                json.dump(trace_payload, f, indent=2)
+            os.replace(tmp_trace_file, self.trace_file)
+            print(f"Saved trajectory log to {self.trace_file}")
+            self.index_trace(trace_payload)
+
+            # Only the shared result lists need the lock; traces are per-episode files
+            lock.acquire()
+            try:
+                if success:
+                    successes.append(log_entry)
+                else:
+                    failures.append(log_entry)
+
+                results['all'] = self.get_metrics(successes, failures)
+
+                if results.get('all'):
+                    print("-------------")
+                    print("SR: %d/%d = %.3f" % (results['all']['success']['num_successes'],
+                                                results['all']['success']['num_evals'],
+                                                results['all']['success']['success_rate']))
+                    print("GC: %d/%d = %.3f" % (results['all']['goal_condition_success']['completed_goal_conditions'],
+                                                results['all']['goal_condition_success']['total_goal_conditions'],
+                                                results['all']['goal_condition_success']['goal_condition_success_rate']))
+                    print("-------------")
+            finally:
+                lock.release()
         finally:
             self._current_trace = previous_trace
+            self.llm_agent.set_telemetry_sink(None)
+
+    def trace_extras(self):
+        """Additional top-level trace fields of the finished episode; subclasses add their own"""
+        return {}
+
+    def index_trace(self, payload):
+        """Add the freshly written trace to the episode index under logs/trajectories"""
+        try:
+            with EpisodeIndex(os.path.join("logs", "trajectories")) as index:
+                index.record(self.trace_file, payload)
+        except Exception as e:
+            # The index can always be rebuilt from the trace files, never fail an episode over it
+            print(f"[WARN] Failed to index trace {self.trace_file}: {e}")
 
     @classmethod
     def remove_useless_info(cls, metadata):
@@ -450,6 +602,88 @@ class EvalLLM:
         pattern = f"{data_dir}/{split}/*/trial_*/traj_data.json"
         return glob.glob(pattern)
 
+    def test_batch(self, data_dir, split, num_runs=1, **eval_kwargs):
+        """
+        Evaluate every trajectory of a split with repeat indices 0..num_runs-1 on
+        --num_workers processes. Each worker owns a ThorEnv and pulls (traj_file, r_idx)
+        tasks from a shared queue; results go to Manager lists so metrics are aggregated
+        across workers as episodes finish. Extra keyword arguments go to evaluate().
+        """
+        import multiprocessing as mp
+
+        traj_files = sorted(self.get_trajectory_files(data_dir, split))
+        if not traj_files:
+            print(f"No trajectories found in {data_dir}/{split}")
+            return {}
+
+        ctx = mp.get_context('spawn')
+        manager = ctx.Manager()
+        task_queue = manager.Queue()
+        for traj_file in traj_files:
+            for r_idx in range(num_runs):
+                task_queue.put((traj_file, r_idx))
+        lock = manager.Lock()
+        successes = manager.list()
+        failures = manager.list()
+        results = manager.dict()
+
+        num_workers = max(1, getattr(self.args, 'num_workers', 1) or 1)
+        print(f"Batch evaluation: {len(traj_files)} trajectories x {num_runs} runs on {num_workers} worker(s)")
+        t_start = time.time()
+        workers = [ctx.Process(target=type(self).run_batch_worker,
+                               args=(self.args, task_queue, lock, successes, failures, results, eval_kwargs))
+                   for _ in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        successes, failures = list(successes), list(failures)
+        metrics = self.get_metrics(successes, failures)
+        print("\n=== BATCH RESULTS ===")
+        print(f"{len(successes) + len(failures)} episodes in {time.time() - t_start:.1f}s")
+        print(json.dumps(metrics, indent=2))
+
+        # The step trajectories are in the per-episode traces already
+        for entry in successes + failures:
+            entry.pop('trajectory', None)
+        results_file = os.path.join('logs', f"batch_{split}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with open(results_file, 'w') as f:
+            json.dump({'results': metrics, 'successes': successes, 'failures': failures}, f, indent=2)
+        print(f"Saved batch results to {results_file}")
+        manager.shutdown()
+        return metrics
+
+    @classmethod
+    def run_batch_worker(cls, args, task_queue, lock, successes, failures, results, eval_kwargs):
+        """
+        test_batch worker process: one ThorEnv and evaluator, tasks until the queue is empty
+        """
+        import queue
+        import traceback
+
+        env = ThorEnv()
+        evaluator = cls(args)
+        try:
+            while True:
+                try:
+                    traj_file, r_idx = task_queue.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    with open(traj_file, 'r') as f:
+                        traj_data = json.load(f)
+                    if r_idx >= len(traj_data['turk_annotations']['anns']):
+                        print(f"Skipping {traj_file} r{r_idx}: only {len(traj_data['turk_annotations']['anns'])} annotations")
+                        continue
+                    evaluator.prepare_logs(traj_file, r_idx)
+                    evaluator.evaluate(env, r_idx, traj_data, args, lock, successes, failures, results, **eval_kwargs)
+                except Exception as e:
+                    print(f"Error evaluating {traj_file} r{r_idx}: {e}")
+                    traceback.print_exc()
+        finally:
+            env.stop()
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
@@ -464,11 +698,27 @@ if __name__ == "__main__":
     parser.add_argument('--top_p', type=float, default=1.0, help='Top-p for LLM sampling')
     parser.add_argument('--frequency_penalty', type=float, default=0.0, help='Frequency penalty for LLM')
     parser.add_argument('--presence_penalty', type=float, default=0.0, help='Presence penalty for LLM')
+    parser.add_argument('--llm_base_url', type=str, default=None, help='OpenAI-compatible API base URL (default: OpenRouter, or $LLM_BASE_URL)')
+    parser.add_argument('--llm_timeout', type=float, default=None, help='Read timeout in seconds for LLM requests')
+    parser.add_argument('--llm_max_retries', type=int, default=None, help='Retries for transient LLM API errors (429/5xx/timeouts)')
+    parser.add_argument('--llm_rpm', type=int, default=None, help='Requests per minute shared by all evaluation processes on this machine')
+    parser.add_argument('--llm_tpm', type=int, default=None, help='Prompt+completion tokens per minute shared by all evaluation processes on this machine')
+    parser.add_argument('--llm_rate_limit_file', type=str, default=None, help='State file of the shared rate limiter (default: per endpoint in the temp directory)')
+    parser.add_argument('--llm_cache', type=str, default=None, help='SQLite file for the persistent LLM response cache')
+    parser.add_argument('--llm_cache_mode', type=str, default='read_through', choices=['off', 'read_through', 'record', 'replay'], help='LLM cache mode; replay fails on a cache miss')
+    parser.add_argument('--llm_cache_max_mb', type=float, default=512, help='Size limit of the LLM cache before LRU eviction')
+    parser.add_argument('--llm_concurrency', type=int, default=8, help='Max concurrent LLM requests for async planning')
+    parser.add_argument('--stream_plan', action='store_true', help='Stream the plan and execute actions as soon as they are generated')
+    parser.add_argument('--validate_plan', action='store_true', help='Check plan actions against the scene state and record the ones bound to fail')
+    parser.add_argument('--replan_invalid', action='store_true', help='With --validate_plan, re-plan once when the plan has invalid actions')
+    parser.add_argument('--skip_invalid_actions', action='store_true', help='With --validate_plan, do not execute flagged actions (recorded in the trace)')
+    parser.add_argument('--prompt_token_budget', type=int, default=None, help='Token budget for the object list in prompts; objects are ranked by task relevance')
     parser.add_argument('--reward_config', default='models/config/rewards.json')
     parser.add_argument('--batch', action='store_true', help='Run batch evaluation')
     parser.add_argument('--split', type=str, default='valid_seen', help='Data split to evaluate')
     parser.add_argument('--data_dir', type=str, default='data/json_2.1.0', help='Data directory')
     parser.add_argument('--num_runs', type=int, default=5, help='Number of runs per trajectory')
+    parser.add_argument('--num_workers', type=int, default=1, help='Worker processes (one simulator each) for --batch')
     parser.add_argument('ridx', type=int, default=0, nargs='?', help='Repeat index for single trajectory test')
     
 
@@ -10,6 +10,7 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 import gen.constants as constants
+from gen.graph import graph_cache
 from gen.graph.graph_obj import Graph
 from models.eval.eval_llm import EvalLLM
 from models.model.llm_astar import LLMAstar
@@ -24,6 +25,24 @@ class EvalLLMAstar(EvalLLM):
         self.llm_agent.set_log_method(self.log)
         self._graph: Optional[Graph] = None
         self._graph_scene: Optional[int] = None
+        self.graph_stats = {'builds': 0, 'reuses': 0}
+        self._episode_scene: Optional[int] = None
+
+    def setup_scene(self, env, traj_data, r_idx, args, reward_type='dense', inject_danger=False):  # type: ignore[override]
+        super().setup_scene(env, traj_data, r_idx, args, reward_type=reward_type, inject_danger=inject_danger)
+        self._episode_scene = traj_data['scene']['scene_num']
+        # A long-lived evaluator keeps the graph of its last scene; start each episode from clean weights
+        if self._graph is not None and self._graph_scene == traj_data['scene']['scene_num']:
+            self._reset_graph()
+            self.graph_stats['reuses'] += 1
+
+    def trace_extras(self):  # type: ignore[override]
+        extras = super().trace_extras()
+        # The graph's path cache stats are reset by clear() at the start of every episode
+        if self._graph is not None and self._graph_scene == self._episode_scene:
+            extras['navigation'] = dict(self._graph.path_cache_stats(),
+                                        replanner=getattr(self.args, 'nav_replanner', 'astar'))
+        return extras
 
     def execute_action(self, env, action_dict, smooth_nav=False):  # type: ignore[override]
         action_name = action_dict.get('action')
@@ -53,10 +72,15 @@ class EvalLLMAstar(EvalLLM):
         start_pose = self._get_agent_pose(env)
         goal_pose = self._build_goal_pose(nav_point, target_position, start_pose[3])
 
+        # D* Lite repairs its search after add_impossible_spot; A* replans from scratch
+        if getattr(self.args, 'nav_replanner', 'astar') == 'dstar':
+            plan_path = self._graph.get_replanned_path
+        else:
+            plan_path = self._graph.get_shortest_path
         max_iterations = 10
         while max_iterations > 0:
             try:
-                actions, path = self._graph.get_shortest_path(start_pose, goal_pose)
+                actions, path = plan_path(start_pose, goal_pose)
             except Exception as exc:
                 event = env.last_event
                 return False, event, str(exc)
@@ -113,8 +137,14 @@ class EvalLLMAstar(EvalLLM):
         except ValueError:
             return
         if self._graph is None or self._graph_scene != scene_id:
-            self._graph = Graph(use_gt=True, construct_graph=True, scene_id=scene_id)
+            self._graph = graph_cache.get_graph(scene_id, use_gt=True, owner='astar')
             self._graph_scene = scene_id
+            self.graph_stats['builds'] += 1
+
+    def _reset_graph(self):
+        """Undo the weight changes (impossible spots, map updates) of the previous episode"""
+        # clear() restores every changed edge from Graph.updated_weights and the memory grid
+        self._graph.clear()
 
     def _select_navigable_point(self, reachable, target_position):
         if not reachable:
@@ -214,9 +244,10 @@ class EvalLLMAstar(EvalLLM):
         return int(np.round(value / constants.AGENT_STEP_SIZE))
 
 
-if __name__ == "__main__":
+def build_parser():
+    """Command-line options of eval_llm_astar; also used to configure pooled workers"""
     import argparse
-    
+
     parser = argparse.ArgumentParser()
     parser.add_argument('--traj_file', type=str, default=None)
     parser.add_argument('--max_steps', type=int, default=50)
@@ -230,11 +261,29 @@ if __name__ == "__main__":
     parser.add_argument('--top_p', type=float, default=1.0, help='Top-p for LLM sampling')
     parser.add_argument('--frequency_penalty', type=float, default=0.0, help='Frequency penalty for LLM')
     parser.add_argument('--presence_penalty', type=float, default=0.0, help='Presence penalty for LLM')
+    parser.add_argument('--llm_base_url', type=str, default=None, help='OpenAI-compatible API base URL (default: OpenRouter, or $LLM_BASE_URL)')
+    parser.add_argument('--llm_timeout', type=float, default=None, help='Read timeout in seconds for LLM requests')
+    parser.add_argument('--llm_max_retries', type=int, default=None, help='Retries for transient LLM API errors (429/5xx/timeouts)')
+    parser.add_argument('--llm_rpm', type=int, default=None, help='Requests per minute shared by all evaluation processes on this machine')
+    parser.add_argument('--llm_tpm', type=int, default=None, help='Prompt+completion tokens per minute shared by all evaluation processes on this machine')
+    parser.add_argument('--llm_rate_limit_file', type=str, default=None, help='State file of the shared rate limiter (default: per endpoint in the temp directory)')
+    parser.add_argument('--llm_cache', type=str, default=None, help='SQLite file for the persistent LLM response cache')
+    parser.add_argument('--llm_cache_mode', type=str, default='read_through', choices=['off', 'read_through', 'record', 'replay'], help='LLM cache mode; replay fails on a cache miss')
+    parser.add_argument('--llm_cache_max_mb', type=float, default=512, help='Size limit of the LLM cache before LRU eviction')
+    parser.add_argument('--llm_concurrency', type=int, default=8, help='Max concurrent LLM requests for async planning')
+    parser.add_argument('--stream_plan', action='store_true', help='Stream the plan and execute actions as soon as they are generated')
+    parser.add_argument('--validate_plan', action='store_true', help='Check plan actions against the scene state and record the ones bound to fail')
+    parser.add_argument('--replan_invalid', action='store_true', help='With --validate_plan, re-plan once when the plan has invalid actions')
+    parser.add_argument('--skip_invalid_actions', action='store_true', help='With --validate_plan, do not execute flagged actions (recorded in the trace)')
+    parser.add_argument('--prompt_token_budget', type=int, default=None, help='Token budget for the object list in prompts; objects are ranked by task relevance')
+    parser.add_argument('--nav_replanner', type=str, default='astar', choices=['astar', 'dstar'], help='GotoLocation replanning after blocked moves: full A* or incremental D* Lite')
     parser.add_argument('--ridx', type=int, default=0, nargs='?', help='Repeat index for single trajectory test')
     parser.add_argument('--setup_debug', action='store_true', help='Log only setup issues for debugging scene restoration')
+    return parser
 
-    
-    args = parser.parse_args()
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
 
     evaluator = EvalLLMAstar(args)
     evaluator.test_single_trajectory(args.traj_file, goto=True, r_idx=args.ridx, inject_danger=True)
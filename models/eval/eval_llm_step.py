@@ -24,9 +24,24 @@ class EvalLLMStepwise(EvalLLM):
         self.llm_agent.set_log_method(self.log)
         
         # Update log file name to distinguish from regular eval
-        timestamp = self.log_file.split('_')[-1]  # Extract timestamp
-        self.log_file = f"logs/llm_step_eval_{timestamp}"
-        print(f"Stepwise logging to: {self.log_file}")
+        if self.log_file:
+            timestamp = self.log_file.split('_')[-1]  # Extract timestamp
+            self.log_file = f"logs/llm_step_eval_{timestamp}"
+            print(f"Stepwise logging to: {self.log_file}")
+
+    def get_scene_info(self, env, traj_data):
+        """
+        Current scene state in the form expected by the stepwise prompts
+        """
+        scene_info = self.remove_useless_info(env.last_event.metadata)
+        inventory = scene_info.get('inventoryObjects') or []
+        held_ids = {item['objectId'] for item in inventory}
+        held = [obj for obj in scene_info['objects'] if obj['objectId'] in held_ids]
+        scene_info['agent_position'] = scene_info['agent']['position']
+        scene_info['agent_rotation'] = scene_info['agent']['rotation']
+        scene_info['scene_num'] = traj_data['scene']['scene_num']
+        scene_info['agent_held_object'] = held[0] if held else (inventory[0] if inventory else None)
+        return scene_info
 
     def evaluate(self, env, r_idx, traj_data, args, lock, successes, failures, results):
         """
@@ -141,8 +156,11 @@ class EvalLLMStepwise(EvalLLM):
         plw_s_spl = s_spl * path_len_weight
         plw_pc_spl = pc_spl * path_len_weight
 
+        # Per-step prompt size and LLM latency, to compare full and delta prompts
+        prompt_stats = self.llm_agent.step_prompt_stats()
+        self.log(f"Prompt stats ({'delta' if getattr(args, 'delta_prompts', False) else 'full'}): {prompt_stats}")
+
         # Log results (same structure as parent)
-        lock.acquire()
         log_entry = {
             'trial': traj_data['task_id'],
             'type': traj_data['task_type'],
@@ -158,30 +176,34 @@ class EvalLLMStepwise(EvalLLM):
             'path_len_weight': int(path_len_weight),
             'reward': float(reward),
             'executed_actions': t,
-            'stepwise_mode': True  # Mark as stepwise evaluation
+            'stepwise_mode': True,  # Mark as stepwise evaluation
+            'delta_prompts': bool(getattr(args, 'delta_prompts', False)),
+            'mean_prompt_tokens': float(prompt_stats['mean_prompt_tokens']),
+            'mean_step_tokens': float(prompt_stats['mean_step_tokens']),
+            'mean_step_latency': float(prompt_stats['mean_latency']),
         }
                      
-        if success:
-            successes.append(log_entry)
-        else:
-            failures.append(log_entry)
-
-        # Overall results (inherited method)
-        results['all'] = self.get_metrics(successes, failures)
-
-        if results.get('all'):
-            print("-------------")
-            print("SR: %d/%d = %.3f" % (results['all']['success']['num_successes'],
-                                        results['all']['success']['num_evals'],
-                                        results['all']['success']['success_rate']))
-            print("GC: %d/%d = %.3f" % (results['all']['goal_condition_success']['completed_goal_conditions'],
-                                        results['all']['goal_condition_success']['total_goal_conditions'],
-                                        results['all']['goal_condition_success']['goal_condition_success_rate']))
-            print("PLW SR: %.3f" % (results['all']['path_length_weighted_success_rate']))
-            print("PLW GC: %.3f" % (results['all']['path_length_weighted_goal_condition_success_rate']))
-            print("-------------")
-
-        lock.release()
+        lock.acquire()
+        try:
+            if success:
+                successes.append(log_entry)
+            else:
+                failures.append(log_entry)
+
+            # Overall results (inherited method)
+            results['all'] = self.get_metrics(successes, failures)
+
+            if results.get('all'):
+                print("-------------")
+                print("SR: %d/%d = %.3f" % (results['all']['success']['num_successes'],
+                                            results['all']['success']['num_evals'],
+                                            results['all']['success']['success_rate']))
+                print("GC: %d/%d = %.3f" % (results['all']['goal_condition_success']['completed_goal_conditions'],
+                                            results['all']['goal_condition_success']['total_goal_conditions'],
+                                            results['all']['goal_condition_success']['goal_condition_success_rate']))
+                print("-------------")
+        finally:
+            lock.release()
 
 if __name__ == "__main__":
     import argparse
@@ -197,11 +219,22 @@ if __name__ == "__main__":
     parser.add_argument('--top_p', type=float, default=1.0, help='Top-p for LLM sampling')
     parser.add_argument('--frequency_penalty', type=float, default=0.0, help='Frequency penalty for LLM')
     parser.add_argument('--presence_penalty', type=float, default=0.0, help='Presence penalty for LLM')
+    parser.add_argument('--llm_base_url', type=str, default=None, help='OpenAI-compatible API base URL (default: OpenRouter, or $LLM_BASE_URL)')
+    parser.add_argument('--llm_timeout', type=float, default=None, help='Read timeout in seconds for LLM requests')
+    parser.add_argument('--llm_max_retries', type=int, default=None, help='Retries for transient LLM API errors (429/5xx/timeouts)')
+    parser.add_argument('--llm_rpm', type=int, default=None, help='Requests per minute shared by all evaluation processes on this machine')
+    parser.add_argument('--llm_tpm', type=int, default=None, help='Prompt+completion tokens per minute shared by all evaluation processes on this machine')
+    parser.add_argument('--llm_rate_limit_file', type=str, default=None, help='State file of the shared rate limiter (default: per endpoint in the temp directory)')
+    parser.add_argument('--llm_cache', type=str, default=None, help='SQLite file for the persistent LLM response cache')
+    parser.add_argument('--llm_cache_mode', type=str, default='read_through', choices=['off', 'read_through', 'record', 'replay'], help='LLM cache mode; replay fails on a cache miss')
+    parser.add_argument('--llm_cache_max_mb', type=float, default=512, help='Size limit of the LLM cache before LRU eviction')
+    parser.add_argument('--delta_prompts', action='store_true', help='Send the full scene once and only changed objects and agent state on later steps')
     parser.add_argument('--reward_config', default='models/config/rewards.json')
     parser.add_argument('--batch', action='store_true', help='Run batch evaluation')
     parser.add_argument('--split', type=str, default='valid_seen', help='Data split to evaluate')
     parser.add_argument('--data_dir', type=str, default='data/json_2.1.0', help='Data directory')
     parser.add_argument('--num_runs', type=int, default=5, help='Number of runs per trajectory')
+    parser.add_argument('--num_workers', type=int, default=1, help='Worker processes (one simulator each) for --batch')
     
 
     args = parser.parse_args()
@@ -0,0 +1,378 @@
+import os
+import sys
+import argparse
+import asyncio
+import atexit
+import glob
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Add project root to Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, project_root)
+
+from models.eval.eval_llm import EvalLLM, EpisodeTrace
+from models.eval.jobs import EvalJob, make_evaluator, run_job
+from models.model.llm import LLMAgent
+from models.model.llm_cache import cache_key
+from models.utils.episode_index import is_trace_file
+
+
+class PlanStore:
+    """
+    Plans and post-setup scene snapshots stored next to the traces of each trajectory:
+    logs/trajectories/<model>/<split>/<task>/<trial>/plan_r<ridx>.json and scene_r<ridx>.json.
+    Both are written atomically so an interrupted phase can simply be re-run.
+    """
+
+    def __init__(self, llm_model):
+        self.llm_model = llm_model
+
+    def episode_dir(self, traj_file):
+        return EvalLLM.trajectory_log_dir(traj_file, self.llm_model)
+
+    def plan_path(self, traj_file, ridx):
+        return os.path.join(self.episode_dir(traj_file), f"plan_r{ridx}.json")
+
+    def scene_path(self, traj_file, ridx):
+        return os.path.join(self.episode_dir(traj_file), f"scene_r{ridx}.json")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(path, payload):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def load_plan(self, traj_file, ridx):
+        return self._read(self.plan_path(traj_file, ridx))
+
+    def save_plan(self, traj_file, ridx, payload):
+        self._write(self.plan_path(traj_file, ridx), payload)
+
+    def load_scene(self, traj_file, ridx):
+        return self._read(self.scene_path(traj_file, ridx))
+
+    def save_scene(self, traj_file, ridx, scene_info):
+        self._write(self.scene_path(traj_file, ridx), scene_info)
+
+    def is_executed(self, traj_file, ridx):
+        """An episode counts as executed once a trace newer than its stored plan exists"""
+        plan_path = self.plan_path(traj_file, ridx)
+        if not os.path.exists(plan_path):
+            return False
+        plan_mtime = os.path.getmtime(plan_path)
+        directory = self.episode_dir(traj_file)
+        for name in os.listdir(directory):
+            if name.startswith(f"r{ridx}_") and is_trace_file(name):
+                if os.path.getmtime(os.path.join(directory, name)) >= plan_mtime:
+                    return True
+        return False
+
+
+# ----------------------------------------------------------------------
+# Simulator workers (one ThorEnv per process)
+# ----------------------------------------------------------------------
+_WORKER = {}
+
+
+def _init_worker(args):
+    from env.thor_env import ThorEnv
+    env = ThorEnv()
+    atexit.register(env.stop)
+    _WORKER['env'] = env
+    _WORKER['evaluator'] = make_evaluator(args)
+
+
+def _load_traj(traj_file):
+    with open(traj_file, 'r') as f:
+        return json.load(f)
+
+
+def _snapshot_scene(traj_file, ridx, args):
+    """Set up the trajectory's scene and return the post-setup scene_info"""
+    env, evaluator = _WORKER['env'], _WORKER['evaluator']
+    traj_data = _load_traj(traj_file)
+    evaluator.setup_scene(env, traj_data, ridx, args, reward_type='dense', inject_danger=args.inject_danger)
+    return EpisodeTrace._sanitize(evaluator.remove_useless_info(env.last_event.metadata))
+
+
+def _execute_episode(traj_file, ridx, plan, args):
+    """Replay a stored plan in this worker's simulator; returns the episode's log entry"""
+    return run_job(_WORKER['evaluator'], _WORKER['env'], EvalJob(traj_file, ridx, plan=plan), args)
+
+
+# ----------------------------------------------------------------------
+# Phases
+# ----------------------------------------------------------------------
+class TwoPhaseEval:
+    """
+    Phase 1 (plan): set up every trajectory once on a pool of simulators, snapshot the
+    post-setup scene and issue all subgoal/plan requests concurrently while the simulators
+    keep setting up further scenes. Phase 2 (execute): replay the stored plans through a
+    pool of simulators without waiting on the LLM. Each phase skips finished episodes.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.store = PlanStore(args.llm_model)
+        self.goto = args.evaluator == 'astar'
+
+    def episodes(self):
+        traj_files = list(self.args.traj_file or [])
+        if not traj_files:
+            pattern = os.path.join(self.args.data_dir, self.args.split, f"*{self.args.pattern}*", "trial_*", "traj_data.json")
+            traj_files = sorted(glob.glob(pattern))
+        return [(traj_file, ridx) for traj_file in traj_files for ridx in self.args.ridx]
+
+    def _executor(self):
+        return ProcessPoolExecutor(max_workers=max(1, self.args.num_sims),
+                                   initializer=_init_worker, initargs=(self.args,))
+
+    # Phase 1 ------------------------------------------------------------
+    def run_planning(self):
+        todo = [(traj_file, ridx) for traj_file, ridx in self.episodes()
+                if self.store.load_plan(traj_file, ridx) is None]
+        print(f"[plan] {len(todo)} episode(s) to plan")
+        if not todo:
+            return 0
+        return asyncio.run(self._plan_all(todo))
+
+    async def _plan_all(self, todo):
+        agent = LLMAgent(self.args)
+        engine = agent.get_async_engine()
+        loop = asyncio.get_running_loop()
+        t_start = time.time()
+        executor = None
+        snapshots = {}
+        try:
+            for traj_file, ridx in todo:
+                scene_info = self.store.load_scene(traj_file, ridx)
+                if scene_info is not None:
+                    snapshot = loop.create_future()
+                    snapshot.set_result(scene_info)
+                else:
+                    if executor is None:
+                        executor = self._executor()
+                    snapshot = asyncio.wrap_future(executor.submit(_snapshot_scene, traj_file, ridx, self.args))
+                snapshots[(traj_file, ridx)] = snapshot
+            if self.args.plan_reuse:
+                # Repeats of a trajectory share its scene, so only they can have identical inputs
+                by_traj = {}
+                for traj_file, ridx in todo:
+                    by_traj.setdefault(traj_file, []).append(ridx)
+                tasks = [asyncio.create_task(self._plan_shared(traj_file, ridxs, snapshots, engine))
+                         for traj_file, ridxs in by_traj.items()]
+            else:
+                tasks = [asyncio.create_task(self._plan_episode(traj_file, ridx, snapshots[(traj_file, ridx)], engine))
+                         for traj_file, ridx in todo]
+            done = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        failures = 0
+        for outcome in done:
+            if isinstance(outcome, BaseException):
+                failures += 1
+                print(f"[plan] ✗ {outcome}")
+            elif outcome:
+                # _plan_shared already reported the members it could not plan
+                failures += outcome
+        print(f"[plan] planned {len(todo)} episode(s) with {failures} failure(s) in {time.time() - t_start:.1f}s "
+              f"(peak {engine.peak_in_flight} concurrent LLM requests, {engine.completed} requests)")
+        return failures
+
+    def _episode_agent(self, goal_instr, traj_data):
+        # One agent per episode: the task context used for prompt ranking is per episode
+        agent = LLMAgent(self.args)
+        agent.set_task_context(goal_instr, traj_data.get('pddl_params'))
+        telemetry = []
+        agent.set_telemetry_sink(telemetry.append)
+        return agent, telemetry
+
+    def _plan_record(self, traj_file, ridx, goal_instr, subgoals, plan, telemetry, reuse=None):
+        record = {
+            'traj_file': traj_file,
+            'ridx': ridx,
+            'task_desc': goal_instr,
+            'goto': self.goto,
+            'llm_model': self.args.llm_model,
+            'temperature': getattr(self.args, 'temperature', None),
+            'created': datetime.now().isoformat(),
+            'subgoals': subgoals,
+            'plan': plan,
+            'llm_calls': telemetry,
+        }
+        if reuse is not None:
+            record['reuse'] = reuse
+        self.store.save_plan(traj_file, ridx, record)
+        print(f"[plan] ✓ {traj_file} r{ridx}: {len(plan)} actions")
+
+    async def _plan_episode(self, traj_file, ridx, snapshot, engine):
+        scene_info = await snapshot
+        self.store.save_scene(traj_file, ridx, scene_info)
+        traj_data = _load_traj(traj_file)
+        goal_instr = EvalLLM.goal_instruction(traj_data, ridx)
+
+        agent, telemetry = self._episode_agent(goal_instr, traj_data)
+        subgoals = await agent.aget_subgoals_from_scene(goal_instr, scene_info, engine=engine)
+        plan = await agent.agenerate_plan(subgoals, scene_info, goto=self.goto, engine=engine)
+        self._plan_record(traj_file, ridx, goal_instr, subgoals, plan, telemetry)
+
+    async def _plan_shared(self, traj_file, ridxs, snapshots, engine):
+        """
+        Plan the repeats of one trajectory, querying each distinct planning input once.
+        Repeats whose subgoal request (model, sampling parameters and prompts) is identical
+        form a group. With temperature 0 the group's single result is fanned out to every
+        member; otherwise one request asks for one sample per member ("n"). A member whose
+        subgoal sample is missing or unusable fails alone; returns the number of such members.
+        """
+        traj_data = _load_traj(traj_file)
+        groups = {}
+        for ridx in ridxs:
+            scene_info = await snapshots[(traj_file, ridx)]
+            self.store.save_scene(traj_file, ridx, scene_info)
+            goal_instr = EvalLLM.goal_instruction(traj_data, ridx)
+            agent, telemetry = self._episode_agent(goal_instr, traj_data)
+            system_prompt, user_prompt = agent.build_subgoal_prompt(goal_instr, scene_info)
+            key = cache_key(agent.build_request(system_prompt, user_prompt))
+            group = groups.setdefault(key, {'members': [], 'agent': agent, 'telemetry': telemetry,
+                                            'goal_instr': goal_instr, 'scene_info': scene_info,
+                                            'prompts': (system_prompt, user_prompt)})
+            group['members'].append(ridx)
+
+        deterministic = not getattr(self.args, 'temperature', 0.6)
+        failed = 0
+        for key, group in groups.items():
+            members, agent = group['members'], group['agent']
+            scene_info, goal_instr = group['scene_info'], group['goal_instr']
+            samples = 1 if deterministic else len(members)
+            subgoal_texts = await engine.query_samples(agent, *group['prompts'], samples)
+
+            # Identical subgoal samples lead to identical plan prompts; sample those together too
+            plan_groups = {}
+            for sample, subgoals in enumerate(subgoal_texts):
+                plan_groups.setdefault(subgoals, []).append(sample)
+            plans = {}
+            errors = {}
+            for subgoals, sample_ids in plan_groups.items():
+                try:
+                    system_prompt, user_prompt = agent.build_plan_prompt(subgoals, scene_info, goto=self.goto)
+                except ValueError as e:
+                    errors.update((sample, e) for sample in sample_ids)
+                    continue
+                plan_texts = await engine.query_samples(agent, system_prompt, user_prompt, len(sample_ids))
+                for sample, plan_text in zip(sample_ids, plan_texts):
+                    plans[sample] = (subgoals, agent.finish_plan(plan_text))
+
+            telemetry = group['telemetry']
+            for position, ridx in enumerate(members):
+                sample = 0 if deterministic else position
+                if sample in errors:
+                    failed += 1
+                    print(f"[plan] ✗ {traj_file} r{ridx}: {errors[sample]}")
+                    continue
+                subgoals, plan = plans[sample]
+                # Calls are attributed to the first planned member only, so totals are not double counted
+                self._plan_record(traj_file, ridx, goal_instr, subgoals, plan, telemetry,
+                                  reuse={'key': key[:16], 'group': members, 'sample': sample,
+                                         'fanned_out': deterministic and len(members) > 1})
+                telemetry = []
+        return failed
+
+    # Phase 2 ------------------------------------------------------------
+    def run_execution(self):
+        todo = []
+        for traj_file, ridx in self.episodes():
+            plan = self.store.load_plan(traj_file, ridx)
+            if plan is None:
+                print(f"[execute] no stored plan for {traj_file} r{ridx}; run the plan phase first")
+            elif not self.store.is_executed(traj_file, ridx):
+                todo.append((traj_file, ridx, plan))
+        print(f"[execute] {len(todo)} episode(s) to execute on {max(1, self.args.num_sims)} simulator(s)")
+        if not todo:
+            return 0
+
+        t_start = time.time()
+        entries, failures = [], 0
+        with self._executor() as executor:
+            futures = {executor.submit(_execute_episode, traj_file, ridx, plan, self.args): (traj_file, ridx)
+                       for traj_file, ridx, plan in todo}
+            for future, (traj_file, ridx) in futures.items():
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    failures += 1
+                    print(f"[execute] ✗ {traj_file} r{ridx}: {e}")
+                    continue
+                if entry is not None:
+                    entries.append(entry)
+        elapsed = time.time() - t_start
+        successes = [entry for entry in entries if entry['success']]
+        print(f"[execute] {len(entries)} episode(s) in {elapsed:.1f}s "
+              f"({len(entries) / elapsed * 3600 if elapsed else 0.0:.0f} episodes/hour), "
+              f"SR {len(successes)}/{len(entries)}")
+        metrics = EvalLLM.get_metrics(successes, [entry for entry in entries if not entry['success']])
+        if metrics:
+            print(json.dumps(metrics, indent=2))
+        return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Two-phase evaluation: plan all episodes first, then execute the stored plans')
+    parser.add_argument('--phase', choices=['plan', 'execute', 'all'], default='all')
+    parser.add_argument('--evaluator', choices=['llm', 'astar'], default='astar', help='astar uses GotoLocation plans and danger injection like eval_llm_astar')
+    parser.add_argument('--traj_file', type=str, action='append', default=None, help='Trajectory JSON file (repeatable); defaults to all matching --pattern')
+    parser.add_argument('--data_dir', type=str, default='data/json_2.1.0', help='Data directory')
+    parser.add_argument('--split', type=str, default='train', help='Data split to evaluate')
+    parser.add_argument('--pattern', type=str, default='', help='Substring filter on task directory names')
+    parser.add_argument('--ridx', type=int, nargs='*', default=[0], help='Repeat indices to evaluate')
+    parser.add_argument('--num_sims', type=int, default=1, help='Simulator processes for scene setup and execution')
+    parser.add_argument('--no_inject_danger', dest='inject_danger', action='store_false', help='Do not fill containers with liquid during setup')
+    parser.add_argument('--max_steps', type=int, default=50, help='Maximum steps per episode')
+    parser.add_argument('--max_fails', type=int, default=5, help='Maximum consecutive action fails before aborting')
+    parser.add_argument('--smooth_nav', action='store_true', help='Use smooth navigation')
+    parser.add_argument('--debug', action='store_true', help='Enable debug prints')
+    parser.add_argument('--reward_config', default='models/config/rewards.json')
+    parser.add_argument('--llm_model', type=str, default='deepseek/deepseek-chat', help='LLM model to use')
+    parser.add_argument('--max_tokens', type=int, default=10000, help='Max tokens for LLM response')
+    parser.add_argument('--temperature', type=float, default=0.6, help='Temperature for LLM sampling')
+    parser.add_argument('--top_p', type=float, default=1.0, help='Top-p for LLM sampling')
+    parser.add_argument('--frequency_penalty', type=float, default=0.0, help='Frequency penalty for LLM')
+    parser.add_argument('--presence_penalty', type=float, default=0.0, help='Presence penalty for LLM')
+    parser.add_argument('--llm_base_url', type=str, default=None, help='OpenAI-compatible API base URL (default: OpenRouter, or $LLM_BASE_URL)')
+    parser.add_argument('--llm_timeout', type=float, default=None, help='Read timeout in seconds for LLM requests')
+    parser.add_argument('--llm_max_retries', type=int, default=None, help='Retries for transient LLM API errors (429/5xx/timeouts)')
+    parser.add_argument('--llm_rpm', type=int, default=None, help='Requests per minute shared by all evaluation processes on this machine')
+    parser.add_argument('--llm_tpm', type=int, default=None, help='Prompt+completion tokens per minute shared by all evaluation processes on this machine')
+    parser.add_argument('--llm_rate_limit_file', type=str, default=None, help='State file of the shared rate limiter (default: per endpoint in the temp directory)')
+    parser.add_argument('--llm_cache', type=str, default=None, help='SQLite file for the persistent LLM response cache')
+    parser.add_argument('--llm_cache_mode', type=str, default='read_through', choices=['off', 'read_through', 'record', 'replay'], help='LLM cache mode; replay fails on a cache miss')
+    parser.add_argument('--llm_cache_max_mb', type=float, default=512, help='Size limit of the LLM cache before LRU eviction')
+    parser.add_argument('--plan_reuse', action='store_true', help='Query identical planning inputs across repeat indices once (fan out at temperature 0, n samples otherwise)')
+    parser.add_argument('--llm_concurrency', type=int, default=8, help='Max concurrent LLM requests during planning')
+    parser.add_argument('--validate_plan', action='store_true', help='Check plan actions against the scene state and record the ones bound to fail')
+    parser.add_argument('--skip_invalid_actions', action='store_true', help='With --validate_plan, do not execute flagged actions (recorded in the trace)')
+    parser.add_argument('--prompt_token_budget', type=int, default=None, help='Token budget for the object list in prompts; objects are ranked by task relevance')
+    parser.add_argument('--setup_debug', action='store_true', help='Log only setup issues for debugging scene restoration')
+
+    args = parser.parse_args()
+
+    pipeline = TwoPhaseEval(args)
+    failed = 0
+    if args.phase in ('plan', 'all'):
+        failed += pipeline.run_planning()
+    if args.phase in ('execute', 'all'):
+        failed += pipeline.run_execution()
+    sys.exit(1 if failed else 0)
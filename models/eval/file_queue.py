@@ -0,0 +1,250 @@
+import os
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+
+QUEUE_STATES = ('pending', 'claimed', 'done', 'failed')
+
+logger = logging.getLogger(__name__)
+
+
+def job_name(traj_file, ridx):
+    """File name of a (trajectory, ridx) job: the path below data/ with '/' replaced"""
+    path = str(traj_file).replace('\\', '/')
+    if 'json_2.1.0/' in path:
+        path = path.split('json_2.1.0/', 1)[1]
+    path = path.replace('/traj_data.json', '').strip('/').replace('/', '__')
+    return f"{path}__r{ridx}.json"
+
+
+class FileWorkQueue:
+    """
+    Work queue in a directory on a shared filesystem, for evaluation across nodes.
+
+    Jobs are JSON files in pending/, claimed/, done/ and failed/. A node claims a job by
+    renaming it from pending/ to claimed/; rename is atomic, so exactly one node wins.
+    The claimed file's mtime is the claim's heartbeat: the owner touches it while the job
+    runs, and any node moves claims whose heartbeat is older than `lease` seconds back to
+    pending/ (or to failed/ after `max_attempts`). No central service is involved.
+    """
+
+    def __init__(self, root, lease=300.0, max_attempts=2, node=None):
+        self.root = root
+        self.lease = lease
+        self.max_attempts = max(1, max_attempts)
+        self.node = node or f"{socket.gethostname()}:{os.getpid()}"
+        for state in QUEUE_STATES:
+            os.makedirs(self._dir(state), exist_ok=True)
+
+    def _dir(self, state):
+        return os.path.join(self.root, state)
+
+    def _path(self, state, name):
+        return os.path.join(self.root, state, name)
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, path, job):
+        # Temporary names start with '.', which list_jobs ignores
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def list_jobs(self, state):
+        return sorted(name for name in os.listdir(self._dir(state))
+                      if name.endswith('.json') and not name.startswith('.'))
+
+    def enqueue(self, traj_file, ridx, **extra):
+        """Add a job unless it is already known in any state; returns whether it was added"""
+        name = job_name(traj_file, ridx)
+        if any(os.path.exists(self._path(state, name)) for state in QUEUE_STATES):
+            return False
+        job = dict(extra, traj_file=str(traj_file), ridx=ridx, attempts=0, history=[])
+        tmp_path = self._path('pending', f".{name}.{uuid.uuid4().hex}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, indent=1)
+        try:
+            # link() fails if another node enqueued the same job meanwhile
+            os.link(tmp_path, self._path('pending', name))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.unlink(tmp_path)
+
+    def claim(self):
+        """
+        Claim the next pending job; returns (name, job) or None when nothing is pending.
+        Stale claims of dead nodes are reclaimed first.
+        """
+        self.reclaim_stale()
+        for name in self.list_jobs('pending'):
+            claimed_path = self._path('claimed', name)
+            try:
+                # Fresh mtime first: rename keeps it, and an old one would look like a stale claim
+                os.utime(self._path('pending', name))
+                os.rename(self._path('pending', name), claimed_path)
+            except FileNotFoundError:
+                continue  # another node was faster
+            job = self._read(claimed_path)
+            job['attempts'] += 1
+            job.update(owner=self.node, claim_id=uuid.uuid4().hex, claimed_at=time.time())
+            self._write(claimed_path, job)
+            return name, job
+        return None
+
+    def owns(self, name, job):
+        """Whether our claim on `name` still stands (it may have been reclaimed as stale)"""
+        # Another node's _finish may hold the claim under a private name for a moment
+        finishing = [entry for entry in os.listdir(self._dir('claimed')) if entry.startswith(f".{name}.finish.")]
+        for path in [self._path('claimed', name)] + [self._path('claimed', entry) for entry in finishing]:
+            try:
+                return self._read(path).get('claim_id') == job.get('claim_id')
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError):
+                return False
+        return False
+
+    def heartbeat(self, name):
+        try:
+            os.utime(self._path('claimed', name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, name, job, **result):
+        """Move a claimed job to done/"""
+        self._finish(name, job, 'done', result)
+
+    def fail(self, name, job, error):
+        """Record a failed attempt; the job goes back to pending/ unless max_attempts is reached"""
+        state = 'pending' if job['attempts'] < self.max_attempts else 'failed'
+        self._finish(name, job, state, {'error': str(error)})
+        return state == 'pending'
+
+    def _finish(self, name, job, state, result):
+        claimed_path = self._path('claimed', name)
+        if not self.owns(name, job):
+            # Reclaimed while we were running; the job belongs to another attempt now
+            logger.warning("claim on %s was lost, not recording result", name)
+            return
+        finishing_path = self._path('claimed', f".{name}.finish.{uuid.uuid4().hex}")
+        try:
+            # Rename first, as reclaim_stale does: once the claim has a private name no other
+            # node can reclaim it, so the ownership check below cannot be overtaken
+            os.rename(claimed_path, finishing_path)
+        except FileNotFoundError:
+            logger.warning("claim on %s was lost, not recording result", name)
+            return
+        try:
+            current = self._read(finishing_path)
+        except (OSError, ValueError):
+            current = {}
+        if current.get('claim_id') != job.get('claim_id'):
+            # Reclaimed and claimed again by another node in between: hand its claim back
+            os.rename(finishing_path, claimed_path)
+            logger.warning("claim on %s was lost, not recording result", name)
+            return
+        job = dict(job)
+        job['history'] = job.get('history', []) + [dict(result, node=self.node, state=state,
+                                                        seconds=time.time() - job['claimed_at'])]
+        job.update(result)
+        self._write(finishing_path, job)
+        os.rename(finishing_path, self._path(state, name))
+
+    def reclaim_stale(self):
+        """Return claims whose heartbeat is older than the lease to pending/ (or failed/)"""
+        now = time.time()
+        reclaimed = 0
+        for name in self.list_jobs('claimed'):
+            path = self._path('claimed', name)
+            try:
+                if now - os.path.getmtime(path) < self.lease:
+                    continue
+                job = self._read(path)
+            except (OSError, ValueError):
+                continue
+            state = 'pending' if job.get('attempts', 0) < self.max_attempts else 'failed'
+            stale_path = self._path('claimed', f".{name}.stale.{uuid.uuid4().hex}")
+            try:
+                # Rename first so only one node reclaims the job
+                os.rename(path, stale_path)
+            except FileNotFoundError:
+                continue
+            job['history'] = job.get('history', []) + [{'node': job.get('owner'), 'state': 'reclaimed',
+                                                        'reclaimed_by': self.node, 'at': now}]
+            job.pop('claim_id', None)
+            self._write(stale_path, job)
+            os.rename(stale_path, self._path(state, name))
+            reclaimed += 1
+            logger.warning("reclaimed stale job %s from %s -> %s", name, job.get('owner'), state)
+        return reclaimed
+
+    def counts(self):
+        return {state: len(self.list_jobs(state)) for state in QUEUE_STATES}
+
+    def is_drained(self):
+        counts = self.counts()
+        return counts['pending'] == 0 and counts['claimed'] == 0
+
+
+class Heartbeat:
+    """
+    Context manager that keeps a claim alive from a background thread.
+    A missed heartbeat is retried on the next interval; the thread only stops once the
+    claim is really gone, not while another node briefly holds it in _finish.
+    """
+
+    def __init__(self, queue, name, job, interval=None):
+        self.queue = queue
+        self.name = name
+        self.job = job
+        self.interval = interval or max(1.0, queue.lease / 4)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.queue.heartbeat(self.name) and not self.queue.owns(self.name, self.job):
+                break
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect or maintain a file work queue')
+    parser.add_argument('queue_dir', type=str)
+    parser.add_argument('command', choices=['status', 'reclaim', 'retry_failed'], nargs='?', default='status')
+    parser.add_argument('--lease', type=float, default=300.0, help='Seconds without heartbeat before a claim is stale')
+    parser.add_argument('--max_attempts', type=int, default=2)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[queue] %(message)s')
+
+    work_queue = FileWorkQueue(args.queue_dir, lease=args.lease, max_attempts=args.max_attempts)
+    if args.command == 'reclaim':
+        print(f"Reclaimed {work_queue.reclaim_stale()} job(s)")
+    elif args.command == 'retry_failed':
+        for name in work_queue.list_jobs('failed'):
+            job = work_queue._read(work_queue._path('failed', name))
+            job['attempts'] = 0
+            work_queue._write(work_queue._path('failed', name), job)
+            os.rename(work_queue._path('failed', name), work_queue._path('pending', name))
+        print("Moved failed jobs back to pending")
+    print(json.dumps(work_queue.counts()))
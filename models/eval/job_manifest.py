@@ -0,0 +1,118 @@
+import os
+import json
+import threading
+import time
+
+from models.utils.episode_index import find_complete_trace
+
+JOB_STATES = ('pending', 'running', 'done', 'failed')
+
+
+class JobManifest:
+    """
+    Persistent record of batch evaluation jobs, keyed on (model, trajectory, ridx).
+
+    Each job has a state (pending/running/done/failed), its attempts, the duration of its
+    last attempt, the last error and the trace it produced. Every state change rewrites
+    the manifest through a temporary file and os.replace, so a crash leaves either the old
+    or the new manifest. Jobs still marked running when a manifest is loaded were
+    interrupted and go back to pending.
+    """
+
+    def __init__(self, path, model, max_attempts=2):
+        self.path = path
+        self.model = model
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.RLock()
+        self.jobs = {}
+        self.started = time.time()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.jobs = json.load(f).get('jobs', {})
+            for job in self.jobs.values():
+                if job['state'] == 'running':
+                    job['state'] = 'pending'
+
+    def key(self, traj_file, ridx):
+        return f"{self.model}|{traj_file}|r{ridx}"
+
+    def save(self):
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp{os.getpid()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'model': self.model, 'updated': time.time(), 'jobs': self.jobs}, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def register(self, traj_file, ridx):
+        """
+        Add a job (or refresh an existing one) and return whether it still has to run.
+        A job is skipped when a complete trace exists or it has failed max_attempts times.
+        """
+        with self._lock:
+            key = self.key(traj_file, ridx)
+            job = self.jobs.setdefault(key, {
+                'traj_file': str(traj_file), 'ridx': ridx, 'model': self.model, 'state': 'pending',
+                'attempts': 0, 'duration': None, 'error': None, 'trace': None,
+            })
+            trace = find_complete_trace(str(traj_file), ridx, self.model)
+            if trace is not None:
+                if job['state'] != 'done':
+                    job.update(state='done', trace=trace, error=None)
+                return False
+            if job['state'] == 'done':
+                # The trace was deleted since; run again
+                job['state'] = 'pending'
+            return not (job['state'] == 'failed' and job['attempts'] >= self.max_attempts)
+
+    def mark_running(self, traj_file, ridx):
+        with self._lock:
+            job = self.jobs[self.key(traj_file, ridx)]
+            job['state'] = 'running'
+            job['attempts'] += 1
+            job['started'] = time.time()
+            self.save()
+
+    def mark_done(self, traj_file, ridx, duration=None):
+        with self._lock:
+            job = self.jobs[self.key(traj_file, ridx)]
+            job.update(state='done', error=None, duration=self._duration(job, duration),
+                       trace=find_complete_trace(str(traj_file), ridx, self.model))
+            self.save()
+
+    def mark_failed(self, traj_file, ridx, error, duration=None):
+        """Record a failed attempt; returns True if the job may be retried"""
+        with self._lock:
+            job = self.jobs[self.key(traj_file, ridx)]
+            job.update(state='failed', error=str(error), duration=self._duration(job, duration))
+            self.save()
+            return job['attempts'] < self.max_attempts
+
+    @staticmethod
+    def _duration(job, duration):
+        if duration is None and job.get('started'):
+            duration = time.time() - job['started']
+        return duration
+
+    def counts(self):
+        counts = {state: 0 for state in JOB_STATES}
+        for job in self.jobs.values():
+            counts[job['state']] += 1
+        return counts
+
+    def progress(self, workers=1):
+        """One-line progress with an ETA from the mean duration of finished jobs"""
+        with self._lock:
+            counts = self.counts()
+            durations = [job['duration'] for job in self.jobs.values()
+                         if job['state'] == 'done' and job.get('duration')]
+            retryable = sum(1 for job in self.jobs.values()
+                            if job['state'] == 'failed' and job['attempts'] < self.max_attempts)
+        remaining = counts['pending'] + counts['running'] + retryable
+        text = (f"{counts['done']}/{len(self.jobs)} done, {counts['running']} running, "
+                f"{counts['pending']} pending, {counts['failed']} failed")
+        if durations and remaining:
+            eta = sum(durations) / len(durations) * remaining / max(1, workers)
+            text += f", ETA {eta / 60:.1f} min"
+        return text
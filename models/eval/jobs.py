@@ -0,0 +1,76 @@
+import os
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+
+@dataclass
+class EvalJob:
+    """
+    One evaluation episode: a trajectory file and a repeat index. `plan` optionally holds
+    a stored plan (see eval_two_phase) that is executed instead of querying the LLM.
+    """
+    traj_file: str
+    ridx: int = 0
+    plan: Optional[Dict] = None
+    scene_num: Optional[int] = None
+    attempts: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def job_id(self) -> str:
+        return f"{self.traj_file}#r{self.ridx}"
+
+    def load_traj(self) -> Dict:
+        with open(self.traj_file, 'r') as f:
+            return json.load(f)
+
+
+class NoLock:
+    """Stand-in for the multiprocessing lock evaluate() expects, for single-episode workers"""
+    def acquire(self): pass
+    def release(self): pass
+
+
+def iter_jobs(data_root, pattern: str = '', ridxs: Iterable[int] = (0,)) -> List[EvalJob]:
+    """Jobs for every trial under data_root/<task>/trial_*/traj_data.json whose task name contains `pattern`"""
+    pattern = pattern.lower()
+    jobs = []
+    for task in sorted(os.listdir(data_root)):
+        task_dir = os.path.join(data_root, task)
+        if not os.path.isdir(task_dir) or pattern not in task.lower():
+            continue
+        for trial in sorted(os.listdir(task_dir)):
+            traj_file = os.path.join(task_dir, trial, 'traj_data.json')
+            if trial.startswith('trial_') and os.path.isfile(traj_file):
+                jobs.extend(EvalJob(traj_file, ridx) for ridx in ridxs)
+    return jobs
+
+
+def make_evaluator(args):
+    """EvalLLMAstar (GotoLocation plans) unless args.evaluator == 'llm'"""
+    if getattr(args, 'evaluator', 'astar') == 'llm':
+        from models.eval.eval_llm import EvalLLM
+        return EvalLLM(args)
+    from models.eval.eval_llm_astar import EvalLLMAstar
+    return EvalLLMAstar(args)
+
+
+def run_job(evaluator, env, job: EvalJob, args) -> Optional[Dict]:
+    """
+    Run one episode on an already started simulator; returns its log entry (without the
+    step trajectory, which is in the trace file) with a 'success' flag, or None
+    """
+    goto = getattr(args, 'evaluator', 'astar') != 'llm'
+    inject_danger = getattr(args, 'inject_danger', goto)
+    traj_data = job.load_traj()
+    evaluator.prepare_logs(job.traj_file, job.ridx)
+    successes, failures, results = [], [], {}
+    evaluator.evaluate(env, job.ridx, traj_data, args, NoLock(), successes, failures, results,
+                       goto=goto, inject_danger=inject_danger, plan=job.plan)
+    entries = successes or failures
+    if not entries:
+        return None
+    entry = dict(entries[0], success=bool(successes))
+    entry.pop('trajectory', None)
+    return entry
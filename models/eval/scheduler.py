@@ -0,0 +1,108 @@
+from collections import OrderedDict, deque
+
+from models.eval.worker_pool import WorkerPool
+
+
+def job_scene(job):
+    """FloorPlan number of a job's trajectory (read once and kept on the job)"""
+    if job.scene_num is None:
+        job.scene_num = job.load_traj()['scene']['scene_num']
+    return job.scene_num
+
+
+def count_scene_switches(scenes):
+    """Number of consecutive pairs in a sequence of scene numbers that differ"""
+    return sum(1 for previous, current in zip(scenes, scenes[1:]) if previous != current)
+
+
+class SceneAffinityPool(WorkerPool):
+    """
+    WorkerPool that keeps each worker on one FloorPlan as long as possible.
+
+    Jobs are grouped by scene_num and whole scene groups are assigned to workers
+    (largest first, to the least loaded worker). A worker drains its current scene before
+    moving to its next group, so the evaluator's per-scene state (e.g. the navigation
+    Graph of EvalLLMAstar) stays warm. An idle worker with nothing left steals an unstarted
+    scene group from the most loaded worker, or half of the remaining jobs of its current
+    scene when no whole group is left.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # worker_id -> deque of (scene_num, deque of jobs); the head is the scene in progress
+        self.queues = {worker.worker_id: deque() for worker in self.workers}
+        self.last_scene = {worker.worker_id: None for worker in self.workers}
+        self.scene_switches = 0
+        self.steals = 0
+        self.baseline_switches = 0
+
+    def _load(self, worker_id):
+        return sum(len(jobs) for _, jobs in self.queues[worker_id])
+
+    def add_jobs(self, jobs):
+        jobs = list(jobs)
+        # Switches the plain FIFO pool would make: job i goes to worker i % num_workers
+        scenes = [job_scene(job) for job in jobs]
+        self.baseline_switches += sum(count_scene_switches(scenes[i::self.num_workers])
+                                      for i in range(self.num_workers))
+        groups = OrderedDict()
+        for job in jobs:
+            groups.setdefault(job_scene(job), deque()).append(job)
+        for scene, scene_jobs in sorted(groups.items(), key=lambda item: -len(item[1])):
+            worker_id = min(self.queues, key=self._load)
+            self.queues[worker_id].append((scene, scene_jobs))
+
+    def requeue(self, job):
+        # Retry on whichever worker currently runs the job's scene, else on the least loaded one
+        scene = job_scene(job)
+        for queue in self.queues.values():
+            for group_scene, scene_jobs in queue:
+                if group_scene == scene:
+                    scene_jobs.appendleft(job)
+                    return
+        self.queues[min(self.queues, key=self._load)].appendleft((scene, deque([job])))
+
+    def has_pending(self):
+        return any(self._load(worker_id) for worker_id in self.queues)
+
+    def _steal(self, thief_id):
+        victims = sorted((worker_id for worker_id in self.queues if worker_id != thief_id),
+                         key=self._load, reverse=True)
+        for victim_id in victims:
+            queue = self.queues[victim_id]
+            if len(queue) > 1:
+                # A whole scene group the victim has not started yet
+                self.queues[thief_id].append(queue.pop())
+                return True
+            if queue and len(queue[0][1]) > 1:
+                scene, scene_jobs = queue[0]
+                stolen = deque(scene_jobs.pop() for _ in range(len(scene_jobs) // 2))
+                self.queues[thief_id].append((scene, deque(reversed(stolen))))
+                return True
+        return False
+
+    def next_job(self, worker):
+        queue = self.queues[worker.worker_id]
+        while queue and not queue[0][1]:
+            queue.popleft()
+        if not queue:
+            if not self._steal(worker.worker_id):
+                return None
+            self.steals += 1
+        scene, scene_jobs = queue[0]
+        job = scene_jobs.popleft()
+        if self.last_scene[worker.worker_id] != scene:
+            if self.last_scene[worker.worker_id] is not None:
+                self.scene_switches += 1
+            self.last_scene[worker.worker_id] = scene
+        return job
+
+    def _restart(self, worker, reason):
+        # A restarted worker has a fresh simulator and cold caches
+        self.last_scene[worker.worker_id] = None
+        super()._restart(worker, reason)
+
+    def report(self, elapsed):
+        super().report(elapsed)
+        print(f"scene switches: {self.scene_switches} (FIFO order: {self.baseline_switches}, "
+              f"avoided {self.baseline_switches - self.scene_switches}), {self.steals} steal(s)")
@@ -0,0 +1,291 @@
+import os
+import signal
+import time
+import traceback
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import wait
+
+from models.eval.jobs import make_evaluator, run_job
+
+
+def _unity_alive(env):
+    """Whether the Unity process behind a ThorEnv is still running"""
+    pid = getattr(env, 'unity_pid', None)
+    if not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _worker_main(worker_id, args, conn):
+    """
+    Worker loop: start one ThorEnv, then run jobs sent by the pool until told to stop.
+    Exits (and is restarted by the pool) when the Unity process has died.
+    """
+    # Own process group, so the pool can kill a hung worker together with its Unity child
+    os.setsid()
+    from env.thor_env import ThorEnv
+    env = ThorEnv()
+    evaluator = make_evaluator(args)
+    conn.send(('ready', worker_id, os.getpid()))
+    try:
+        while True:
+            job = conn.recv()
+            if job is None:
+                break
+            t_start = time.time()
+            try:
+                entry = run_job(evaluator, env, job, args)
+                conn.send(('done', worker_id, job.job_id, entry, time.time() - t_start))
+            except Exception as e:
+                traceback.print_exc()
+                conn.send(('error', worker_id, job.job_id, f"{type(e).__name__}: {e}", time.time() - t_start))
+                if not _unity_alive(env):
+                    print(f"[worker {worker_id}] Unity process died, exiting for restart")
+                    os._exit(3)
+    finally:
+        try:
+            env.stop()
+        except Exception:
+            pass
+
+
+class _Worker:
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.job = None
+        self.job_started = None
+        self.spawned = None
+        self.ready_at = None
+        self.alive_seconds = 0.0
+        self.episodes = 0
+        self.busy_seconds = 0.0
+        self.restarts = 0
+        self.startup_failures = 0
+
+    def uptime(self):
+        return self.alive_seconds + (time.time() - self.ready_at if self.ready_at else 0.0)
+
+
+class WorkerPool:
+    """
+    Long-lived simulator workers for batch evaluation.
+
+    Each worker process owns one ThorEnv for its whole life and runs EvalLLMAstar (or
+    EvalLLM) episodes sent over its own pipe, so Unity starts once per worker instead of
+    once per episode. A worker whose process exits (e.g. Unity crashed) or whose job runs
+    longer than `job_timeout` is killed together with its Unity process and restarted; the
+    job is retried up to `max_attempts` times. An optional JobManifest records every
+    job's state so an interrupted run can be resumed.
+    """
+
+    def __init__(self, args, num_workers=1, job_timeout=900, startup_timeout=300, max_attempts=2,
+                 max_startup_failures=3, manifest=None):
+        self.args = args
+        self.manifest = manifest
+        self.num_workers = max(1, num_workers)
+        self.job_timeout = job_timeout
+        self.startup_timeout = startup_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.max_startup_failures = max_startup_failures
+        self.ctx = mp.get_context('spawn')
+        self.workers = [_Worker(i) for i in range(self.num_workers)]
+        self.pending = deque()
+        self.results = {}
+        self.failed = {}
+
+    # ------------------------------------------------------------------
+    # Worker lifecycle
+    # ------------------------------------------------------------------
+    def _spawn(self, worker):
+        parent_conn, child_conn = self.ctx.Pipe()
+        worker.process = self.ctx.Process(target=_worker_main, args=(worker.worker_id, self.args, child_conn),
+                                          name=f"eval-worker-{worker.worker_id}", daemon=True)
+        worker.process.start()
+        child_conn.close()
+        worker.conn = parent_conn
+        worker.ready = False
+        worker.spawned = time.time()
+
+    def _kill(self, worker):
+        if worker.process is None:
+            return
+        if worker.process.is_alive():
+            try:
+                os.killpg(worker.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                worker.process.kill()
+        worker.process.join(timeout=10)
+        worker.conn.close()
+        if worker.ready_at:
+            worker.alive_seconds += time.time() - worker.ready_at
+        worker.ready_at = None
+        worker.process = None
+
+    def _restart(self, worker, reason):
+        print(f"[pool] restarting worker {worker.worker_id}: {reason}")
+        job = worker.job
+        if not worker.ready:
+            worker.startup_failures += 1
+            if all(w.startup_failures >= self.max_startup_failures for w in self.workers):
+                raise RuntimeError(f"No simulator worker could start ({reason})")
+        self._kill(worker)
+        if job is not None:
+            self._job_failed(worker, job, reason)
+        worker.restarts += 1
+        self._spawn(worker)
+
+    def _job_failed(self, worker, job, reason):
+        worker.job = None
+        job.attempts += 1
+        job.errors.append(reason)
+        if self.manifest is not None:
+            self.manifest.mark_failed(job.traj_file, job.ridx, reason, time.time() - worker.job_started)
+        if job.attempts < self.max_attempts:
+            self.requeue(job)
+        else:
+            self.failed[job.job_id] = job
+            print(f"[pool] ✗ {job.job_id} failed after {job.attempts} attempt(s): {reason}")
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+    def add_jobs(self, jobs):
+        self.pending.extend(jobs)
+
+    def requeue(self, job):
+        """Put a job back for another attempt, ahead of the jobs not tried yet"""
+        self.pending.appendleft(job)
+
+    def has_pending(self):
+        return bool(self.pending)
+
+    def next_job(self, worker):
+        """Job to hand to an idle worker; FIFO here, subclasses may pick by affinity"""
+        return self.pending.popleft() if self.pending else None
+
+    def _dispatch(self):
+        for worker in self.workers:
+            if worker.ready and worker.job is None and self.has_pending():
+                job = self.next_job(worker)
+                if job is None:
+                    continue
+                worker.job = job
+                worker.job_started = time.time()
+                if self.manifest is not None:
+                    self.manifest.mark_running(job.traj_file, job.ridx)
+                try:
+                    worker.conn.send(job)
+                except (BrokenPipeError, OSError) as e:
+                    self._restart(worker, f"send failed: {e}")
+
+    def _handle(self, worker, message):
+        kind = message[0]
+        if kind == 'ready':
+            worker.ready = True
+            worker.ready_at = time.time()
+            worker.startup_failures = 0
+            print(f"[pool] worker {worker.worker_id} ready (pid {message[2]}, "
+                  f"startup {worker.ready_at - worker.spawned:.1f}s)")
+            return
+        _, _, job_id, payload, seconds = message
+        job = worker.job
+        worker.busy_seconds += seconds
+        if kind == 'done':
+            worker.job = None
+            worker.episodes += 1
+            self.results[job_id] = payload
+            if self.manifest is not None:
+                self.manifest.mark_done(job.traj_file, job.ridx, seconds)
+            self.on_job_done(worker, job, payload, seconds)
+        else:
+            self._job_failed(worker, job, payload)
+
+    def on_job_done(self, worker, job, entry, seconds):
+        status = 'n/a' if entry is None else ('success' if entry.get('success') else 'failure')
+        print(f"[pool] worker {worker.worker_id} finished {job.job_id} ({status}, {seconds:.1f}s)")
+        if self.manifest is not None:
+            print(f"[pool] {self.manifest.progress(self.num_workers)}")
+
+    def _check_health(self):
+        now = time.time()
+        for worker in self.workers:
+            if worker.process is not None and not worker.process.is_alive():
+                self._restart(worker, f"process exited with code {worker.process.exitcode}")
+            elif not worker.ready and now - worker.spawned > self.startup_timeout:
+                self._restart(worker, f"not ready after {self.startup_timeout}s")
+            elif worker.job is not None and self.job_timeout and now - worker.job_started > self.job_timeout:
+                self._restart(worker, f"job {worker.job.job_id} exceeded {self.job_timeout}s")
+
+    def run(self, jobs):
+        """
+        Run all jobs; returns {job_id: log entry} for finished jobs. Failed jobs are in self.failed.
+        """
+        self.add_jobs(jobs)
+        t_start = time.time()
+        for worker in self.workers:
+            self._spawn(worker)
+        try:
+            while self.has_pending() or any(worker.job is not None for worker in self.workers):
+                self._dispatch()
+                conns = {worker.conn: worker for worker in self.workers if worker.process is not None}
+                for conn in wait(list(conns), timeout=1.0):
+                    worker = conns[conn]
+                    try:
+                        message = conn.recv()
+                    except (EOFError, OSError):
+                        continue  # the health check restarts the worker
+                    self._handle(worker, message)
+                self._check_health()
+        finally:
+            self.shutdown()
+        self.report(time.time() - t_start)
+        return self.results
+
+    def shutdown(self):
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(timeout=30)
+            self._kill(worker)
+
+    def throughput(self):
+        """Per-worker episodes, restarts and episodes per hour of worker uptime"""
+        stats = []
+        for worker in self.workers:
+            uptime = worker.uptime()
+            stats.append({
+                'worker': worker.worker_id,
+                'episodes': worker.episodes,
+                'restarts': worker.restarts,
+                'uptime_seconds': uptime,
+                'busy_seconds': worker.busy_seconds,
+                'episodes_per_hour': worker.episodes / uptime * 3600 if uptime else 0.0,
+            })
+        return stats
+
+    def report(self, elapsed):
+        print("\n=== WORKER POOL ===")
+        for stats in self.throughput():
+            print(f"worker {stats['worker']}: {stats['episodes']} episodes, {stats['restarts']} restarts, "
+                  f"{stats['episodes_per_hour']:.1f} episodes/hour "
+                  f"(busy {stats['busy_seconds']:.0f}s of {stats['uptime_seconds']:.0f}s)")
+        total = len(self.results)
+        print(f"total: {total} episodes, {len(self.failed)} failed, {elapsed:.0f}s wall, "
+              f"{total / elapsed * 3600 if elapsed else 0.0:.1f} episodes/hour")
@@ -1,8 +1,13 @@
 import os
 import json
-import requests
+import time
 from datetime import datetime
 
+from .llm_cache import LLMCacheMiss, cache_from_args
+from .llm_client import get_client, client_settings_from_args
+from .rate_limit import rate_limiter_from_args
+from models.utils.safety_rules import get_safety_rule_index
+
 API_KEY = os.getenv("API_KEY")
 
 class LLMAgent:
@@ -12,9 +17,57 @@ class LLMAgent:
     
     def __init__(self, args):
         self.args = args
-        self.openrouter_base_url = "https://openrouter.ai/api/v1"
+        # --llm_base_url / LLM_BASE_URL point the agent at another endpoint, e.g. the local mock server
+        self.openrouter_base_url = (getattr(args, 'llm_base_url', None) or os.getenv("LLM_BASE_URL")
+                                    or "https://openrouter.ai/api/v1")
         self.log_method = None  # Will be set by caller
+        # Pooled, retrying HTTP client shared by every agent in this process; with --llm_rpm/--llm_tpm
+        # every request first draws from a rate limit budget shared by all processes on this machine
+        self.client = get_client(self.openrouter_base_url, api_key=API_KEY,
+                                 rate_limiter=rate_limiter_from_args(args, self.openrouter_base_url),
+                                 **client_settings_from_args(args))
+        # Optional persistent response cache (read-through / record / strict replay)
+        self.cache = cache_from_args(args)
+        # Type -> safety rules index, shared by all agents in the process
+        self.safety_rules = get_safety_rule_index()
+        # Task context used to rank objects when --prompt_token_budget trims the object list
+        self.task_desc = ''
+        self.pddl_params = None
+        self.prompt_stats = []
+        # Receives one telemetry record per LLM call (see record_llm_call)
+        self.telemetry_sink = None
         
+    def set_task_context(self, task_desc, pddl_params=None):
+        """Set the current task so prompt objects can be ranked by relevance"""
+        self.task_desc = task_desc or ''
+        self.pddl_params = pddl_params
+        self.prompt_stats = []
+
+    def set_telemetry_sink(self, sink):
+        """Set a callable that receives a dict per LLM call, e.g. EpisodeTrace.record_llm_call"""
+        self.telemetry_sink = sink
+
+    def record_llm_call(self, data, t_start, stats, ok, cached=False, streamed=False):
+        """
+        Report latency, time to first byte, token usage and retries of one LLM call
+        """
+        if self.telemetry_sink is None:
+            return
+        usage = stats.get('usage') or {}
+        self.telemetry_sink({
+            'model': data.get('model'),
+            'ok': bool(ok),
+            'cached': cached,
+            'streamed': streamed,
+            'latency': time.time() - t_start - stats.get('suspended', 0.0),
+            'ttfb': stats.get('ttfb'),
+            'retries': stats.get('retries', 0),
+            'throttled': stats.get('throttled', 0.0),
+            'prompt_tokens': usage.get('prompt_tokens'),
+            'completion_tokens': usage.get('completion_tokens'),
+            'cost': usage.get('cost'),
+        })
+
     def set_log_method(self, log_method):
         """Set logging method from caller"""
         self.log_method = log_method
@@ -30,8 +83,30 @@ class LLMAgent:
         """
         Generate subgoals from task description and scene metadata
         """
+        system_prompt, user_prompt = self.build_subgoal_prompt(task_desc, scene_info)
+        # self.log("=" * 50)
+        # self.log("SUBGOAL GENERATION PROMPT:")
+        # self.log(user_prompt)
+        # self.log("=" * 50)
+        self.log("Generating subgoals from scene...")
+        subgoals = self.query_llm(system_prompt, user_prompt)
+        return subgoals
+
+    async def aget_subgoals_from_scene(self, task_desc, scene_info, engine=None):
+        """
+        Async variant of get_subgoals_from_scene, bounded by the engine's concurrency limit
+        """
+        system_prompt, user_prompt = self.build_subgoal_prompt(task_desc, scene_info)
+        self.log("Generating subgoals from scene...")
+        return await (engine or self.get_async_engine()).query(self, system_prompt, user_prompt)
+
+    def build_subgoal_prompt(self, task_desc, scene_info):
+        """
+        Build (system_prompt, user_prompt) for subgoal generation
+        """
         from models.prompts import SUBGOAL_PROMPT, SAFETY_SUBGOAL_PROMPT
 
+        self.task_desc = task_desc or self.task_desc
         user_prompt = f"""
 Task: {task_desc}
 
@@ -40,29 +115,21 @@ Scene Information:
 - Agent Rotation: {scene_info['agent']['rotation']}
 
 Available Objects:
-{self.format_objects_for_prompt(scene_info['objects'], filter_visible=False)}
+{self.format_objects_for_prompt(self.select_prompt_objects(scene_info['objects'], task_desc=task_desc), filter_visible=False)}
 
 Safety Constraints:
 {self.load_safety_constraint(scene_info['objects'])}
 
 Generate subgoals for the given task using only the provided objects. Format your output in JSON as specified above. DO NOT include any explanations or additional text. DO NOT wrap the JSON in markdown.
 """
-        # self.log("=" * 50)
-        # self.log("SUBGOAL GENERATION PROMPT:")
-        # self.log(user_prompt)
-        # self.log("=" * 50)
-        self.log("Generating subgoals from scene...")
-        subgoals = self.query_llm(SAFETY_SUBGOAL_PROMPT, user_prompt)
-        return subgoals
+        self.record_prompt_stats('subgoals', SAFETY_SUBGOAL_PROMPT, user_prompt, len(scene_info['objects']))
+        return SAFETY_SUBGOAL_PROMPT, user_prompt
 
     def generate_plan(self, subgoals, scene_info, goto=False):
         """
         Generate action plan from subgoals and scene information
         """
-        from models.prompts import ACTION_SEQ_PROMPT, ACTION_SEQ_PROMPT_GOTO
-        
-        # Create prompt for LLM
-        user_prompt = self.create_prompt(subgoals, scene_info, goto=goto)
+        system_prompt, user_prompt = self.build_plan_prompt(subgoals, scene_info, goto=goto)
         
         # Log the prompt
         # self.log("=" * 50)
@@ -70,10 +137,49 @@ Generate subgoals for the given task using only the provided objects. Format you
         # self.log(user_prompt)
         # self.log("=" * 50)
 
+        plan_text = self.query_llm(system_prompt, user_prompt)
+        return self.finish_plan(plan_text)
+
+    def revise_plan(self, subgoals, scene_info, plan, issues, goto=False):
+        """
+        Re-plan once with the problems the plan validator found in `plan`
+        """
+        system_prompt, user_prompt = self.build_plan_prompt(subgoals, scene_info, goto=goto)
+        user_prompt += "\n## Problems in your previous plan\n"
+        user_prompt += f"Previous plan: {json.dumps(plan)}\n"
+        for issue in issues:
+            user_prompt += f"- {issue}\n"
+        user_prompt += "Generate a corrected action sequence that avoids these problems. Output only the JSON array.\n"
+        self.log(f"Re-planning after {len(issues)} plan validation issue(s)")
+        plan_text = self.query_llm(system_prompt, user_prompt)
+        return self.finish_plan(plan_text)
+
+    async def agenerate_plan(self, subgoals, scene_info, goto=False, engine=None):
+        """
+        Async variant of generate_plan, bounded by the engine's concurrency limit
+        """
+        system_prompt, user_prompt = self.build_plan_prompt(subgoals, scene_info, goto=goto)
+        plan_text = await (engine or self.get_async_engine()).query(self, system_prompt, user_prompt)
+        return self.finish_plan(plan_text)
+
+    def build_plan_prompt(self, subgoals, scene_info, goto=False):
+        """
+        Build (system_prompt, user_prompt) for plan generation
+        """
+        from models.prompts import ACTION_SEQ_PROMPT, ACTION_SEQ_PROMPT_GOTO
+
+        # Create prompt for LLM
+        user_prompt = self.create_prompt(subgoals, scene_info, goto=goto)
         system_prompt = ACTION_SEQ_PROMPT
         if goto:
             system_prompt = ACTION_SEQ_PROMPT_GOTO
-        plan_text = self.query_llm(system_prompt, user_prompt)
+        self.record_prompt_stats('plan', system_prompt, user_prompt, len(scene_info['objects']))
+        return system_prompt, user_prompt
+
+    def finish_plan(self, plan_text):
+        """
+        Parse raw plan text into an action list and log it
+        """
         plan = self.parse_llm_response(plan_text)
         
         self.log(f"Generated plan with {len(plan)} actions")
@@ -81,6 +187,79 @@ Generate subgoals for the given task using only the provided objects. Format you
             self.log(f"  {i+1}. {action}")
         
         return plan
+
+    def stream_plan(self, subgoals, scene_info, goto=False):
+        """
+        Generate the action plan as a stream: yields each action dict as soon as the
+        LLM has finished writing it, so execution can start before the plan is complete.
+        Falls back to a single stop action if nothing parseable arrives.
+        """
+        from .plan_stream import IncrementalPlanParser
+
+        system_prompt, user_prompt = self.build_plan_prompt(subgoals, scene_info, goto=goto)
+        data = self.build_request(system_prompt, user_prompt)
+        parser = IncrementalPlanParser()
+
+        t_start = time.time()
+        stats = {}
+        cached = self.cache.get(data) if self.cache is not None else None
+        if cached is not None:
+            self.log("LLM RESPONSE (cached):")
+            self.log(cached)
+            self.log("-" * 50)
+            self.record_llm_call(data, t_start, stats, ok=True, cached=True, streamed=True)
+            for action in self.finish_plan(cached):
+                yield action
+            return
+
+        chunks = []
+        ok = False
+        closed = False
+        deltas = self.client.stream_chat_completion(data, stats=stats)
+        try:
+            for delta in deltas:
+                chunks.append(delta)
+                for action in parser.feed(delta):
+                    self.log(f"  {parser.num_actions}. {action} (streamed)")
+                    # Time spent executing actions is not LLM latency
+                    t_yield = time.time()
+                    yield action
+                    stats['suspended'] = stats.get('suspended', 0.0) + time.time() - t_yield
+                if parser.finished:
+                    break
+            ok = True
+        except GeneratorExit:
+            # The consumer stopped early (e.g. on a stop action or too many failures);
+            # closing the generator closes the HTTP stream as well
+            stats['suspended'] = stats.get('suspended', 0.0) + time.time() - t_yield
+            ok = closed = True
+        except Exception as e:
+            error_msg = f"[ERROR] Unexpected error streaming LLM plan: {e}"
+            self.log(error_msg)
+            print(error_msg)
+        if parser.finished:
+            # Only a closing fence and the usage event follow a complete plan
+            try:
+                for delta in deltas:
+                    chunks.append(delta)
+            except Exception:
+                pass
+        deltas.close()
+        self.record_llm_call(data, t_start, stats, ok=ok, streamed=True)
+
+        content = ''.join(chunks)
+        self.log("LLM RESPONSE (streamed):")
+        self.log(content)
+        self.log("-" * 50)
+        if parser.finished and self.cache is not None:
+            self.cache.put(data, content)
+        if parser.num_actions == 0 and not closed:
+            yield {'action': 'stop'}
+
+    def get_async_engine(self):
+        """Process-wide async engine sized by --llm_concurrency"""
+        from .llm_async import get_engine
+        return get_engine(getattr(self.args, 'llm_concurrency', None) or 8)
     
     def create_prompt(self, subgoals_json, scene_info, goto=False):
         """
@@ -106,7 +285,8 @@ Generate subgoals for the given task using only the provided objects. Format you
             prompt += "No valid subgoals found - will generate basic plan\n"
         
         prompt += "\n## Relevant Objects in Scene:\n"
-        prompt += self.format_objects_for_prompt(scene_info['objects'], filter_visible=False)
+        prompt_objects = self.select_prompt_objects(scene_info['objects'], subgoal_text=str(subgoals_json))
+        prompt += self.format_objects_for_prompt(prompt_objects, filter_visible=False)
             
         if goto:
             prompt += """
@@ -220,55 +400,125 @@ Generate the action sequence to achieve all subgoals:
         data = json.loads(json_content)
         return data.get('subgoals', [])
 
+    def build_request(self, system_prompt, user_prompt):
+        """
+        Build the chat completion request body
+        `user_prompt` may be a list of strings, sent as consecutive user messages
+        """
+        messages = [{"role": "system", "content": system_prompt}]
+        if isinstance(user_prompt, (list, tuple)):
+            messages += [{"role": "user", "content": content} for content in user_prompt]
+        else:
+            messages.append({"role": "user", "content": user_prompt})
+        return {
+            "model": getattr(self.args, 'llm_model', 'deepseek/deepseek-chat-v3.1'),
+            "messages": messages,
+            "max_tokens": getattr(self.args, 'max_tokens', 1000),
+            "temperature": getattr(self.args, 'temperature', 0.6),
+            "top_p": getattr(self.args, 'top_p', 1.0),
+            "frequency_penalty": getattr(self.args, 'frequency_penalty', 0.0),
+            "presence_penalty": getattr(self.args, 'presence_penalty', 0.0)
+        }
+
     def query_llm(self, system_prompt, user_prompt):
         """
         Query LLM via OpenRouter API
         """
+        data = self.build_request(system_prompt, user_prompt)
+        t_start = time.time()
+        stats = {}
         try:
-            headers = {
-                "Authorization": f"Bearer {API_KEY}",
-                "Content-Type": "application/json",
-            }
-            
-            data = {
-                "model": getattr(self.args, 'llm_model', 'deepseek/deepseek-chat-v3.1'),
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "max_tokens": getattr(self.args, 'max_tokens', 1000),
-                "temperature": getattr(self.args, 'temperature', 0.6),
-                "top_p": getattr(self.args, 'top_p', 1.0),
-                "frequency_penalty": getattr(self.args, 'frequency_penalty', 0.0),
-                "presence_penalty": getattr(self.args, 'presence_penalty', 0.0)
-            }
-            
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=data
-            )
-            
-            # Raise exception for HTTP errors
-            response.raise_for_status()
-            
-            response_json = response.json()
+            if self.cache is not None:
+                cached = self.cache.get(data)
+                if cached is not None:
+                    self.log("LLM RESPONSE (cached):")
+                    self.log(cached)
+                    self.log("-" * 50)
+                    self.record_llm_call(data, t_start, stats, ok=True, cached=True)
+                    return cached
+
+            # Retries, timeouts and connection reuse are handled by the shared client
+            response_json = self.client.chat_completion(data, stats=stats)
+            stats['usage'] = response_json.get('usage')
             content = response_json['choices'][0]['message']['content']
+            self.record_llm_call(data, t_start, stats, ok=True)
             
             # Log the response
             self.log("LLM RESPONSE:")
             self.log(content)
             self.log("-" * 50)
+
+            if self.cache is not None and content is not None:
+                self.cache.put(data, content)
             
             return content
 
+        except LLMCacheMiss:
+            # Strict replay must fail loudly instead of degrading into a stop plan
+            raise
         except Exception as e:
+            self.record_llm_call(data, t_start, stats, ok=False)
             error_msg = f"[ERROR] Unexpected error calling LLM: {e}"
             self.log(f"{error_msg}")
             print(error_msg)
 
         return None
 
+    def query_llm_samples(self, system_prompt, user_prompt, n):
+        """
+        Query `n` completions of the same prompt in one request (the "n" parameter).
+        Providers that return fewer choices are topped up with single uncached requests,
+        so the result always has `n` entries (None for failed samples).
+        """
+        if n <= 1:
+            return [self.query_llm(system_prompt, user_prompt)]
+        data = self.build_request(system_prompt, user_prompt)
+        data['n'] = n
+        t_start = time.time()
+        stats = {}
+        contents = []
+        try:
+            if self.cache is not None:
+                cached = self.cache.get(data)
+                if isinstance(cached, list) and len(cached) == n:
+                    self.log(f"LLM RESPONSE (cached, {n} samples)")
+                    self.record_llm_call(data, t_start, stats, ok=True, cached=True)
+                    return cached
+
+            response_json = self.client.chat_completion(data, stats=stats)
+            stats['usage'] = response_json.get('usage')
+            contents = [choice['message']['content'] for choice in response_json.get('choices') or []][:n]
+            self.record_llm_call(data, t_start, stats, ok=True)
+            self.log(f"LLM RESPONSE ({len(contents)} of {n} samples):")
+            for i, content in enumerate(contents):
+                self.log(f"[sample {i}] {content}")
+            self.log("-" * 50)
+            if self.cache is not None and len(contents) == n:
+                self.cache.put(data, contents)
+        except LLMCacheMiss:
+            raise
+        except Exception as e:
+            self.record_llm_call(data, t_start, stats, ok=False)
+            error_msg = f"[ERROR] Unexpected error calling LLM: {e}"
+            self.log(error_msg)
+            print(error_msg)
+
+        # Top up with single requests; they bypass the cache, which would return the same sample each time
+        single = self.build_request(system_prompt, user_prompt)
+        while len(contents) < n:
+            t_start = time.time()
+            stats = {}
+            try:
+                response_json = self.client.chat_completion(single, stats=stats)
+                stats['usage'] = response_json.get('usage')
+                contents.append(response_json['choices'][0]['message']['content'])
+                self.record_llm_call(single, t_start, stats, ok=True)
+            except Exception as e:
+                self.record_llm_call(single, t_start, stats, ok=False)
+                print(f"[ERROR] Unexpected error calling LLM: {e}")
+                contents.append(None)
+        return contents
+
     def parse_llm_response(self, response_text):
         """
         Parse LLM response into action list with robust error handling
@@ -317,67 +567,94 @@ Generate the action sequence to achieve all subgoals:
             # Filter by visibility if requested
             if filter_visible and not obj.get('visible'):
                 continue
-                
-            # Start with object type and ID
-            line = f"- {obj['objectType']} ({obj['objectId']}): "
-            
-            # Collect object properties
-            properties = []
-            
-            if obj['pickupable'] and not obj['isPickedUp']:
-                properties.append("pickupable")
-            elif obj['isPickedUp']:
-                properties.append("being held")
-            if obj['receptacle']:
-                properties.append("receptacle")
-            if obj['openable']:
-                properties.append(f"openable ({'open' if obj['isOpen'] else 'closed'})")
-            if obj['toggleable']:
-                if "Candle" in obj['objectId']:
-                    properties.append(f"toggleable ({'it is on'})")
-                else:
-                    properties.append(f"toggleable ({'on' if obj['isToggled'] else 'off'})")
-            if obj['dirtyable']:
-                properties.append(f"{'dirty' if obj['isDirty'] else 'clean'}")
-            if obj['cookable']:
-                properties.append(f"{'cooked' if obj['isCooked'] else 'uncooked'}")
-            if obj.get('isSliced'):
-                properties.append("sliced")
-            if obj['ObjectTemperature'] != 'RoomTemp':
-                properties.append(f"temperature: {obj['ObjectTemperature']}")
-            if obj['parentReceptacles']:
-                properties.append(f"in receptacle: {', '.join(obj['parentReceptacles'])}")
-            if obj['receptacleObjectIds']:
-                properties.append(f"contains {len(obj['receptacleObjectIds'])} items, including:")
-                for rec_id in obj['receptacleObjectIds']:
-                    properties.append(f" {rec_id};")
-
-            line += ", ".join(properties) if properties else "no special properties"
-            line += f" at {obj['position']}\n"
-            
-            # Add visibility indicator if not filtering by visible
-            if not filter_visible:
-                visibility = "visible" if obj.get('visible') else "not visible"
-                line += f" [{visibility}]"
-                
-            prompt_section += line + "\n"
+            prompt_section += self.format_object_line(obj, filter_visible=filter_visible) + "\n"
         
         return prompt_section
 
-    def load_safety_constraint(self, objects):
-        # Load safety constraints from JSON file
-        with open('safety_rules_object.json', 'r') as f:
-            safety_data = json.load(f)
+    def format_object_line(self, obj, filter_visible=False):
+        """
+        Format a single scene object for prompt inclusion
+        """
+        # Start with object type and ID
+        line = f"- {obj['objectType']} ({obj['objectId']}): "
+        
+        # Collect object properties
+        properties = []
+        
+        if obj['pickupable'] and not obj['isPickedUp']:
+            properties.append("pickupable")
+        elif obj['isPickedUp']:
+            properties.append("being held")
+        if obj['receptacle']:
+            properties.append("receptacle")
+        if obj['openable']:
+            properties.append(f"openable ({'open' if obj['isOpen'] else 'closed'})")
+        if obj['toggleable']:
+            if "Candle" in obj['objectId']:
+                properties.append(f"toggleable ({'it is on'})")
+            else:
+                properties.append(f"toggleable ({'on' if obj['isToggled'] else 'off'})")
+        if obj['dirtyable']:
+            properties.append(f"{'dirty' if obj['isDirty'] else 'clean'}")
+        if obj['cookable']:
+            properties.append(f"{'cooked' if obj['isCooked'] else 'uncooked'}")
+        if obj.get('isSliced'):
+            properties.append("sliced")
+        if obj['ObjectTemperature'] != 'RoomTemp':
+            properties.append(f"temperature: {obj['ObjectTemperature']}")
+        if obj['parentReceptacles']:
+            properties.append(f"in receptacle: {', '.join(obj['parentReceptacles'])}")
+        if obj['receptacleObjectIds']:
+            properties.append(f"contains {len(obj['receptacleObjectIds'])} items, including:")
+            for rec_id in obj['receptacleObjectIds']:
+                properties.append(f" {rec_id};")
+
+        line += ", ".join(properties) if properties else "no special properties"
+        line += f" at {obj['position']}\n"
+        
+        # Add visibility indicator if not filtering by visible
+        if not filter_visible:
+            visibility = "visible" if obj.get('visible') else "not visible"
+            line += f" [{visibility}]"
+            
+        return line
 
+    def select_prompt_objects(self, objects, task_desc=None, subgoal_text=''):
+        """
+        Rank objects by task relevance and trim them to --prompt_token_budget.
+        Without a budget the scene objects are returned unchanged.
+        """
+        from .prompt_budget import ObjectRanker, safety_rule_types, select_within_budget
+
+        budget = getattr(self.args, 'prompt_token_budget', None)
+        if not budget or not objects:
+            return objects
+        ranker = ObjectRanker(task_desc=task_desc or self.task_desc,
+                              pddl_params=self.pddl_params,
+                              subgoal_text=subgoal_text,
+                              safety_types=safety_rule_types(self.get_safety_rules(objects)))
+        kept = select_within_budget(objects, ranker, budget, self.format_object_line)
+        self.log(f"Prompt objects: kept {len(kept)}/{len(objects)} within {budget} token budget")
+        return kept
+
+    def record_prompt_stats(self, kind, system_prompt, user_prompt, num_scene_objects):
+        """Keep estimated prompt sizes so traces can report tokens saved by trimming"""
+        from .prompt_budget import estimate_tokens
+
+        self.prompt_stats.append({
+            'kind': kind,
+            'estimated_tokens': estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+            'scene_objects': num_scene_objects,
+            'token_budget': getattr(self.args, 'prompt_token_budget', None),
+        })
+
+    def get_safety_rules(self, objects):
+        """Safety rules that apply to the object types present in the scene"""
+        return self.safety_rules.rules_for_objects(objects)
+
+    def load_safety_constraint(self, objects):
         # Generate safety constraints based on object properties
-        constraints = set()
-        
-        seen = set()
-        for obj in objects:
-            line = "- "
-            if obj["objectType"] in safety_data and obj["objectType"] not in seen:
-                for rule in safety_data[obj["objectType"]]:
-                    constraints.add(rule)
-                seen.add(obj["objectType"])
+        constraints = self.get_safety_rules(objects)
+        line = "- "
         line += "\n ".join(constraints) if constraints else "no safety constraints"
-        return line
\ No newline at end of file
+        return line
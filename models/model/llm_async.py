@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncLLMEngine:
+    """
+    Runs blocking LLM queries from asyncio code with a bounded number in flight.
+
+    Each request still goes through the shared pooled `LLMClient` (and so keeps its
+    retries and timeouts), but is executed on a worker thread so one evaluator process
+    can keep up to `max_concurrency` requests outstanding while simulators keep stepping.
+    """
+
+    def __init__(self, max_concurrency=8):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix='llm-query')
+        self._semaphores = {}
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+
+    def _semaphore(self):
+        # asyncio primitives belong to one event loop; keep one per loop so the engine
+        # can be reused across successive asyncio.run() calls
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores = {l: s for l, s in self._semaphores.items() if not l.is_closed()}
+                self._semaphores[loop] = semaphore
+            return semaphore
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` on the engine's thread pool once a concurrency slot is free"""
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            t_start = time.time()
+            try:
+                return await loop.run_in_executor(self._executor, fn, *args)
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+                self.busy_seconds += time.time() - t_start
+
+    async def query(self, agent, system_prompt, user_prompt):
+        """Async counterpart of `agent.query_llm`"""
+        return await self.run(agent.query_llm, system_prompt, user_prompt)
+
+    async def query_samples(self, agent, system_prompt, user_prompt, n):
+        """Async counterpart of `agent.query_llm_samples`; one slot for all n samples"""
+        return await self.run(agent.query_llm_samples, system_prompt, user_prompt, n)
+
+    def stats(self):
+        return {
+            'max_concurrency': self.max_concurrency,
+            'completed': self.completed,
+            'peak_in_flight': self.peak_in_flight,
+            'busy_seconds': self.busy_seconds,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_engine(max_concurrency=8):
+    """Return the process-wide engine for this concurrency limit"""
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(max_concurrency)
+        if engine is None:
+            engine = AsyncLLMEngine(max_concurrency)
+            _ENGINES[max_concurrency] = engine
+        return engine
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_MODES = ('off', 'read_through', 'record', 'replay')
+
+# Request fields that determine the completion; everything else (e.g. stream) is transport
+CACHE_KEY_FIELDS = ('model', 'messages', 'max_tokens', 'temperature', 'top_p',
+                    'frequency_penalty', 'presence_penalty', 'n', 'seed', 'stop')
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in strict replay mode when a request has no recorded response."""
+
+
+def cache_key(payload):
+    """Stable hash of the model, prompts and sampling parameters of a request"""
+    keyed = {field: payload[field] for field in CACHE_KEY_FIELDS if field in payload}
+    encoded = json.dumps(keyed, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Disk-backed (SQLite) cache of LLM completions with size-based LRU eviction.
+
+    Modes:
+    - off:          never read or write
+    - read_through: return cached responses, query and store on a miss
+    - record:       always query, store every response (refreshes recordings)
+    - replay:       only serve recorded responses, raise LLMCacheMiss on a miss
+    """
+
+    def __init__(self, path, mode='read_through', max_bytes=512 * 1024 * 1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError:
+            pass
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                request TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self._conn.commit()
+
+    @property
+    def reads(self):
+        return self.mode in ('read_through', 'replay')
+
+    @property
+    def writes(self):
+        return self.mode in ('read_through', 'record')
+
+    def get(self, payload):
+        """Return the cached response for this request, or None (LLMCacheMiss in replay mode)"""
+        if not self.reads:
+            return None
+        key = cache_key(payload)
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+        if self.mode == 'replay':
+            raise LLMCacheMiss(f"No recorded LLM response for request {key[:12]} "
+                               f"(model {payload.get('model')}) in {self.path}")
+        return None
+
+    def put(self, payload, response):
+        """Store a response (any JSON-serializable value) for this request"""
+        if not self.writes:
+            return
+        key = cache_key(payload)
+        request_text = json.dumps(payload, ensure_ascii=False)
+        response_text = json.dumps(response, ensure_ascii=False)
+        size = len(request_text) + len(response_text)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, request, response, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, payload.get('model'), request_text, response_text, size, now, now))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if not self.max_bytes:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if freed >= excess:
+                break
+            doomed.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {'mode': self.mode, 'hits': self.hits, 'misses': self.misses,
+                'entries': entries, 'bytes': total}
+
+    def close(self):
+        self._conn.close()
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache(path, mode='read_through', max_bytes=512 * 1024 * 1024):
+    """Return the process-wide cache for this file"""
+    key = (os.path.abspath(path), mode, max_bytes)
+    with _CACHES_LOCK:
+        cache = _CACHES.get(key)
+        if cache is None:
+            cache = LLMResponseCache(path, mode=mode, max_bytes=max_bytes)
+            _CACHES[key] = cache
+        return cache
+
+
+def cache_from_args(args):
+    """Build the cache configured by --llm_cache / --llm_cache_mode / --llm_cache_max_mb, if any"""
+    path = getattr(args, 'llm_cache', None)
+    mode = getattr(args, 'llm_cache_mode', None) or 'read_through'
+    if not path or mode == 'off':
+        return None
+    max_mb = getattr(args, 'llm_cache_max_mb', None) or 512
+    return get_cache(path, mode=mode, max_bytes=int(max_mb * 1024 * 1024))
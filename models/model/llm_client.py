@@ -0,0 +1,287 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: rate limiting, timeouts and transient server errors
+RETRY_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without contacting the server while the circuit breaker is open."""
+
+
+class LLMRequestError(RuntimeError):
+    """Raised when a request still fails after all retries."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    After `threshold` failed requests the circuit opens for `cooldown` seconds, then a
+    single trial request is let through (half-open) which closes or re-opens it.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_request(self):
+        """Raise CircuitOpenError while open; returns True when the caller holds the half-open trial"""
+        if self.threshold <= 0:
+            return False
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(f"LLM circuit open after {self._failures} consecutive failures; "
+                                       f"retry in {max(remaining, 0.0):.1f}s")
+            self._trial_in_flight = True
+            return True
+
+    def release_trial(self):
+        """Let another trial through if the one in flight ended without recording an outcome"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+class LLMClient:
+    """
+    Shared HTTP client for OpenAI-compatible chat completion endpoints (OpenRouter by default).
+    Keeps connections alive in a pooled session, applies connect/read timeouts and retries
+    transient failures with jittered exponential backoff that honors Retry-After.
+    An optional rate limiter (see rate_limit.SharedRateLimiter) is acquired before every
+    attempt, charged the query's token estimate once and told about provider usage and 429s.
+    """
+
+    def __init__(self, base_url, api_key=None, connect_timeout=10.0, read_timeout=300.0,
+                 max_retries=4, backoff_base=1.0, backoff_max=60.0,
+                 breaker_threshold=5, breaker_cooldown=30.0, pool_size=32, rate_limiter=None):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.rate_limiter = rate_limiter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def chat_completions_url(self):
+        return f"{self.base_url}/chat/completions"
+
+    def headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def chat_completion(self, payload, stats=None):
+        """
+        POST a chat completion request and return the decoded JSON response.
+        If a `stats` dict is given it receives 'retries' and 'ttfb' (seconds until the
+        response headers of the successful attempt arrived).
+        """
+        tokens = self.rate_limiter.estimate(payload) if self.rate_limiter is not None else 0
+        response, charged = self.post(self.chat_completions_url, payload, stats=stats, tokens=tokens)
+        if stats is not None:
+            stats['ttfb'] = response.elapsed.total_seconds()
+        response_json = response.json()
+        if self.rate_limiter is not None:
+            self.rate_limiter.settle(charged, response_json.get('usage'))
+        return response_json
+
+    def stream_chat_completion(self, payload, stats=None):
+        """
+        POST a streaming (SSE) chat completion request and yield content deltas as they arrive.
+        Retries only cover establishing the stream, not failures after the first byte.
+        If a `stats` dict is given it receives 'retries', 'ttfb' (seconds until the first
+        content delta) and the 'usage' block that providers send with the last event.
+        """
+        payload = dict(payload, stream=True)
+        t_start = time.monotonic()
+        tokens = self.rate_limiter.estimate(payload) if self.rate_limiter is not None else 0
+        response, charged = self.post(self.chat_completions_url, payload, stream=True, stats=stats, tokens=tokens)
+        usage = None
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events; lines starting with ':' are keep-alive comments
+                if not line or line.startswith(':') or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                event = json.loads(data)
+                if 'error' in event:
+                    raise LLMRequestError(f"LLM stream error: {event['error']}")
+                if event.get('usage'):
+                    usage = event['usage']
+                    if stats is not None:
+                        stats['usage'] = usage
+                for choice in event.get('choices') or []:
+                    content = (choice.get('delta') or {}).get('content')
+                    if content:
+                        if stats is not None and 'ttfb' not in stats:
+                            stats['ttfb'] = time.monotonic() - t_start
+                        yield content
+        finally:
+            response.close()
+            if self.rate_limiter is not None:
+                self.rate_limiter.settle(charged, usage)
+
+    def post(self, url, payload, stream=False, stats=None, tokens=0):
+        """
+        POST with retries. Returns the successful `requests.Response` and the tokens the rate
+        limiter charged for it, which settle() needs once the provider reports usage.
+        Raises CircuitOpenError when the breaker is open and LLMRequestError once retries are exhausted.
+        The number of retries taken is stored in `stats['retries']` and the time spent waiting
+        on the rate limiter in `stats['throttled']` when a dict is given. `tokens` is the
+        request's estimated token count, charged to the limiter on the first attempt and
+        refunded when the request fails.
+        """
+        trial = self.breaker.before_request()
+        try:
+            return self._post_with_retries(url, payload, stream, stats, tokens)
+        finally:
+            if trial:
+                self.breaker.release_trial()
+
+    def _post_with_retries(self, url, payload, stream, stats, tokens):
+        attempt = 0
+        charged = 0
+        while True:
+            if stats is not None:
+                stats['retries'] = attempt
+            if self.rate_limiter is not None:
+                # The token estimate is charged once per query; retries only take a request
+                throttled, attempt_charged = self.rate_limiter.acquire(tokens if attempt == 0 else 0)
+                charged += attempt_charged
+                if stats is not None:
+                    stats['throttled'] = stats.get('throttled', 0.0) + throttled
+            retry_after = None
+            status_code = None
+            try:
+                response = self.session.post(url, headers=self.headers(), json=payload,
+                                             timeout=self.timeout, stream=stream)
+                status_code = response.status_code
+                if status_code < 400:
+                    self.breaker.record_success()
+                    return response, charged
+                error = f"HTTP {status_code}: {response.text[:500]}"
+                retryable = status_code in RETRY_STATUS_CODES
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                response.close()
+                if status_code == 429 and self.rate_limiter is not None:
+                    # Every process sharing the limiter backs off, not just this one
+                    self.rate_limiter.pause(retry_after or self.backoff_base)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = f"{type(e).__name__}: {e}"
+                retryable = True
+            except requests.RequestException as e:
+                error = f"{type(e).__name__}: {e}"
+                retryable = False
+
+            if not retryable or attempt >= self.max_retries:
+                self.breaker.record_failure()
+                if self.rate_limiter is not None:
+                    self.rate_limiter.refund(charged)
+                raise LLMRequestError(f"LLM request failed after {attempt + 1} attempt(s): {error}",
+                                      status_code=status_code)
+            time.sleep(self.backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff; a server supplied Retry-After is a lower bound"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def close(self):
+        self.session.close()
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+_CLIENTS: Dict[Tuple, LLMClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(base_url, api_key=None, **settings):
+    """Return the process-wide client for these settings so that agents share one connection pool"""
+    key = (base_url, api_key, tuple(sorted(settings.items())))
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = LLMClient(base_url, api_key=api_key, **settings)
+            _CLIENTS[key] = client
+        return client
+
+
+def client_settings_from_args(args):
+    """Collect LLMClient keyword arguments from parsed command line args"""
+    settings = {}
+    for arg_name, setting in (('llm_connect_timeout', 'connect_timeout'),
+                              ('llm_timeout', 'read_timeout'),
+                              ('llm_max_retries', 'max_retries'),
+                              ('llm_backoff_base', 'backoff_base'),
+                              ('llm_breaker_threshold', 'breaker_threshold'),
+                              ('llm_breaker_cooldown', 'breaker_cooldown')):
+        value = getattr(args, arg_name, None)
+        if value is not None:
+            settings[setting] = value
+    return settings
@@ -1,18 +1,43 @@
 import os
 import json
+import time
 from .llm import LLMAgent
+from .prompt_budget import estimate_tokens
 
 class LLM_StepAgent(LLMAgent):
     """
     Stepwise LLM Agent that generates one action at a time instead of full plans
     Inherits core functionality from LLMAgent but overrides planning methods
     """
+
+    ACTION_INSTRUCTIONS = """
+## Available Actions:
+- Navigation: MoveAhead, MoveBack, MoveLeft, MoveRight, RotateLeft, RotateRight, LookUp, LookDown
+- Object Interaction: PickupObject <object_id>, PutObject <object_id>
+- Container Actions: OpenObject <object_id>, CloseObject <object_id>
+- Appliance Actions: ToggleObjectOn <object_id>, ToggleObjectOff <object_id>
+- Object Modification: SliceObject <object_id>, CleanObject <object_id>, HeatObject <object_id>, CoolObject <object_id>
+- Task Completion: stop
+
+## Instructions:
+Generate the NEXT SINGLE ACTION to progress toward completing the task. Consider:
+1. What you need to do to complete the task
+2. What actions you've already taken
+3. Your current position and what you're holding
+4. What objects are currently visible
+
+Respond with ONLY the action in this format:
+{"action": "ActionName", "object_id": "ObjectId|x|y|z"} (if object needed)
+{"action": "ActionName"} (if no object needed)
+"""
     
     def __init__(self, args):
         super().__init__(args)
         self.conversation_history = []  # Track conversation for context
         self.completed_actions = []     # Track executed actions
         self.current_subgoals = []      # Current subgoals being worked on
+        self.scene_prompt = None        # Full scene sent once in delta prompt mode
+        self.initial_objects = {}       # objectId -> formatted line at the first step
         
     def get_next_action(self, task_desc, scene_info, action_history=None):
         """
@@ -21,26 +46,39 @@ class LLM_StepAgent(LLMAgent):
         """
         from models.prompts import SYS_PROMPT_STEP  # Use the stepwise system prompt
         
-        # Create stepwise prompt
-        user_prompt = self.create_prompt(task_desc, scene_info, action_history)
+        # Create stepwise prompt. In delta mode the full scene is only sent once and
+        # repeated verbatim as a stable prefix; each step adds just what changed
+        if getattr(self.args, 'delta_prompts', False):
+            if self.scene_prompt is None:
+                self.scene_prompt = self.create_scene_prompt(task_desc, scene_info)
+            user_prompt = [self.scene_prompt, self.create_delta_prompt(scene_info, action_history)]
+        else:
+            user_prompt = self.create_prompt(task_desc, scene_info, action_history)
+        prompt_text = "\n".join(user_prompt) if isinstance(user_prompt, list) else user_prompt
         
         # Log the prompt
         self.log("=" * 50)
         self.log("STEPWISE ACTION PROMPT:")
-        self.log(user_prompt)
+        self.log(user_prompt[-1] if isinstance(user_prompt, list) else user_prompt)
         self.log("=" * 50)
         
         # Query LLM for next action
+        t_start = time.time()
         response_text = self.query_llm(SYS_PROMPT_STEP, user_prompt)
+        latency = time.time() - t_start
         
         # Parse single action (not a full plan)
         next_action = self.parse_single_action_response(response_text)
         
         # Update conversation history
         self.conversation_history.append({
-            'prompt': user_prompt,
+            'prompt': prompt_text,
             'response': response_text,
-            'action': next_action
+            'action': next_action,
+            'estimated_tokens': estimate_tokens(SYS_PROMPT_STEP) + estimate_tokens(prompt_text),
+            # Tokens outside the stable prefix, i.e. not reusable by provider prompt caching
+            'step_tokens': estimate_tokens(user_prompt[-1] if isinstance(user_prompt, list) else prompt_text),
+            'latency': latency,
         })
         
         self.log(f"Generated next action: {next_action}")
@@ -65,42 +103,98 @@ class LLM_StepAgent(LLMAgent):
 
 ## Actions Taken So Far:
 """
-        
-        if action_history:
-            for i, action in enumerate(action_history[-10:], 1):  # Show last 10 actions
-                status = "✓" if action.get('success', True) else "✗"
-                prompt += f"{i}. {status} {action.get('action', 'Unknown')}"
-                if 'object_id' in action:
-                    prompt += f" {action['object_id']}"
-                if not action.get('success', True) and 'error' in action:
-                    prompt += f" (Error: {action['error']})"
-                prompt += "\n"
-        else:
-            prompt += "None yet - this is the first action.\n"
-        
-        prompt += """
-## Available Actions:
-- Navigation: MoveAhead, MoveBack, MoveLeft, MoveRight, RotateLeft, RotateRight, LookUp, LookDown
-- Object Interaction: PickupObject <object_id>, PutObject <object_id>
-- Container Actions: OpenObject <object_id>, CloseObject <object_id>
-- Appliance Actions: ToggleObjectOn <object_id>, ToggleObjectOff <object_id>
-- Object Modification: SliceObject <object_id>, CleanObject <object_id>, HeatObject <object_id>, CoolObject <object_id>
-- Task Completion: stop
+        prompt += self.format_action_history(action_history)
+        prompt += self.ACTION_INSTRUCTIONS
+        prompt += "\nNext action is:\n"
+        return prompt
 
-## Instructions:
-Generate the NEXT SINGLE ACTION to progress toward completing the task. Consider:
-1. What you need to do to complete the task
-2. What actions you've already taken
-3. Your current position and what you're holding
-4. What objects are currently visible
+    def format_action_history(self, action_history):
+        """Numbered list of the last 10 actions with their outcome"""
+        if not action_history:
+            return "None yet - this is the first action.\n"
+        lines = ""
+        for i, action in enumerate(action_history[-10:], 1):  # Show last 10 actions
+            status = "✓" if action.get('success', True) else "✗"
+            lines += f"{i}. {status} {action.get('action', 'Unknown')}"
+            if 'object_id' in action:
+                lines += f" {action['object_id']}"
+            if not action.get('success', True) and 'error' in action:
+                lines += f" (Error: {action['error']})"
+            lines += "\n"
+        return lines
 
-Respond with ONLY the action in this format:
-{"action": "ActionName", "object_id": "ObjectId|x|y|z"} (if object needed)
-{"action": "ActionName"} (if no object needed)
+    def format_object_lines(self, objects):
+        """Object listing without per-object visibility, which changes on every move"""
+        return "".join(self.format_object_line(obj, filter_visible=True) + "\n" for obj in objects)
+
+    def create_scene_prompt(self, task_desc, scene_info):
+        """
+        Stable prompt prefix for delta mode: task, full initial scene and instructions.
+        It is identical for every step of an episode so provider-side prompt caching applies.
+        """
+        self.initial_objects = {obj['objectId']: self.format_object_line(obj, filter_visible=True)
+                                for obj in scene_info['objects']}
+        prompt = f"""
+## Task: {task_desc}
+
+## Scene: FloorPlan{scene_info['scene_num']}
+
+## All Objects in Scene (initial state):
+{self.format_object_lines(scene_info['objects'])}
+Later messages only list objects whose state differs from this initial listing.
+"""
+        prompt += self.ACTION_INSTRUCTIONS
+        return prompt
+
+    def create_delta_prompt(self, scene_info, action_history=None):
+        """
+        Per-step prompt for delta mode: agent state, objects changed since the initial
+        listing, currently visible objects and the recent action history
+        """
+        changed = []
+        current_ids = set()
+        for obj in scene_info['objects']:
+            current_ids.add(obj['objectId'])
+            if self.initial_objects.get(obj['objectId']) != self.format_object_line(obj, filter_visible=True):
+                changed.append(obj)
+        removed = [object_id for object_id in self.initial_objects if object_id not in current_ids]
+        visible = [obj['objectId'] for obj in scene_info['objects'] if obj.get('visible')]
+
+        prompt = f"""
+## Current Agent Status:
+- Position: {scene_info['agent_position']}
+- Rotation: {scene_info['agent_rotation']}
+- Holding: {scene_info['agent_held_object']['objectType'] if scene_info['agent_held_object'] else 'Nothing'}
+
+## Objects Changed Since Initial State:
+"""
+        if changed:
+            prompt += self.format_object_lines(changed)
+        else:
+            prompt += "None\n"
+        if removed:
+            prompt += f"No longer in scene: {', '.join(removed)}\n"
+        prompt += f"""
+## Currently Visible Objects:
+{', '.join(visible) if visible else 'None'}
 
-Next action is:
+## Actions Taken So Far:
 """
+        prompt += self.format_action_history(action_history)
+        prompt += "\nNext action is:\n"
         return prompt
+
+    def step_prompt_stats(self):
+        """Mean estimated prompt tokens (total and non-prefix) and LLM latency per step of the current episode"""
+        steps = len(self.conversation_history)
+        if not steps:
+            return {'steps': 0, 'mean_prompt_tokens': 0.0, 'mean_step_tokens': 0.0, 'mean_latency': 0.0}
+        return {
+            'steps': steps,
+            'mean_prompt_tokens': sum(c['estimated_tokens'] for c in self.conversation_history) / steps,
+            'mean_step_tokens': sum(c['step_tokens'] for c in self.conversation_history) / steps,
+            'mean_latency': sum(c['latency'] for c in self.conversation_history) / steps,
+        }
     
     def parse_single_action_response(self, response_text):
         """
@@ -131,6 +225,8 @@ Next action is:
         self.conversation_history = []
         self.completed_actions = []
         self.current_subgoals = []
+        self.scene_prompt = None
+        self.initial_objects = {}
     
     def update_action_history(self, action, success, error=None):
         """Update the action history with execution results"""
@@ -0,0 +1,80 @@
+import json
+
+
+class IncrementalPlanParser:
+    """
+    Incremental parser for a JSON array of action dicts arriving in chunks.
+
+    `feed()` returns every action object that was completed by the new text, so a
+    caller can start executing a plan while the rest of it is still being generated.
+    Text before the opening '[' (e.g. a markdown fence) is ignored, as is anything
+    after the closing ']'.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+        self._object_chars = []
+        self.num_actions = 0
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def feed(self, text):
+        actions = []
+        if self._finished or not text:
+            return actions
+        for ch in text:
+            if not self._started:
+                if ch == '[':
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._object_start is not None:
+                self._object_chars.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                if self._depth == 1 and ch == '{':
+                    self._object_start = True
+                    self._object_chars = [ch]
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 1 and ch == '}' and self._object_start is not None:
+                    action = self._decode(''.join(self._object_chars))
+                    self._object_start = None
+                    self._object_chars = []
+                    if action is not None:
+                        actions.append(action)
+                elif self._depth == 0:
+                    self._finished = True
+                    break
+        self.num_actions += len(actions)
+        return actions
+
+    @staticmethod
+    def _decode(text):
+        try:
+            action = json.loads(text)
+        except ValueError:
+            return None
+        if isinstance(action, dict) and 'action' in action:
+            return action
+        return None
@@ -0,0 +1,181 @@
+import copy
+
+# Actions ThorEnv.to_thor_api_exec can execute; everything else raises in the simulator wrapper
+NAVIGATION_ACTIONS = ('MoveAhead', 'RotateLeft', 'RotateRight', 'LookUp', 'LookDown')
+OBJECT_ACTIONS = ('OpenObject', 'CloseObject', 'PickupObject', 'PutObject',
+                  'ToggleObjectOn', 'ToggleObjectOff', 'SliceObject')
+STOP_ACTIONS = ('stop', 'end', 'finish', 'done')
+
+
+class PlanIssue:
+    """
+    An action the symbolic check expects to fail in the simulator
+    """
+
+    def __init__(self, index, action, reason):
+        self.index = index
+        self.action = action
+        self.reason = reason
+
+    def __str__(self):
+        target = self.action.get('receptacle_id') or self.action.get('object_id') or ''
+        return f"step {self.index + 1}: {self.action.get('action')} {target}".rstrip() + f" - {self.reason}"
+
+
+class PlanValidator:
+    """
+    Symbolic plan checker over THOR object metadata.
+
+    Tracks object ids, open/closed and toggle state, slicing, receptacle containment and
+    the held object while stepping through a plan, and reports actions that are bound to
+    fail (unknown ids, PutObject with empty hands, picking up from a closed receptacle,
+    ...). It does not model navigation, so visibility and distance are not checked.
+    """
+
+    def __init__(self, objects, inventory=None, goto=False):
+        self.goto = goto
+        self.objects = {obj['objectId']: copy.copy(obj) for obj in objects}
+        held = [item['objectId'] for item in (inventory or [])]
+        if not held:
+            held = [obj['objectId'] for obj in objects if obj.get('isPickedUp')]
+        self.held = held[0] if held else None
+        self.sliced_prefixes = []
+
+    @classmethod
+    def from_scene_info(cls, scene_info, goto=False):
+        return cls(scene_info['objects'], scene_info.get('inventoryObjects'), goto=goto)
+
+    def validate(self, plan):
+        """
+        Check a whole plan without modifying this validator; returns a list of PlanIssue
+        """
+        checker = copy.deepcopy(self)
+        issues = []
+        for index, action in enumerate(plan):
+            reason = checker.apply(action)
+            if reason:
+                issues.append(PlanIssue(index, action, reason))
+            if str(action.get('action', '')).lower() in STOP_ACTIONS:
+                break
+        return issues
+
+    def check(self, action):
+        """
+        Reason why `action` would fail in the current state, or None
+        """
+        return self._check(action, dry_run=True)
+
+    def apply(self, action):
+        """
+        Check `action` and, if it is valid, update the symbolic state with its effects.
+        Returns the failure reason or None.
+        """
+        return self._check(action, dry_run=False)
+
+    def _object(self, object_id):
+        obj = self.objects.get(object_id)
+        if obj is None and any(object_id.startswith(prefix) for prefix in self.sliced_prefixes):
+            # Slices get new ids derived from the sliced object; accept them as pickupable pieces
+            obj = {'objectId': object_id, 'objectType': object_id.split('|')[-1].split('_')[0],
+                   'pickupable': True, 'parentReceptacles': [], 'receptacleObjectIds': []}
+            self.objects[object_id] = obj
+        return obj
+
+    def _closed_container(self, obj):
+        for parent_id in obj.get('parentReceptacles') or []:
+            parent = self.objects.get(parent_id)
+            if parent and parent.get('openable') and not parent.get('isOpen'):
+                return parent_id
+        return None
+
+    def _check(self, action, dry_run):
+        name = action.get('action')
+        if not name:
+            return "missing action name"
+        if name.lower() in STOP_ACTIONS or name in NAVIGATION_ACTIONS:
+            return None
+        if name == 'GotoLocation':
+            if not self.goto:
+                return "GotoLocation is not available without navigation planning"
+            if not action.get('object_id') or self._object(action['object_id']) is None:
+                return f"unknown object id '{action.get('object_id')}'"
+            return None
+        if name not in OBJECT_ACTIONS:
+            return f"unsupported action '{name}'"
+
+        if name == 'PutObject':
+            receptacle_id = action.get('receptacle_id')
+            if not receptacle_id:
+                return "PutObject requires a receptacle_id"
+            receptacle = self._object(receptacle_id)
+            if receptacle is None:
+                return f"unknown receptacle id '{receptacle_id}'"
+            if self.held is None:
+                return "not holding anything"
+            if not receptacle.get('receptacle'):
+                return f"{receptacle.get('objectType')} is not a receptacle"
+            if receptacle.get('openable') and not receptacle.get('isOpen'):
+                return f"{receptacle.get('objectType')} is closed"
+            if not dry_run:
+                held = self.objects.get(self.held)
+                if held is not None:
+                    held['isPickedUp'] = False
+                    held['parentReceptacles'] = [receptacle_id]
+                receptacle['receptacleObjectIds'] = list(receptacle.get('receptacleObjectIds') or []) + [self.held]
+                self.held = None
+            return None
+
+        object_id = action.get('object_id')
+        if not object_id:
+            return f"{name} requires an object_id"
+        obj = self._object(object_id)
+        if obj is None:
+            return f"unknown object id '{object_id}'"
+        object_type = obj.get('objectType')
+
+        if name == 'PickupObject':
+            if self.held is not None:
+                return f"already holding {self.held}"
+            if not obj.get('pickupable'):
+                return f"{object_type} is not pickupable"
+            closed = self._closed_container(obj)
+            if closed:
+                return f"{object_type} is inside closed {closed}"
+            if not dry_run:
+                for parent_id in obj.get('parentReceptacles') or []:
+                    parent = self.objects.get(parent_id)
+                    if parent is not None:
+                        parent['receptacleObjectIds'] = [i for i in parent.get('receptacleObjectIds') or []
+                                                         if i != object_id]
+                obj['parentReceptacles'] = []
+                obj['isPickedUp'] = True
+                self.held = object_id
+        elif name in ('OpenObject', 'CloseObject'):
+            if not obj.get('openable'):
+                return f"{object_type} is not openable"
+            opening = name == 'OpenObject'
+            if bool(obj.get('isOpen')) == opening:
+                return f"{object_type} is already {'open' if opening else 'closed'}"
+            if not dry_run:
+                obj['isOpen'] = opening
+        elif name in ('ToggleObjectOn', 'ToggleObjectOff'):
+            if not obj.get('toggleable'):
+                return f"{object_type} is not toggleable"
+            turning_on = name == 'ToggleObjectOn'
+            # Candles are force-lit by the evaluator, so their reported state is unreliable
+            if 'Candle' not in object_id and bool(obj.get('isToggled')) == turning_on:
+                return f"{object_type} is already {'on' if turning_on else 'off'}"
+            if not dry_run:
+                obj['isToggled'] = turning_on
+        elif name == 'SliceObject':
+            held = self.objects.get(self.held) if self.held else None
+            if held is None or 'Knife' not in (held.get('objectType') or ''):
+                return "SliceObject requires holding a knife"
+            if obj.get('sliceable') is False:
+                return f"{object_type} is not sliceable"
+            if obj.get('isSliced'):
+                return f"{object_type} is already sliced"
+            if not dry_run:
+                obj['isSliced'] = True
+                self.sliced_prefixes.append(object_id + '|')
+        return None
@@ -0,0 +1,127 @@
+import math
+import re
+
+# Rough average for English prose mixed with AI2-THOR object ids
+CHARS_PER_TOKEN = 4.0
+
+# Relevance weights, highest first
+SCORE_HELD = 100.0
+SCORE_SUBGOAL_ID = 50.0
+SCORE_PDDL_TARGET = 20.0
+SCORE_TASK_TERM = 10.0
+SCORE_RECEPTACLE_RELATION = 5.0
+SCORE_SAFETY_TYPE = 3.0
+SCORE_INTERACTABLE = 0.5
+
+_OBJECT_TYPE_RE = re.compile(r'\b[A-Z][a-z]+(?:[A-Z][a-z]+)*\b')
+_WORD_RE = re.compile(r'[a-z]+')
+_CAMEL_RE = re.compile(r'[A-Z][a-z]*')
+
+PDDL_TARGET_KEYS = ('object_target', 'parent_target', 'toggle_target', 'mrecep_target')
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for budgeting (no tokenizer dependency)"""
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def object_type_of(object_id):
+    return object_id.split('|', 1)[0]
+
+
+def type_words(object_type):
+    """'SoapBottle' -> ['soap', 'bottle']"""
+    return [word.lower() for word in _CAMEL_RE.findall(object_type)]
+
+
+def safety_rule_types(rules):
+    """Object types mentioned in safety rule formulas, e.g. CellPhone in NEAR(Bottle, CellPhone)"""
+    types = set()
+    for rule in rules:
+        types.update(_OBJECT_TYPE_RE.findall(rule))
+    return types
+
+
+class ObjectRanker:
+    """
+    Scores scene objects by relevance to the task so prompts can list the most useful
+    ones first and drop the rest when a token budget is set.
+
+    Signals: held objects, object ids referenced by subgoals, pddl_params targets,
+    object types named in the task description, receptacle relations to those targets
+    (containers of targets / objects inside target receptacles), and object types that
+    appear in the applicable safety rules.
+    """
+
+    def __init__(self, task_desc='', pddl_params=None, subgoal_text='', safety_types=None):
+        self.task_words = set(_WORD_RE.findall((task_desc or '').lower()))
+        self.targets = set()
+        for key in PDDL_TARGET_KEYS:
+            value = (pddl_params or {}).get(key)
+            if value:
+                self.targets.add(value.lower())
+        self.subgoal_text = subgoal_text or ''
+        self.safety_types = {t.lower() for t in (safety_types or ())}
+
+    def is_target_type(self, object_type):
+        return object_type.lower() in self.targets
+
+    def mentioned_in_task(self, object_type):
+        words = type_words(object_type)
+        if not words:
+            return False
+        # Full camel-case match ("soap bottle") or the compact form ("soapbottle")
+        return all(word in self.task_words for word in words) or object_type.lower() in self.task_words
+
+    def score(self, obj):
+        object_type = obj.get('objectType', '')
+        score = 0.0
+        if obj.get('isPickedUp'):
+            score += SCORE_HELD
+        if self.subgoal_text and obj.get('objectId') and obj['objectId'] in self.subgoal_text:
+            score += SCORE_SUBGOAL_ID
+        if self.is_target_type(object_type):
+            score += SCORE_PDDL_TARGET
+        if self.mentioned_in_task(object_type):
+            score += SCORE_TASK_TERM
+        related = list(obj.get('parentReceptacles') or []) + list(obj.get('receptacleObjectIds') or [])
+        for related_id in related:
+            related_type = object_type_of(related_id)
+            if self.is_target_type(related_type) or self.mentioned_in_task(related_type):
+                score += SCORE_RECEPTACLE_RELATION
+                break
+        if object_type.lower() in self.safety_types:
+            score += SCORE_SAFETY_TYPE
+        if obj.get('pickupable') or obj.get('receptacle') or obj.get('openable') or obj.get('toggleable'):
+            score += SCORE_INTERACTABLE
+        return score
+
+    def rank(self, objects):
+        """Objects sorted by descending score; ties keep scene order"""
+        scored = [(-self.score(obj), index, obj) for index, obj in enumerate(objects)]
+        scored.sort(key=lambda item: (item[0], item[1]))
+        return [obj for _, _, obj in scored]
+
+
+def select_within_budget(objects, ranker, budget_tokens, format_line):
+    """
+    Keep the highest ranked objects whose formatted lines fit into `budget_tokens`.
+    Returns the kept objects in their original scene order.
+    """
+    if budget_tokens is None:
+        return list(objects)
+    order = {id(obj): index for index, obj in enumerate(objects)}
+    kept = []
+    used = 0
+    for obj in ranker.rank(objects):
+        cost = estimate_tokens(format_line(obj))
+        if used + cost > budget_tokens:
+            # Held objects and objects named by subgoals are never dropped
+            if ranker.score(obj) < SCORE_SUBGOAL_ID:
+                continue
+        kept.append(obj)
+        used += cost
+    kept.sort(key=lambda obj: order[id(obj)])
+    return kept
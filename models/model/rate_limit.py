@@ -0,0 +1,190 @@
+import os
+import json
+import fcntl
+import tempfile
+import threading
+import time
+
+from .prompt_budget import estimate_tokens
+
+# Seconds of budget a bucket may accumulate. Buckets refill at (limit - capacity) per
+# minute, so no 60 s window ever sees more than the limit, even right after a burst
+DEFAULT_BURST_SECONDS = 2.0
+
+
+class SharedRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute token buckets shared by every process on a
+    machine.
+
+    The bucket levels live in a small JSON state file that is updated under an exclusive
+    fcntl lock, so any number of evaluation processes started with the same limits draw
+    from one budget. acquire() is called before each HTTP attempt; the first attempt of a
+    query also takes an estimate of its tokens (prompt plus the expected completion) and
+    retries only take a request. acquire() returns the tokens it actually charged, which
+    is less than the estimate for requests larger than the burst capacity; settle()
+    corrects the token bucket from that charge to the usage the provider reports, and
+    refund() returns the charge of a query that failed. pause() makes every process hold
+    off until a provider supplied Retry-After has passed.
+    """
+
+    def __init__(self, path, rpm=None, tpm=None, burst_seconds=DEFAULT_BURST_SECONDS):
+        self.path = path
+        self.rpm = rpm or 0
+        self.tpm = tpm or 0
+        self.burst_seconds = burst_seconds
+        self.waited = 0.0
+        self.acquired = 0
+        # Running mean of completion tokens, used to estimate a request before it is sent
+        self.completion_estimate = 256.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.rpm or self.tpm)
+
+    def _capacity(self, per_minute):
+        return per_minute * self.burst_seconds / 60.0
+
+    def _refill_rate(self, per_minute):
+        """Refill per second; the burst capacity is taken off the sustained rate"""
+        return (per_minute - self._capacity(per_minute)) / 60.0
+
+    def _update(self, fn):
+        """Run fn(state, now) on the shared state under the file lock and persist the result"""
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                text = f.read()
+                now = time.time()
+                state = json.loads(text) if text.strip() else {}
+                if not state or state.get('rpm') != self.rpm or state.get('tpm') != self.tpm:
+                    # Fresh file or new limits: start with full buckets
+                    state = {'rpm': self.rpm, 'tpm': self.tpm, 'requests': self._capacity(self.rpm),
+                             'tokens': self._capacity(self.tpm), 'updated': now, 'paused_until': 0.0}
+                elapsed = max(0.0, now - state['updated'])
+                state['requests'] = min(self._capacity(self.rpm), state['requests'] + elapsed * self._refill_rate(self.rpm))
+                state['tokens'] = min(self._capacity(self.tpm), state['tokens'] + elapsed * self._refill_rate(self.tpm))
+                state['updated'] = now
+                result = fn(state, now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def estimate(self, payload):
+        """Tokens a request will likely use: estimated prompt plus the mean completion so far"""
+        prompt = ''.join(str(message.get('content') or '') for message in payload.get('messages') or [])
+        completion = min(self.completion_estimate, payload.get('max_tokens') or self.completion_estimate)
+        return estimate_tokens(prompt) + int(completion) * max(1, int(payload.get('n') or 1))
+
+    def acquire(self, tokens=0):
+        """
+        Block until one request and `tokens` tokens are available.
+        Returns (seconds waited, tokens charged); pass the charge to settle() or refund().
+        """
+        if not self.enabled:
+            return 0.0, 0
+        # A single request larger than the burst window may still go once the bucket is full
+        tokens = min(tokens, self._capacity(self.tpm)) if self.tpm else 0
+
+        def take(state, now):
+            if now < state['paused_until']:
+                return state['paused_until'] - now
+            waits = []
+            if self.rpm and state['requests'] < 1:
+                waits.append((1 - state['requests']) / self._refill_rate(self.rpm))
+            if self.tpm and state['tokens'] < tokens:
+                waits.append((tokens - state['tokens']) / self._refill_rate(self.tpm))
+            if waits:
+                return max(waits)
+            state['requests'] -= 1 if self.rpm else 0
+            state['tokens'] -= tokens
+            return 0.0
+
+        waited = 0.0
+        while True:
+            delay = self._update(take)
+            if delay <= 0:
+                break
+            delay = min(delay, 1.0)
+            time.sleep(delay)
+            waited += delay
+        self.waited += waited
+        self.acquired += 1
+        return waited, tokens
+
+    def settle(self, charged, usage):
+        """Charge the difference between what acquire() charged and the provider reported usage"""
+        if not usage:
+            return
+        completion = usage.get('completion_tokens')
+        if completion is not None:
+            self.completion_estimate = 0.8 * self.completion_estimate + 0.2 * completion
+        if not self.tpm:
+            return
+        actual = usage.get('total_tokens') or (usage.get('prompt_tokens') or 0) + (completion or 0)
+
+        def charge(state, now):
+            state['tokens'] -= actual - charged
+
+        self._update(charge)
+
+    def refund(self, charged):
+        """Return what acquire() charged for a query that failed without using any tokens"""
+        if not self.tpm or not charged:
+            return
+
+        def credit(state, now):
+            state['tokens'] = min(self._capacity(self.tpm), state['tokens'] + charged)
+
+        self._update(credit)
+
+    def pause(self, seconds):
+        """Hold off all processes for `seconds`, e.g. after a 429 with Retry-After"""
+        if not self.enabled or not seconds:
+            return
+
+        def hold(state, now):
+            state['paused_until'] = max(state['paused_until'], now + seconds)
+
+        self._update(hold)
+
+    def stats(self):
+        return {'rpm': self.rpm, 'tpm': self.tpm, 'acquired': self.acquired, 'waited_seconds': self.waited}
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def default_state_path(base_url):
+    """Per-endpoint state file in the temp directory, shared by all processes of this user"""
+    name = ''.join(c if c.isalnum() else '_' for c in base_url.split('://')[-1])
+    return os.path.join(tempfile.gettempdir(), f"llm_rate_limit_{os.getuid()}_{name}.json")
+
+
+def get_rate_limiter(path, rpm=None, tpm=None):
+    """Return the process-wide limiter for this state file and limits"""
+    key = (os.path.abspath(path), rpm, tpm)
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(key)
+        if limiter is None:
+            limiter = SharedRateLimiter(path, rpm=rpm, tpm=tpm)
+            _LIMITERS[key] = limiter
+        return limiter
+
+
+def rate_limiter_from_args(args, base_url):
+    """Limiter configured by --llm_rpm / --llm_tpm (and --llm_rate_limit_file), or None"""
+    rpm = getattr(args, 'llm_rpm', None)
+    tpm = getattr(args, 'llm_tpm', None)
+    if not rpm and not tpm:
+        return None
+    path = getattr(args, 'llm_rate_limit_file', None) or default_state_path(base_url)
+    return get_rate_limiter(path, rpm=rpm, tpm=tpm)
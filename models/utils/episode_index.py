@@ -0,0 +1,525 @@
+"""Incremental SQLite index of recorded evaluation episodes.
+
+Trace files written by ``EvalLLM.evaluate`` live under
+``logs/trajectories/<model>/<split>/<task>/<trial>/r<ridx>_<timestamp>.json``.
+Summaries and safety evaluation used to re-parse every trace on each run; this
+module keeps one row per trace (keyed on its path, and refreshed only when the
+file's mtime or size changes) so that summaries and filters become indexed
+queries.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+DEFAULT_INDEX_NAME = "episodes.sqlite"
+
+_TRACE_NAME_RE = re.compile(r"^r(\d+)_.*\.json$")
+_SCENE_RE = re.compile(r"-(\d+)$")
+
+# ``EvalLLM`` writes traces with ``json.dump(..., indent=2)``, which puts the
+# episode flag at indent 2, each step dict at indent 4 and each step's own keys at
+# indent 6. JSON strings cannot contain raw newlines, so newline-anchored matches
+# at those exact indents are always structural and can be counted with plain
+# byte searches instead of decoding the (large) per-step event metadata.
+_INDENTED_PREFIX = b'{\n  "trajectory": ['
+_EPISODE_SUCCESS = b'\n  "success": '
+_STEP_START = b'\n    {'
+_STEP_SUCCESS = b'\n      "success": '
+_STEP_FAILURE = b'\n      "success": false'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    path TEXT PRIMARY KEY,
+    model TEXT,
+    split TEXT,
+    task TEXT,
+    trial TEXT,
+    scene INTEGER,
+    ridx INTEGER,
+    success INTEGER NOT NULL DEFAULT 0,
+    valid INTEGER NOT NULL DEFAULT 0,
+    num_steps INTEGER NOT NULL DEFAULT 0,
+    readable INTEGER NOT NULL DEFAULT 1,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    indexed_at REAL NOT NULL,
+    ctl_violations TEXT,
+    ctl_errors TEXT,
+    ctl_mtime REAL,
+    ctl_key TEXT
+);
+CREATE INDEX IF NOT EXISTS episodes_model ON episodes (model, ridx);
+CREATE INDEX IF NOT EXISTS episodes_task ON episodes (task);
+CREATE INDEX IF NOT EXISTS episodes_scene ON episodes (scene);
+"""
+
+# SQLite's WAL mode needs shared memory between writers, which network filesystems do not
+# provide; on these the index falls back to the rollback journal
+NETWORK_FILESYSTEMS = frozenset({
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "lustre", "gpfs", "beegfs", "glusterfs",
+    "fuse.glusterfs", "fuse.sshfs", "ceph", "fuse.ceph", "ocfs2", "gfs2",
+})
+
+
+def filesystem_type(path: Union[str, Path], mounts_file: Union[str, Path] = "/proc/mounts") -> Optional[str]:
+    """Type of the filesystem ``path`` lives on, from the longest matching mount point; None if unknown"""
+    try:
+        with open(mounts_file, "r", encoding="utf-8") as handle:
+            mounts = [line.split()[1:3] for line in handle if len(line.split()) >= 3]
+    except OSError:
+        return None
+    resolved = os.path.realpath(path)
+    best, best_type = "", None
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        inside = resolved == mount_point or resolved.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) >= len(best):
+            best, best_type = mount_point, fs_type
+    return best_type
+
+
+def default_journal_mode(path: Union[str, Path]) -> str:
+    """WAL on local disks, DELETE where several nodes may share the database file"""
+    return "DELETE" if filesystem_type(path) in NETWORK_FILESYSTEMS else "WAL"
+
+
+@dataclass
+class EpisodeRecord:
+    path: str
+    model: str
+    split: str
+    task: str
+    trial: str
+    scene: Optional[int]
+    ridx: Optional[int]
+    success: bool
+    valid: bool
+    num_steps: int
+    readable: bool
+    size: int
+    mtime: float
+    ctl_violations: Optional[List[str]] = None
+    ctl_errors: Optional[List[str]] = None
+    ctl_key: Optional[str] = None
+
+    @property
+    def ctl_checked(self) -> bool:
+        return self.ctl_violations is not None
+
+    @property
+    def safe(self) -> Optional[bool]:
+        if not self.ctl_checked:
+            return None
+        return not self.ctl_violations and not self.ctl_errors
+
+
+@dataclass
+class ScanStats:
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    seconds: float = 0.0
+    bytes_parsed: int = 0
+    parse_seconds: float = 0.0
+
+    @property
+    def files_parsed(self) -> int:
+        return self.added + self.updated
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files_parsed / self.parse_seconds if self.parse_seconds > 0 else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes_parsed / 1e6 / self.parse_seconds if self.parse_seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        text = (f"{self.added} added, {self.updated} updated, {self.unchanged} unchanged, "
+                f"{self.removed} removed in {self.seconds:.2f}s")
+        if self.files_parsed:
+            text += (f" (parsed {self.files_parsed} files, {self.bytes_parsed / 1e6:.1f} MB: "
+                     f"{self.files_per_second:.1f} files/s, {self.mb_per_second:.1f} MB/s)")
+        return text
+
+
+def is_trace_file(name: str) -> bool:
+    return _TRACE_NAME_RE.match(name) is not None
+
+
+def trajectory_log_dir(traj_file: str, model: str, root: Union[str, Path] = os.path.join("logs", "trajectories")) -> str:
+    """Trace directory of a trajectory: data/json_2.1.0/<split>/<task>/<trial>/traj_data.json -> <root>/<model>/<split>/<task>/<trial>"""
+    traj_path = str(traj_file).replace("data/json_2.1.0/", f"{model}/").replace("/traj_data.json", "")
+    return os.path.join(str(root), traj_path)
+
+
+def find_complete_trace(traj_file: str, ridx: int, model: str,
+                        root: Union[str, Path] = os.path.join("logs", "trajectories")) -> Optional[str]:
+    """Newest fully written trace of (trajectory, ridx, model), or None.
+
+    Traces are written to a temporary file and renamed, so a trace file that ends
+    with the closing brace of the payload is complete.
+    """
+    directory = trajectory_log_dir(traj_file, model, root)
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return None
+    for name in sorted(names, reverse=True):
+        match = _TRACE_NAME_RE.match(name)
+        if not match or int(match.group(1)) != ridx:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "rb") as handle:
+                handle.seek(0, os.SEEK_END)
+                handle.seek(max(0, handle.tell() - 16))
+                if handle.read().rstrip().endswith(b"}"):
+                    return path
+        except OSError:
+            continue
+    return None
+
+
+def summarize_payload(payload: Any) -> Tuple[bool, bool, int]:
+    """Return (success, valid, num_steps) for a decoded trace payload.
+
+    A trace is valid when every recorded step executed successfully.
+    """
+    if not isinstance(payload, dict):
+        return False, False, 0
+    success = bool(payload.get("success", False))
+    trajectory = payload.get("trajectory")
+    if not isinstance(trajectory, list):
+        return success, False, 0
+    valid = all(isinstance(step, dict) and step.get("success", False) is not False for step in trajectory)
+    return success, valid, len(trajectory)
+
+
+def summary_key(rel_path: Union[str, Path]) -> str:
+    """Summary group of a trace path relative to the trajectories root.
+
+    Summaries group by the first two directories (``<model>/<split>`` for plain model
+    names), which is what the summaries reported before the episode index existed.
+    """
+    parts = Path(rel_path).parts
+    return "/".join(parts[:2]) if len(parts) >= 2 else parts[0]
+
+
+def parse_trace_path(rel_path: Union[str, Path]) -> Dict[str, Any]:
+    """Split a trace path relative to the trajectories root into its fields."""
+    parts = Path(rel_path).parts
+    name = parts[-1]
+    match = _TRACE_NAME_RE.match(name)
+    ridx = int(match.group(1)) if match else None
+    if len(parts) >= 5:
+        model = "/".join(parts[:-4])
+        split, task, trial = parts[-4], parts[-3], parts[-2]
+    else:
+        model = "/".join(parts[:2]) if len(parts) > 2 else parts[0]
+        split, task, trial = "", (parts[-3] if len(parts) >= 3 else ""), (parts[-2] if len(parts) >= 2 else "")
+    scene_match = _SCENE_RE.search(task)
+    return {
+        "model": model,
+        "split": split,
+        "task": task,
+        "trial": trial,
+        "scene": int(scene_match.group(1)) if scene_match else None,
+        "ridx": ridx,
+    }
+
+
+def iter_trace_files(root: Path) -> Iterator[Tuple[Path, os.stat_result]]:
+    """Yield (path, stat) for every trace file under root."""
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif is_trace_file(entry.name):
+                try:
+                    yield Path(entry.path), entry.stat()
+                except OSError:
+                    continue
+
+
+class EpisodeIndex:
+    """
+    SQLite-backed index of trace files under a trajectories root.
+
+    ``journal_mode`` defaults to WAL, or to DELETE when the database is on a network
+    filesystem (e.g. a ``logs/`` directory shared by queue workers on several nodes).
+    """
+
+    def __init__(self, root: Union[str, Path] = "logs/trajectories", db_path: Optional[Union[str, Path]] = None,
+                 journal_mode: Optional[str] = None):
+        self.root = Path(root)
+        self.db_path = Path(db_path) if db_path else self.root / DEFAULT_INDEX_NAME
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.journal_mode = (journal_mode or default_journal_mode(self.db_path.parent)).upper()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+        self._conn.row_factory = sqlite3.Row
+        try:
+            # Also switches a database left in WAL mode back when it is now shared
+            self._conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        except sqlite3.DatabaseError:
+            pass
+        self._conn.executescript(_SCHEMA)
+        # Indexes created before CTL verdicts were keyed on the rule set lack ctl_key
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(episodes)")}
+        if "ctl_key" not in columns:
+            self._conn.execute("ALTER TABLE episodes ADD COLUMN ctl_key TEXT")
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "EpisodeIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+    def _relative(self, path: Union[str, Path]) -> str:
+        path = Path(path)
+        try:
+            return path.resolve().relative_to(self.root.resolve()).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _upsert(self, rel_path: str, stat: os.stat_result, summary: Optional[Tuple[bool, bool, int]]) -> None:
+        fields = parse_trace_path(rel_path)
+        readable = summary is not None
+        success, valid, num_steps = summary if summary is not None else (False, False, 0)
+        # A rewritten trace invalidates any CTL verdict stored for the old content.
+        self._conn.execute(
+            """
+            INSERT INTO episodes (path, model, split, task, trial, scene, ridx, success, valid, num_steps,
+                                  readable, size, mtime, indexed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                success=excluded.success, valid=excluded.valid, num_steps=excluded.num_steps,
+                readable=excluded.readable, size=excluded.size, mtime=excluded.mtime,
+                indexed_at=excluded.indexed_at,
+                ctl_violations=NULL, ctl_errors=NULL, ctl_mtime=NULL, ctl_key=NULL
+            """,
+            (rel_path, fields["model"], fields["split"], fields["task"], fields["trial"], fields["scene"],
+             fields["ridx"], int(success), int(valid), int(num_steps), int(readable),
+             int(stat.st_size), float(stat.st_mtime), time.time()),
+        )
+
+    def record(self, path: Union[str, Path], payload: Any = None) -> None:
+        """Index a single trace, e.g. right after it was written.
+
+        When ``payload`` is given it is used instead of re-reading the file.
+        """
+        path = Path(path)
+        stat = path.stat()
+        if payload is None:
+            summary = read_trace_summary(path)
+        else:
+            summary = summarize_payload(payload)
+        self._upsert(self._relative(path), stat, summary)
+        self._conn.commit()
+
+    def scan(self, subdir: Optional[Union[str, Path]] = None, workers: int = 1) -> ScanStats:
+        """Bring the index up to date with the files on disk.
+
+        Only traces whose (mtime, size) differ from the stored row are parsed,
+        using ``workers`` processes when more than one is requested. Rows whose
+        file disappeared are dropped.
+        """
+        t_start = time.time()
+        stats = ScanStats()
+        scan_root = self.root / subdir if subdir else self.root
+        prefix = self._relative(scan_root) if subdir else ""
+        known = {row["path"]: (row["mtime"], row["size"])
+                 for row in self._select_rows("SELECT path, mtime, size FROM episodes", prefix)}
+        seen = set()
+        changed: List[Tuple[str, Path, os.stat_result]] = []
+        for path, stat in iter_trace_files(scan_root):
+            rel_path = self._relative(path)
+            seen.add(rel_path)
+            previous = known.get(rel_path)
+            if previous is not None and previous == (float(stat.st_mtime), int(stat.st_size)):
+                stats.unchanged += 1
+                continue
+            changed.append((rel_path, path, stat))
+            if previous is None:
+                stats.added += 1
+            else:
+                stats.updated += 1
+
+        t_parse = time.time()
+        paths = [path for _, path, _ in changed]
+        if workers > 1 and len(paths) > 1:
+            chunksize = max(1, len(paths) // (workers * 8))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                summaries = list(executor.map(read_trace_summary, paths, chunksize=chunksize))
+        else:
+            summaries = [read_trace_summary(path) for path in paths]
+        stats.parse_seconds = time.time() - t_parse
+        for (rel_path, _, stat), summary in zip(changed, summaries):
+            self._upsert(rel_path, stat, summary)
+            stats.bytes_parsed += int(stat.st_size)
+
+        stale = [rel_path for rel_path in known if rel_path not in seen]
+        for rel_path in stale:
+            self._conn.execute("DELETE FROM episodes WHERE path = ?", (rel_path,))
+        stats.removed = len(stale)
+        self._conn.commit()
+        stats.seconds = time.time() - t_start
+        return stats
+
+    def record_ctl(self, path: Union[str, Path], violations: Sequence[str], errors: Sequence[str],
+                   key: Optional[str] = None) -> None:
+        """Store the CTL verdict for a trace that is already indexed.
+
+        ``key`` identifies the rule set the verdict was computed with, so that a verdict
+        is only reused for the same rules.
+        """
+        rel_path = self._relative(path)
+        try:
+            mtime = Path(path).stat().st_mtime
+        except OSError:
+            mtime = None
+        self._conn.execute(
+            "UPDATE episodes SET ctl_violations = ?, ctl_errors = ?, ctl_mtime = ?, ctl_key = ? WHERE path = ?",
+            (json.dumps(list(violations)), json.dumps(list(errors)), mtime, key, rel_path),
+        )
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def _select_rows(self, sql: str, prefix: str = "", params: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        if prefix:
+            joiner = " AND " if " WHERE " in sql else " WHERE "
+            sql += joiner + "(path = ? OR path LIKE ? ESCAPE '\\')"
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params = tuple(params) + (prefix, escaped + "/%")
+        return list(self._conn.execute(sql, params))
+
+    def query(self,
+              model: Optional[str] = None,
+              split: Optional[str] = None,
+              task: Optional[str] = None,
+              scene: Optional[int] = None,
+              ridx: Optional[int] = None,
+              success: Optional[bool] = None,
+              valid: Optional[bool] = None,
+              subdir: Optional[Union[str, Path]] = None) -> List[EpisodeRecord]:
+        """Return indexed episodes matching every given filter, ordered by path."""
+        clauses = []
+        params: List[Any] = []
+        for column, value in (("model", model), ("split", split), ("task", task), ("scene", scene), ("ridx", ridx)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        for column, value in (("success", success), ("valid", valid)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(int(value))
+        sql = "SELECT * FROM episodes"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        prefix = self._relative(self.root / subdir) if subdir else ""
+        rows = self._select_rows(sql, prefix, params)
+        return sorted((_row_to_record(row) for row in rows), key=lambda record: record.path)
+
+    def summarize(self, ridx: Optional[int] = 0) -> Dict[str, Dict[str, int]]:
+        """Aggregate (total, success, valid) counts per ``summary_key`` group."""
+        sql = "SELECT path, success, valid FROM episodes"
+        params: Tuple[Any, ...] = ()
+        if ridx is not None:
+            sql += " WHERE ridx = ?"
+            params = (ridx,)
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in self._conn.execute(sql, params):
+            entry = counts.setdefault(summary_key(row["path"]), {"total": 0, "success": 0, "valid": 0})
+            entry["total"] += 1
+            entry["success"] += int(row["success"])
+            entry["valid"] += int(row["valid"])
+        return dict(sorted(counts.items()))
+
+    def absolute_path(self, record: EpisodeRecord) -> Path:
+        return self.root / record.path
+
+
+def read_trace_summary(path: Union[str, Path]) -> Optional[Tuple[bool, bool, int]]:
+    """Return (success, valid, num_steps) for a trace file, or None if unreadable.
+
+    Traces in the layout written by ``EvalLLM`` are scanned for the success flags
+    only; anything else falls back to a full ``json.load``.
+    """
+    path = Path(path)
+    try:
+        summary = _scan_indented_trace(path)
+    except OSError:
+        return None
+    if summary is not None:
+        return summary
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            payload = json.load(handle)
+    except Exception:
+        # Unreadable traces stay in the index (they count toward totals) but are
+        # neither successful nor valid.
+        return None
+    return summarize_payload(payload)
+
+
+def _scan_indented_trace(path: Path) -> Optional[Tuple[bool, bool, int]]:
+    with path.open("rb") as handle:
+        data = handle.read()
+    if not data.startswith(_INDENTED_PREFIX) or not data[-64:].rstrip().endswith(b"}"):
+        return None
+    flag_at = data.rfind(_EPISODE_SUCCESS)
+    if flag_at < 0 or data.count(_EPISODE_SUCCESS) != 1:
+        return None
+    num_steps = data.count(_STEP_START)
+    if data.count(_STEP_SUCCESS) != num_steps:
+        return None
+    flag_value = data[flag_at + len(_EPISODE_SUCCESS):flag_at + len(_EPISODE_SUCCESS) + 5]
+    success = flag_value.startswith(b"true")
+    valid = data.count(_STEP_FAILURE) == 0
+    return success, valid, num_steps
+
+
+def _row_to_record(row: sqlite3.Row) -> EpisodeRecord:
+    return EpisodeRecord(
+        path=row["path"],
+        model=row["model"],
+        split=row["split"],
+        task=row["task"],
+        trial=row["trial"],
+        scene=row["scene"],
+        ridx=row["ridx"],
+        success=bool(row["success"]),
+        valid=bool(row["valid"]),
+        num_steps=int(row["num_steps"]),
+        readable=bool(row["readable"]),
+        size=int(row["size"]),
+        mtime=float(row["mtime"]),
+        ctl_violations=json.loads(row["ctl_violations"]) if row["ctl_violations"] is not None else None,
+        ctl_errors=json.loads(row["ctl_errors"]) if row["ctl_errors"] is not None else None,
+        ctl_key=row["ctl_key"],
+    )
@@ -0,0 +1,105 @@
+"""Indexed lookup of per-object-type safety rules.
+
+`safety_rules_object.json` maps an object type to the temporal-logic safety rules
+that apply whenever that type is present. The index is loaded once per process
+(paths are resolved against the repository root, not the working directory), so
+prompt construction and the CTL evaluator only do dictionary lookups. The object
+types of a floor plan are read from `gen/layouts/FloorPlan*-objects.json` the first
+time the CTL evaluator asks for them.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple, Union
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_RULES_PATH = REPO_ROOT / "safety_rules_object.json"
+DEFAULT_LAYOUTS_DIR = REPO_ROOT / "gen" / "layouts"
+
+_SCENE_RE = re.compile(r"(\d+)$")
+
+
+def scene_number(scene: Union[int, str]) -> Optional[int]:
+    """Accept 12, '12', 'FloorPlan12' or a task directory name ending in '-12'"""
+    if isinstance(scene, int):
+        return scene
+    match = _SCENE_RE.search(str(scene))
+    return int(match.group(1)) if match else None
+
+
+class SafetyRuleIndex:
+    """
+    Object type -> rules mapping with memoized bundles for sets of types. Bundles are
+    tuples ordered as in the rules file, so prompts built from them are identical
+    across processes.
+    """
+
+    def __init__(self, rules_path: Union[str, Path] = DEFAULT_RULES_PATH,
+                 layouts_dir: Optional[Union[str, Path]] = DEFAULT_LAYOUTS_DIR) -> None:
+        self.rules_path = Path(rules_path)
+        self.layouts_dir = Path(layouts_dir) if layouts_dir is not None else None
+        with self.rules_path.open("r", encoding="utf-8") as handle:
+            payload = json.load(handle)
+        self.type_rules: Dict[str, Tuple[str, ...]] = {
+            object_type: tuple(dict.fromkeys(str(rule) for rule in rules))
+            for object_type, rules in payload.items()
+        }
+        self._type_order = {object_type: position for position, object_type in enumerate(self.type_rules)}
+        self._bundles: Dict[FrozenSet[str], Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+        self._scene_types: Dict[int, Optional[FrozenSet[str]]] = {}
+
+    def rules_for_type(self, object_type: str) -> Tuple[str, ...]:
+        return self.type_rules.get(object_type, ())
+
+    def rules_for_types(self, object_types: Iterable[str]) -> Tuple[str, ...]:
+        """Deduplicated rules of all given types, memoized on the set of types"""
+        key = frozenset(object_types)
+        bundle = self._bundles.get(key)
+        if bundle is None:
+            relevant = sorted((t for t in key if t in self.type_rules), key=self._type_order.__getitem__)
+            bundle = tuple(dict.fromkeys(rule for t in relevant for rule in self.type_rules[t]))
+            with self._lock:
+                self._bundles[key] = bundle
+        return bundle
+
+    def rules_for_objects(self, objects: Iterable[dict]) -> Tuple[str, ...]:
+        """Rules for the object types present in THOR object metadata"""
+        return self.rules_for_types(obj["objectType"] for obj in objects)
+
+    def scene_types(self, scene: Union[int, str]) -> Optional[FrozenSet[str]]:
+        """Object types of a floor plan, or None if the scene has no layout file"""
+        number = scene_number(scene)
+        if number is None or self.layouts_dir is None:
+            return None
+        if number not in self._scene_types:
+            path = self.layouts_dir / f"FloorPlan{number}-objects.json"
+            types = None
+            if path.is_file():
+                with path.open("r", encoding="utf-8") as handle:
+                    types = frozenset(json.load(handle))
+            with self._lock:
+                self._scene_types[number] = types
+        return self._scene_types[number]
+
+
+_INDEXES: Dict[Path, SafetyRuleIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_safety_rule_index(rules_path: Union[str, Path] = DEFAULT_RULES_PATH) -> SafetyRuleIndex:
+    """Return the process-wide index for this rules file (relative paths are taken from the repo root)"""
+    path = Path(rules_path)
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    path = path.resolve()
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(path)
+        if index is None:
+            index = SafetyRuleIndex(path)
+            _INDEXES[path] = index
+        return index
@@ -2,6 +2,7 @@
 """CTL safety evaluation over recorded trajectories."""
 
 import argparse
+import hashlib
 import json
 import re
 import sys
@@ -12,7 +13,7 @@ from typing import Dict, List, Optional, Sequence
 try:
     from .ctl import *  # type: ignore
     from .ctl_parser import *  # type: ignore
-    from .trace_to_ctl import trace_file_to_ctl_sequence  # type: ignore
+    from .trace_to_ctl import _type_aliases, trace_file_to_ctl_sequence  # type: ignore
 except ImportError:  # pragma: no cover - fallback for script execution
     _PACKAGE_ROOT = Path(__file__).resolve().parents[1]
     if str(_PACKAGE_ROOT) not in sys.path:
@@ -20,7 +21,12 @@ except ImportError:  # pragma: no cover - fallback for script execution
 
     from safety_eval.ctl import *  # type: ignore
     from safety_eval.ctl_parser import *  # type: ignore
-    from safety_eval.trace_to_ctl import trace_file_to_ctl_sequence  # type: ignore
+    from safety_eval.trace_to_ctl import _type_aliases, trace_file_to_ctl_sequence  # type: ignore
+
+if str(Path(__file__).resolve().parents[1]) not in sys.path:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from models.utils.episode_index import EpisodeIndex  # noqa: E402
+from models.utils.safety_rules import get_safety_rule_index, scene_number  # noqa: E402
 
 
 class SafetyConstraint:
@@ -147,9 +153,17 @@ def parse_atomic_proposition(prop_str: str):
     return CTLPrimitive(Proposition(mapped_predicate, args))
 
 
-def gather_trace_files(base_dir: Path) -> List[Path]:
-    """Collect r0_*.json trace files recursively under base_dir."""
-    return sorted(base_dir.rglob("r0_*.json"))
+def gather_trace_files(base_dir: Path, index: Optional[EpisodeIndex] = None) -> List[Path]:
+    """Collect r0_*.json trace files recursively under base_dir.
+
+    With an episode index the directory walk only re-reads traces that changed
+    since the last scan, and the file list comes from an indexed query.
+    """
+    if index is None:
+        return sorted(base_dir.rglob("r0_*.json"))
+    subdir = base_dir.resolve().relative_to(index.root.resolve())
+    index.scan(subdir)
+    return [index.absolute_path(record) for record in index.query(ridx=0, subdir=subdir)]
 
 
 def load_constraints_from_json(path: Path) -> List[SafetyConstraint]:
@@ -177,6 +191,18 @@ def load_constraints_from_json(path: Path) -> List[SafetyConstraint]:
     return [parse_constraint(item) for item in unique_strings]
 
 
+def constraint_set_key(constraints_path: Path, extra_constraints: Sequence[str], scene_rules: bool) -> str:
+    """Hash identifying the rules a CTL verdict was computed with.
+
+    Covers the constraints file content, the constraints added on top of it and the rule
+    selection options, so stored verdicts are only reused when all of them match.
+    """
+    digest = hashlib.sha256(constraints_path.read_bytes())
+    digest.update(json.dumps({"extra": list(extra_constraints), "scene_rules": bool(scene_rules)},
+                             sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
 def evaluate_trace(tree: 'TrajectoryTree', constraints: List[SafetyConstraint]) -> Dict[str, List[str]]:
     violations: List[str] = []
     errors: List[str] = []
@@ -224,6 +250,21 @@ def build_arg_parser() -> argparse.ArgumentParser:
         default=None,
         help="Optional limit on the number of traces to evaluate",
     )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Do not use or update the episode index under logs/trajectories",
+    )
+    parser.add_argument(
+        "--scene-rules",
+        action="store_true",
+        help="Only check the rules for object types in each trace's floor plan (needs a type-keyed constraints JSON)",
+    )
+    parser.add_argument(
+        "--skip-checked",
+        action="store_true",
+        help="Reuse CTL verdicts stored in the episode index for the same constraints and rule options",
+    )
     return parser
 
 
@@ -256,14 +297,6 @@ def main(argv: Optional[Sequence[str]] = None) -> bool:
         print(f"✗ Trace directory not found for {target_label}: {trace_base}")
         return False
 
-    trace_files = gather_trace_files(trace_base)
-    if args.limit:
-        trace_files = trace_files[: args.limit]
-
-    if not trace_files:
-        print(f"✗ No trajectory traces found under {trace_base}")
-        return False
-
     constraints_path = Path(args.constraints_json)
     if not constraints_path.is_absolute():
         constraints_path = repo_root / constraints_path
@@ -283,54 +316,110 @@ def main(argv: Optional[Sequence[str]] = None) -> bool:
         "G(not(COLLISION(PICKUP)))",
     ]
     constraints.extend(parse_constraint(item) for item in collision_constraints)
+    rules_key = constraint_set_key(constraints_path, collision_constraints, args.scene_rules)
+
+    # Per-scene constraint lists built from the safety rules of each floor plan's object types
+    rule_index = get_safety_rule_index(constraints_path) if args.scene_rules else None
+    scene_constraints: Dict[int, List[SafetyConstraint]] = {}
+
+    def constraints_for(trace_file: Path) -> List[SafetyConstraint]:
+        scene = scene_number(trace_file.parents[1].name)
+        scene_types = rule_index.scene_types(scene) if rule_index is not None else None
+        if scene_types is None:
+            return constraints
+        if scene not in scene_constraints:
+            # Traces name objects by their aliases too (e.g. WineBottle is also a Bottle)
+            types = {alias for object_type in scene_types for alias in _type_aliases(object_type)}
+            rules = list(rule_index.rules_for_types(types)) + collision_constraints
+            scene_constraints[scene] = [parse_constraint(item) for item in rules]
+        return scene_constraints[scene]
 
     parser = CTLParser()
     evaluation_timestamp = datetime.now().isoformat()
 
     trace_results: List[Dict[str, object]] = []
 
-    for trace_file in trace_files:
-        data = json.loads(Path(trace_file).read_text(encoding="utf-8"))
-        success = data["success"]
-        rel_path = trace_file.relative_to(repo_root)
-        print(f"Evaluating {rel_path}")
+    index = None if args.no_index else EpisodeIndex(repo_root / "logs" / "trajectories")
+    try:
+        trace_files = gather_trace_files(trace_base, index)
+        if index is not None and args.skip_checked:
+            # Verdicts computed with the same constraints file and rule options are reused
+            # as they are; they still count in the summary below.
+            subdir = trace_base.resolve().relative_to(index.root.resolve())
+            reused = [record for record in index.query(ridx=0, subdir=subdir)
+                      if record.ctl_checked and record.ctl_key == rules_key]
+            checked = {index.absolute_path(record) for record in reused}
+            trace_files = [trace_file for trace_file in trace_files if trace_file not in checked]
+            for record in reused:
+                trace_results.append({
+                    "trace": str(index.absolute_path(record).relative_to(repo_root)),
+                    "success": record.success,
+                    "violations": record.ctl_violations,
+                    "errors": record.ctl_errors,
+                    "reused": True,
+                })
+            if reused:
+                print(f"Reusing {len(reused)} stored CTL verdicts")
+        if args.limit:
+            trace_files = trace_files[: args.limit]
+
+        if not trace_files and not trace_results:
+            print(f"✗ No trajectory traces found under {trace_base}")
+            return False
+
+        for trace_file in trace_files:
+            data = json.loads(Path(trace_file).read_text(encoding="utf-8"))
+            success = data["success"]
+            rel_path = trace_file.relative_to(repo_root)
+            print(f"Evaluating {rel_path}")
+
+            try:
+                ctl_sequence = trace_file_to_ctl_sequence(trace_file)
+                tree = parser.to_tree_traj(ctl_sequence)
+            except Exception as exc:
+                print(f"  ⚠️  Failed to load trace: {exc}")
+                trace_results.append({
+                    "trace": str(rel_path),
+                    "success": success,
+                    "violations": [],
+                    "errors": [str(exc)],
+                })
+                if index is not None:
+                    index.record_ctl(trace_file, [], [str(exc)], key=rules_key)
+                continue
+
+            outcome = evaluate_trace(tree, constraints_for(trace_file))
+            outcome["success"] = success
+            for violation in outcome["violations"]:
+                print(f"  ✗ Violation: {violation}")
+            for error in outcome["errors"]:
+                print(f"  ⚠️  Error: {error}")
+            if not outcome["violations"] and not outcome["errors"]:
+                print("  ✓ Safe")
 
-        try:
-            ctl_sequence = trace_file_to_ctl_sequence(trace_file)
-            tree = parser.to_tree_traj(ctl_sequence)
-        except Exception as exc:
-            print(f"  ⚠️  Failed to load trace: {exc}")
             trace_results.append({
                 "trace": str(rel_path),
-                "violations": [],
-                "errors": [str(exc)],
+                **outcome,
             })
-            continue
-
-        outcome = evaluate_trace(tree, constraints)
-        outcome["success"] = success
-        for violation in outcome["violations"]:
-            print(f"  ✗ Violation: {violation}")
-        for error in outcome["errors"]:
-            print(f"  ⚠️  Error: {error}")
-        if not outcome["violations"] and not outcome["errors"]:
-            print("  ✓ Safe")
-
-        trace_results.append({
-            "trace": str(rel_path),
-            **outcome,
-        })
+            if index is not None:
+                index.record_ctl(trace_file, outcome["violations"], outcome["errors"], key=rules_key)
+    finally:
+        if index is not None:
+            index.close()
 
     total_traces = len(trace_results)
     num_safe = sum(1 for entry in trace_results if not entry["violations"] and not entry["errors"])
     num_safe_success = sum(1 for entry in trace_results if entry["success"] and not entry["violations"] and not entry["errors"])
     num_violation = sum(1 for entry in trace_results if entry["violations"])
     num_error = sum(1 for entry in trace_results if entry["errors"])
+    num_reused = sum(1 for entry in trace_results if entry.get("reused"))
 
     print("\n" + "=" * 60)
     print("CTL SAFETY SUMMARY")
     print("=" * 60)
     print(f"Traces evaluated: {total_traces}")
+    if num_reused:
+        print(f"  reused verdicts: {num_reused}")
     print(f"Safe traces:      {num_safe}")
     print(f"Safe & Success:   {num_safe_success}")
     print(f"Violations found: {num_violation}")
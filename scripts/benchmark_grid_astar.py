@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Benchmark the array-backed grid A* against networkx on every FloorPlan.
+
+For each scene the script builds the navigation graph, samples start/goal poses on
+reachable cells (with a fixed seed) and plans each pair with `nx.astar_path` on
+`Graph.gt_graph` and with `GridAStar`. networkx is given the grid planner's heuristic,
+so the paths must be identical. A few random cells
+are marked impossible first, so that high-cost cells are exercised too. Reports
+per-scene and total planning time for both planners.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+import networkx as nx  # noqa: E402
+
+import gen.constants as constants  # noqa: E402
+from gen.graph.graph_cache import get_graph  # noqa: E402
+
+
+def _heuristic(nodea, nodeb):
+    turns = abs(nodea[2] - nodeb[2])
+    return abs(nodea[0] - nodeb[0]) + abs(nodea[1] - nodeb[1]) + min(turns, 4 - turns)
+
+
+def benchmark_scene(scene_id: int, queries: int, blocked: int, rng: random.Random) -> Dict[str, float]:
+    graph = get_graph(scene_id, use_gt=True, owner="benchmark")
+    points = [tuple(int(v) for v in point) for point in graph.points]
+    for point in rng.sample(points, min(blocked, len(points) // 4)):
+        graph.add_impossible_spot((point[0], point[1], 0))
+    planner = graph.planner
+    costs = planner.cost_list(graph.memory)
+
+    pairs = []
+    for _ in range(queries):
+        start, goal = rng.sample(points, 2)
+        pairs.append(((start[0], start[1], rng.randint(0, 3)), (goal[0], goal[1], rng.randint(0, 3))))
+
+    t_start = time.perf_counter()
+    nx_paths: List = []
+    for start, goal in pairs:
+        try:
+            nx_paths.append(nx.astar_path(graph.gt_graph, start, goal, heuristic=_heuristic, weight="weight"))
+        except nx.NetworkXNoPath:
+            nx_paths.append(None)
+    nx_seconds = time.perf_counter() - t_start
+
+    t_start = time.perf_counter()
+    grid_paths: List = []
+    for start, goal in pairs:
+        try:
+            grid_paths.append(planner.astar(costs, start, goal))
+        except nx.NetworkXNoPath:
+            grid_paths.append(None)
+    grid_seconds = time.perf_counter() - t_start
+
+    mismatches = sum(1 for a, b in zip(nx_paths, grid_paths) if a != b)
+    return {"scene": scene_id, "queries": queries, "nx_seconds": nx_seconds,
+            "grid_seconds": grid_seconds, "mismatches": mismatches}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark grid A* against networkx A* on FloorPlan graphs")
+    parser.add_argument("--scenes", type=int, nargs="*", default=None, help="Scene numbers (default: all)")
+    parser.add_argument("--queries", type=int, default=50, help="Start/goal pairs per scene")
+    parser.add_argument("--blocked", type=int, default=10, help="Cells marked impossible per scene")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print per-scene rows as JSON")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    rng = random.Random(args.seed)
+    scenes = args.scenes or sorted(constants.SCENE_NUMBERS)
+    rows = [benchmark_scene(scene_id, args.queries, args.blocked, rng) for scene_id in scenes]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        for row in rows:
+            print(f"FloorPlan{row['scene']:<4} nx {row['nx_seconds'] * 1000 / row['queries']:7.2f} ms/query  "
+                  f"grid {row['grid_seconds'] * 1000 / row['queries']:7.2f} ms/query  "
+                  f"mismatches {row['mismatches']}")
+    nx_total = sum(row["nx_seconds"] for row in rows)
+    grid_total = sum(row["grid_seconds"] for row in rows)
+    print(f"{len(rows)} scenes, {sum(row['queries'] for row in rows)} queries: nx {nx_total:.2f}s, "
+          f"grid {grid_total:.2f}s, speedup {nx_total / max(grid_total, 1e-9):.1f}x, "
+          f"mismatches {sum(row['mismatches'] for row in rows)}")
+
+
+if __name__ == "__main__":
+    main()
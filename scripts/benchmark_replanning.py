@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Measure replanning latency of D* Lite against full A* on scenes with many obstacles.
+
+Simulates GotoLocation navigation the way `EvalLLMAstar._execute_goto` does it: a share
+of the reachable cells is blocked without the graph knowing. The agent follows the
+planned actions, and every move into a blocked cell fails, is recorded with
+`add_impossible_spot` and triggers a replan from the current pose. Each episode runs
+twice on a freshly cleared graph with the same obstacles: once replanning with
+`Graph.get_shortest_path` (a new A* search after every change), once with
+`Graph.get_replanned_path` (D* Lite repairing its previous search).
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+import gen.constants as constants  # noqa: E402
+from gen.graph.graph_cache import get_graph  # noqa: E402
+
+Pose = Tuple[int, int, int, int]
+
+
+def run_episode(graph, start: Pose, goal: Pose, blocked: Set[Tuple[int, int]], incremental: bool,
+                max_replans: int) -> Dict:
+    plan = graph.get_replanned_path if incremental else graph.get_shortest_path
+    latencies: List[float] = []
+    pose = start
+    for _ in range(max_replans + 1):
+        t_start = time.perf_counter()
+        actions, path = plan(pose, goal)
+        latencies.append(time.perf_counter() - t_start)
+        if not actions:
+            break
+        for index, action in enumerate(actions):
+            next_pose = path[index + 1]
+            if action['action'] == 'MoveAhead' and tuple(next_pose[:2]) in blocked:
+                graph.add_impossible_spot(next_pose)
+                break
+            pose = tuple(next_pose[:3]) + (goal[3],)
+        else:
+            if pose[:3] == goal[:3]:
+                break
+    return {'latencies': latencies, 'reached': pose[:3] == goal[:3], 'cache': graph.path_cache_stats()}
+
+
+def benchmark_scene(scene_id: int, episodes: int, blocked_share: float, max_replans: int,
+                    rng: random.Random) -> Dict:
+    graph = get_graph(scene_id, use_gt=True, owner='benchmark')
+    points = [(int(point[0]), int(point[1])) for point in graph.points]
+    # build the per-grid successor / predecessor tables outside the timed calls
+    graph.planner.predecessors
+    rows = {'astar': [], 'dstar': []}
+    for _ in range(episodes):
+        start, goal = rng.sample(points, 2)
+        free = [point for point in points if point not in (start, goal)]
+        blocked = set(rng.sample(free, int(len(free) * blocked_share)))
+        start_pose = (start[0], start[1], rng.randint(0, 3), 0)
+        goal_pose = (goal[0], goal[1], rng.randint(0, 3), 0)
+        for name, incremental in (('astar', False), ('dstar', True)):
+            graph.clear()
+            rows[name].append(run_episode(graph, start_pose, goal_pose, blocked, incremental, max_replans))
+    graph.clear()
+    return rows
+
+
+def summarize(name: str, runs: List[Dict]) -> str:
+    first = [run['latencies'][0] for run in runs]
+    replans = [latency for run in runs for latency in run['latencies'][1:]]
+    total = [sum(run['latencies']) for run in runs]
+    return (f"{name:6s} first plan {statistics.mean(first) * 1000:7.2f} ms  "
+            f"replan {statistics.mean(replans) * 1000 if replans else 0.0:7.2f} ms (n={len(replans)})  "
+            f"planning per episode {statistics.mean(total) * 1000:8.2f} ms  "
+            f"reached {sum(run['reached'] for run in runs)}/{len(runs)}  "
+            f"path cache hits {sum(run['cache']['hits'] for run in runs)}, "
+            f"evicted {sum(run['cache']['evicted'] for run in runs)}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark D* Lite replanning against full A* replanning")
+    parser.add_argument("--scenes", type=int, nargs="*", default=None, help="Scene numbers (default: all)")
+    parser.add_argument("--episodes", type=int, default=5, help="Navigation episodes per scene")
+    parser.add_argument("--blocked", type=float, default=0.2, help="Share of reachable cells that are blocked")
+    parser.add_argument("--max_replans", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    rng = random.Random(args.seed)
+    scenes = args.scenes or sorted(constants.SCENE_NUMBERS)
+    runs = {'astar': [], 'dstar': []}
+    for scene_id in scenes:
+        rows = benchmark_scene(scene_id, args.episodes, args.blocked, args.max_replans, rng)
+        for name in runs:
+            runs[name].extend(rows[name])
+    print(f"{len(scenes)} scenes, {len(runs['astar'])} episodes, {args.blocked:.0%} of cells blocked")
+    for name, label in (('astar', 'A*'), ('dstar', 'D*Lite')):
+        print(summarize(label, runs[name]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Check the shared LLM rate limiter against a rate-limited mock server.
+
+Starts the mock OpenRouter server in-process with `--rpm`/`--tpm` limits, then runs
+several client processes that each send LLM queries through `LLMAgent` as evaluation
+workers would. It reports the achieved requests per minute, the 429s the server
+returned and how many queries failed, once without and once with the shared limiter
+(`--llm_rpm`/`--llm_tpm` set to the server's limits).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from scripts.mock_openrouter_server import MockConfig, make_server  # noqa: E402
+
+
+def _client(base_url: str, queries: int, rpm: Optional[int], tpm: Optional[int],
+            state_file: Optional[str], max_retries: int, results) -> None:
+    from models.model.llm import LLMAgent
+
+    agent = LLMAgent(SimpleNamespace(llm_base_url=base_url, llm_rpm=rpm, llm_tpm=tpm,
+                                     llm_rate_limit_file=state_file, llm_max_retries=max_retries,
+                                     llm_breaker_threshold=0, max_tokens=256))
+    agent.set_log_method(lambda message: None)
+    failed = 0
+    for i in range(queries):
+        if agent.query_llm("You are a planner.", f"Plan step {i} for worker {os.getpid()}.") is None:
+            failed += 1
+    limiter = agent.client.rate_limiter
+    results.put({'failed': failed, 'throttled': limiter.waited if limiter is not None else 0.0})
+
+
+def run_trial(port: int, args: argparse.Namespace, limited: bool) -> Dict[str, float]:
+    config = MockConfig(latency_mean=args.latency, rpm=args.rpm, tpm=args.tpm, retry_after=None)
+    server = make_server("127.0.0.1", port, config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+    state_file = os.path.join(tempfile.mkdtemp(prefix="rate_limit_check_"), "state.json")
+
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_client, args=(base_url, args.queries, args.rpm if limited else None,
+                                                 args.tpm if limited else None, state_file,
+                                                 args.max_retries, results))
+               for _ in range(args.workers)]
+    t_start = time.time()
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - t_start
+    server.shutdown()
+    server.server_close()
+
+    counters = server.RequestHandlerClass.state.snapshot()
+    total = args.workers * args.queries
+    failed = sum(outcome['failed'] for outcome in outcomes)
+    return {
+        'limited': limited,
+        'queries': total,
+        'failed': failed,
+        'server_429': counters.get('rate_limited', 0),
+        'seconds': elapsed,
+        'completed_per_minute': (total - failed) / elapsed * 60.0,
+        'mean_throttled_seconds': sum(outcome['throttled'] for outcome in outcomes) / len(outcomes),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Verify the cross-process LLM rate limiter against a limited mock server")
+    parser.add_argument("--port", type=int, default=0, help="Mock server port (0 = any free port)")
+    parser.add_argument("--workers", type=int, default=8, help="Client processes")
+    parser.add_argument("--queries", type=int, default=10, help="Queries per client process")
+    parser.add_argument("--rpm", type=int, default=120, help="Requests per minute enforced by the server")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute enforced by the server")
+    parser.add_argument("--latency", type=float, default=0.05, help="Server time to first byte in seconds")
+    parser.add_argument("--max_retries", type=int, default=2, help="Client retries per query")
+    parser.add_argument("--only", choices=["limited", "unlimited"], default=None, help="Run a single trial")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    trials = []
+    if args.only != "limited":
+        trials.append(run_trial(args.port, args, limited=False))
+    if args.only != "unlimited":
+        trials.append(run_trial(args.port, args, limited=True))
+    print(json.dumps(trials, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Compare prompt size, planning latency and success across prompt token budgets.
+
+Runs recorded with `--prompt_token_budget` store the budget and the estimated prompt
+tokens under the trace's `prompt` key. This script groups traces by model and budget
+(runs without a budget are reported as `full`) so trimmed prompts can be checked
+against full prompts for token savings, time to first action and success rate.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from models.utils.episode_index import iter_trace_files, parse_trace_path  # noqa: E402
+
+
+@dataclass
+class BudgetGroup:
+    episodes: int = 0
+    success: int = 0
+    tokens: List[int] = field(default_factory=list)
+    first_action: List[float] = field(default_factory=list)
+
+    def add(self, payload: Dict) -> None:
+        self.episodes += 1
+        self.success += int(bool(payload.get("success")))
+        prompt = payload.get("prompt") or {}
+        if prompt.get("estimated_tokens"):
+            self.tokens.append(prompt["estimated_tokens"])
+        latency = (payload.get("timing") or {}).get("time_to_first_action")
+        if latency is not None:
+            self.first_action.append(latency)
+
+    def as_row(self) -> Dict[str, Optional[float]]:
+        return {
+            "episodes": self.episodes,
+            "success_rate": self.success / self.episodes if self.episodes else 0.0,
+            "mean_tokens": statistics.mean(self.tokens) if self.tokens else None,
+            "median_first_action_s": statistics.median(self.first_action) if self.first_action else None,
+            "mean_first_action_s": statistics.mean(self.first_action) if self.first_action else None,
+        }
+
+
+def collect(root: Path, model: Optional[str] = None) -> Dict[Tuple[str, str], BudgetGroup]:
+    groups: Dict[Tuple[str, str], BudgetGroup] = defaultdict(BudgetGroup)
+    for path, _ in iter_trace_files(root):
+        info = parse_trace_path(path.relative_to(root))
+        if model and info["model"] != model:
+            continue
+        try:
+            with path.open("r", encoding="utf-8") as handle:
+                payload = json.load(handle)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if not isinstance(payload, dict) or "prompt" not in payload:
+            # Traces written before prompt stats were recorded cannot be compared
+            continue
+        budget = payload["prompt"].get("token_budget")
+        groups[(info["model"], "full" if budget is None else str(budget))].add(payload)
+    return groups
+
+
+def _fmt(value: Optional[float], spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(groups: Dict[Tuple[str, str], BudgetGroup]) -> None:
+    if not groups:
+        print("No traces with prompt statistics found.")
+        return
+    header = f"{'model':<40} {'budget':>8} {'episodes':>9} {'success':>8} {'tokens':>8} {'ttfa_med':>9} {'ttfa_mean':>9}"
+    print(header)
+    print("-" * len(header))
+    for (model, budget), group in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1] != "full", item[0][1])):
+        row = group.as_row()
+        print(f"{model:<40} {budget:>8} {row['episodes']:>9} {row['success_rate']:>8.1%} "
+              f"{_fmt(row['mean_tokens'], '.0f'):>8} {_fmt(row['median_first_action_s'], '.2f'):>9} "
+              f"{_fmt(row['mean_first_action_s'], '.2f'):>9}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Compare LLM prompt token budgets from recorded traces")
+    parser.add_argument(
+        "--root",
+        type=Path,
+        default=Path("logs/trajectories"),
+        help="Root directory containing trajectory logs (default: logs/trajectories)",
+    )
+    parser.add_argument("--model", type=str, default=None, help="Only report this model directory")
+    parser.add_argument("--json", action="store_true", help="Emit JSON instead of a table")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    root = args.root.resolve()
+    if not root.exists():
+        raise SystemExit(f"Root directory not found: {root}")
+    groups = collect(root, args.model)
+    if args.json:
+        report = {f"{model}@{budget}": group.as_row() for (model, budget), group in groups.items()}
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(groups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""Local stand-in for the OpenRouter chat completions API.
+
+Serves `POST /api/v1/chat/completions` (plain and SSE streaming) so the evaluation
+harness can be load-tested offline. Point the agents at it with
+`--llm_base_url http://127.0.0.1:8000/api/v1` or `LLM_BASE_URL=...`.
+
+Responses come from, in order:
+  1. a recorded LLM response cache (`--recorded`, the SQLite file written by `--llm_cache`),
+     looked up with the same request key the agents use,
+  2. canned responses (`--responses`, a JSON list of strings or of
+     {"match": "<substring of the last user message>", "content": "..."} objects),
+  3. `--default-content`.
+
+Latency, throughput and failures are configurable: a latency distribution for the
+time to first byte, a token rate for the body, and injected 429/500 responses and
+hung requests (timeouts). `--rpm`/`--tpm` enforce provider-style rate limits over a
+sliding 60 s window, answering 429 with Retry-After. `GET /stats` returns request counters.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from models.model.llm_cache import cache_key  # noqa: E402
+from models.model.prompt_budget import estimate_tokens  # noqa: E402
+
+DEFAULT_CONTENT = '[{"action": "stop"}]'
+
+
+@dataclass
+class MockConfig:
+    latency: str = "fixed"
+    latency_mean: float = 0.5
+    latency_sigma: float = 0.5
+    tokens_per_second: float = 0.0
+    chunk_chars: int = 16
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    rate_timeout: float = 0.0
+    timeout_seconds: float = 600.0
+    retry_after: Optional[float] = 1.0
+    default_content: str = DEFAULT_CONTENT
+    canned: List[Dict[str, str]] = field(default_factory=list)
+    recorded: Optional[Path] = None
+    rpm: int = 0
+    tpm: int = 0
+
+
+class MockState:
+    """Shared configuration, response sources and counters for all handler threads"""
+
+    def __init__(self, config: MockConfig, seed: Optional[int] = None) -> None:
+        self.config = config
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "requests": 0, "streamed": 0, "recorded_hits": 0, "canned_hits": 0,
+            "defaults": 0, "injected_429": 0, "injected_500": 0, "injected_timeouts": 0,
+            "rate_limited": 0,
+        }
+        # (time, tokens) of admitted requests in the last 60 s, for --rpm/--tpm
+        self.window: deque = deque()
+        self.window_tokens = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._local = threading.local()
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counters[name] += 1
+
+    def admit(self, tokens: int) -> Optional[float]:
+        """Admit a request under the rate limits; returns seconds until retry if it is over the limit"""
+        cfg = self.config
+        if not cfg.rpm and not cfg.tpm:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            while self.window and now - self.window[0][0] >= 60.0:
+                self.window_tokens -= self.window.popleft()[1]
+            over_rpm = cfg.rpm and len(self.window) >= cfg.rpm
+            over_tpm = cfg.tpm and self.window and self.window_tokens + tokens > cfg.tpm
+            if over_rpm or over_tpm:
+                self.counters["rate_limited"] += 1
+                return max(0.0, 60.0 - (now - self.window[0][0]))
+            self.window.append((now, tokens))
+            self.window_tokens += tokens
+            return None
+
+    def draw(self) -> float:
+        with self.lock:
+            return self.random.random()
+
+    def first_byte_delay(self) -> float:
+        cfg = self.config
+        with self.lock:
+            if cfg.latency == "uniform":
+                return self.random.uniform(0.0, 2 * cfg.latency_mean)
+            if cfg.latency == "exponential":
+                return self.random.expovariate(1.0 / cfg.latency_mean) if cfg.latency_mean > 0 else 0.0
+            if cfg.latency == "lognormal":
+                # Parameterized by the median (latency_mean) and the log-space sigma
+                return cfg.latency_mean * self.random.lognormvariate(0.0, cfg.latency_sigma)
+        return cfg.latency_mean
+
+    def _recorded_conn(self) -> Optional[sqlite3.Connection]:
+        if self.config.recorded is None:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.config.recorded}?mode=ro", uri=True, timeout=30.0)
+            self._local.conn = conn
+        return conn
+
+    def content_for(self, payload: Dict) -> str:
+        conn = self._recorded_conn()
+        if conn is not None:
+            row = conn.execute("SELECT response FROM responses WHERE key = ?", (cache_key(payload),)).fetchone()
+            if row is not None:
+                self.count("recorded_hits")
+                return json.loads(row[0])
+        last_user = ""
+        for message in payload.get("messages") or []:
+            if message.get("role") == "user":
+                last_user = str(message.get("content") or "")
+        for canned in self.config.canned:
+            if canned.get("match", "") in last_user:
+                self.count("canned_hits")
+                return canned["content"]
+        self.count("defaults")
+        return self.config.default_content
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters, in_flight=self.in_flight, peak_in_flight=self.peak_in_flight)
+
+
+def load_canned(path: Optional[Path]) -> List[Dict[str, str]]:
+    if path is None:
+        return []
+    with path.open("r", encoding="utf-8") as handle:
+        payload = json.load(handle)
+    if not isinstance(payload, list):
+        raise ValueError(f"{path} must contain a JSON list")
+    return [item if isinstance(item, dict) else {"match": "", "content": str(item)} for item in payload]
+
+
+def usage_for(payload: Dict, content: str) -> Dict[str, int]:
+    prompt = "".join(str(message.get("content") or "") for message in payload.get("messages") or [])
+    prompt_tokens = estimate_tokens(prompt)
+    completion_tokens = estimate_tokens(content)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockOpenRouter/1.0"
+    state: MockState
+
+    def log_message(self, format, *args):  # noqa: A002 - signature from BaseHTTPRequestHandler
+        pass
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.state.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        state = self.state
+        with state.lock:
+            state.counters["requests"] += 1
+            state.in_flight += 1
+            state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+        try:
+            self._complete(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (e.g. its read timeout fired) or closed a stream early
+            pass
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def _complete(self, payload: Dict) -> None:
+        state, cfg = self.state, self.state.config
+        draw = state.draw()
+        if draw < cfg.rate_timeout:
+            state.count("injected_timeouts")
+            time.sleep(cfg.timeout_seconds)
+            self.close_connection = True
+            return
+        draw -= cfg.rate_timeout
+        if draw < cfg.rate_429:
+            state.count("injected_429")
+            headers = {"Retry-After": f"{cfg.retry_after:g}"} if cfg.retry_after is not None else None
+            self._send_json(429, {"error": {"message": "Rate limit exceeded (injected)", "code": 429}}, headers)
+            return
+        draw -= cfg.rate_429
+        if draw < cfg.rate_500:
+            state.count("injected_500")
+            self._send_json(500, {"error": {"message": "Internal server error (injected)", "code": 500}})
+            return
+
+        content = state.content_for(payload)
+        # Requests with "n" get n choices; recordings of such requests hold a list of samples
+        samples = content if isinstance(content, list) else [content] * max(1, int(payload.get("n") or 1))
+        content = samples[0]
+        usage = usage_for(payload, "".join(samples))
+        retry_after = state.admit(usage["total_tokens"])
+        if retry_after is not None:
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "code": 429}},
+                            {"Retry-After": f"{retry_after:.2f}"})
+            return
+        time.sleep(state.first_byte_delay())
+        if payload.get("stream"):
+            state.count("streamed")
+            self._stream(payload, content, usage)
+            return
+
+        if cfg.tokens_per_second > 0:
+            time.sleep(usage["completion_tokens"] / cfg.tokens_per_second)
+        self._send_json(200, {
+            "id": f"mock-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": index, "message": {"role": "assistant", "content": sample}, "finish_reason": "stop"}
+                        for index, sample in enumerate(samples)],
+            "usage": usage,
+        })
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _event(self, event: Dict) -> None:
+        self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+
+    def _stream(self, payload: Dict, content: str, usage: Dict[str, int]) -> None:
+        cfg = self.state.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(b": MOCK PROCESSING\n\n")
+
+        base = {"id": f"mock-{time.time_ns()}", "object": "chat.completion.chunk", "model": payload.get("model")}
+        step = max(1, cfg.chunk_chars)
+        for start in range(0, len(content), step):
+            piece = content[start:start + step]
+            if cfg.tokens_per_second > 0:
+                time.sleep(estimate_tokens(piece) / cfg.tokens_per_second)
+            self._event(dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+        self._event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        self._event(dict(base, choices=[], usage=usage))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Mock OpenRouter chat completions server for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--recorded", type=Path, default=None,
+                        help="LLM response cache (SQLite, from --llm_cache) to replay recorded responses from")
+    parser.add_argument("--responses", type=Path, default=None,
+                        help="JSON list of canned responses (strings or {match, content} objects)")
+    parser.add_argument("--default-content", default=DEFAULT_CONTENT,
+                        help="Response content when nothing else matches")
+    parser.add_argument("--latency", choices=["fixed", "uniform", "exponential", "lognormal"], default="fixed",
+                        help="Distribution of the time to first byte")
+    parser.add_argument("--latency-mean", type=float, default=0.5,
+                        help="Mean (median for lognormal) time to first byte in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-space sigma for --latency lognormal")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Completion token rate after the first byte (0 = send at once)")
+    parser.add_argument("--chunk-chars", type=int, default=16, help="Characters per streamed delta")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--rate-timeout", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--timeout-seconds", type=float, default=600.0, help="How long hung requests hang")
+    parser.add_argument("--retry-after", type=float, default=1.0,
+                        help="Retry-After seconds on injected 429s (negative to omit the header)")
+    parser.add_argument("--rpm", type=int, default=0, help="Enforced requests per minute (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="Enforced prompt+completion tokens per minute (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and error draws")
+    return parser
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Large listen backlog so bursts of concurrent clients are not refused
+    request_queue_size = 1024
+
+
+def make_server(host: str, port: int, config: MockConfig, seed: Optional[int] = None) -> MockServer:
+    state = MockState(config, seed=seed)
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    return MockServer((host, port), handler)
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    config = MockConfig(
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        chunk_chars=args.chunk_chars,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        rate_timeout=args.rate_timeout,
+        timeout_seconds=args.timeout_seconds,
+        retry_after=args.retry_after if args.retry_after >= 0 else None,
+        default_content=args.default_content,
+        canned=load_canned(args.responses),
+        recorded=args.recorded,
+        rpm=args.rpm,
+        tpm=args.tpm,
+    )
+    if config.recorded is not None and not config.recorded.exists():
+        raise SystemExit(f"Recorded response cache not found: {config.recorded}")
+
+    server = make_server(args.host, args.port, config, seed=args.seed)
+    print(f"Mock OpenRouter listening on http://{args.host}:{args.port}/api/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.RequestHandlerClass.state.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
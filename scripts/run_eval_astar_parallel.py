@@ -2,11 +2,13 @@
 """Run eval_llm_astar on candle-related trajectories with optional parallelism."""
 
 import argparse
+import logging
 import subprocess
 import sys
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Iterable, List
+from typing import Iterable, List, Optional, Tuple
 
 
 def _iter_task_dirs(root: Path, keyword: str) -> Iterable[Path]:
@@ -42,6 +44,8 @@ def _build_command(
         cmd += ['--max_fails', str(args.max_fails)]
     if args.smooth_nav:
         cmd.append('--smooth_nav')
+    if args.nav_replanner is not None:
+        cmd += ['--nav_replanner', args.nav_replanner]
     if args.debug:
         cmd.append('--debug')
     if args.llm_model is not None:
@@ -56,15 +60,109 @@ def _build_command(
         cmd += ['--frequency_penalty', str(args.frequency_penalty)]
     if args.presence_penalty is not None:
         cmd += ['--presence_penalty', str(args.presence_penalty)]
+    if args.llm_base_url is not None:
+        cmd += ['--llm_base_url', args.llm_base_url]
+    if args.llm_timeout is not None:
+        cmd += ['--llm_timeout', str(args.llm_timeout)]
+    if args.llm_max_retries is not None:
+        cmd += ['--llm_max_retries', str(args.llm_max_retries)]
+    if args.llm_rpm is not None:
+        cmd += ['--llm_rpm', str(args.llm_rpm)]
+    if args.llm_tpm is not None:
+        cmd += ['--llm_tpm', str(args.llm_tpm)]
+    if args.llm_rate_limit_file is not None:
+        cmd += ['--llm_rate_limit_file', str(args.llm_rate_limit_file)]
+    if args.stream_plan:
+        cmd.append('--stream_plan')
+    if args.validate_plan:
+        cmd.append('--validate_plan')
+    if args.replan_invalid:
+        cmd.append('--replan_invalid')
+    if args.skip_invalid_actions:
+        cmd.append('--skip_invalid_actions')
+    if args.prompt_token_budget is not None:
+        cmd += ['--prompt_token_budget', str(args.prompt_token_budget)]
+    if args.llm_cache is not None:
+        cmd += ['--llm_cache', str(args.llm_cache), '--llm_cache_mode', args.llm_cache_mode]
     return cmd
 
 
-def _run_command(cmd: List[str]) -> int:
-    print('Running:', ' '.join(cmd))
-    completed = subprocess.run(cmd)
-    if completed.returncode != 0:
+def _run_pool(jobs: List[Tuple[Path, int]], base_cmd: List[str], args: argparse.Namespace, manifest) -> int:
+    """Run all jobs on long-lived simulator workers instead of one process per episode"""
+    from models.eval.eval_llm_astar import build_parser
+    from models.eval.jobs import EvalJob
+    from models.eval.scheduler import SceneAffinityPool
+    from models.eval.worker_pool import WorkerPool
+
+    # Workers get exactly the options a per-episode eval_llm_astar process would get
+    eval_args = build_parser().parse_args(base_cmd[2:])
+    pool_class = SceneAffinityPool if args.scene_affinity else WorkerPool
+    pool = pool_class(eval_args, num_workers=args.workers, job_timeout=args.job_timeout,
+                      max_attempts=args.max_attempts, manifest=manifest)
+    # Attempts carry over from earlier runs, so the retry limit holds across restarts
+    pool.run([EvalJob(str(traj_arg), ridx,
+                      attempts=manifest.jobs[manifest.key(traj_arg, ridx)]['attempts'] if manifest else 0)
+              for traj_arg, ridx in jobs])
+    return len(pool.failed)
+
+
+def _run_command(cmd: List[str], manifest=None, workers: int = 1) -> int:
+    if manifest is None:
+        print('Running:', ' '.join(cmd))
+        completed = subprocess.run(cmd)
+        if completed.returncode != 0:
+            print(f"  ↳ command failed with exit code {completed.returncode}")
+        return completed.returncode
+
+    traj_arg, ridx = Path(cmd[3]), int(cmd[5])
+    while True:
+        manifest.mark_running(traj_arg, ridx)
+        print('Running:', ' '.join(cmd))
+        t_start = time.time()
+        completed = subprocess.run(cmd)
+        if completed.returncode == 0:
+            manifest.mark_done(traj_arg, ridx, time.time() - t_start)
+            print(f"  ↳ {manifest.progress(workers)}")
+            return 0
         print(f"  ↳ command failed with exit code {completed.returncode}")
-    return completed.returncode
+        if not manifest.mark_failed(traj_arg, ridx, f"exit code {completed.returncode}", time.time() - t_start):
+            return completed.returncode
+        print('  ↳ retrying')
+
+
+def _run_queue_worker(work_queue, eval_script: Path, args: argparse.Namespace, repo_root: Path) -> int:
+    """Claim and run jobs from a shared file queue until it is drained; returns the failure count"""
+    from models.eval.file_queue import Heartbeat
+    from models.utils.episode_index import find_complete_trace
+
+    failures = 0
+    while True:
+        claimed = work_queue.claim()
+        if claimed is None:
+            if work_queue.is_drained():
+                return failures
+            # Other nodes still hold claims; wait in case one of them dies and its jobs are reclaimed
+            time.sleep(min(30.0, work_queue.lease / 10))
+            continue
+        name, job = claimed
+        cmd = _build_command(eval_script, repo_root / job['traj_file'], job['ridx'], args, repo_root)
+        print('Running:', ' '.join(cmd))
+        with Heartbeat(work_queue, name, job):
+            completed = subprocess.run(cmd)
+        if completed.returncode == 0:
+            work_queue.complete(name, job, trace=find_complete_trace(job['traj_file'], job['ridx'],
+                                                                     args.llm_model or 'deepseek/deepseek-chat'))
+        else:
+            failures += 1
+            retry = work_queue.fail(name, job, f"exit code {completed.returncode}")
+            print(f"  ↳ command failed with exit code {completed.returncode}{' (requeued)' if retry else ''}")
+        print(f"  ↳ queue: {work_queue.counts()}")
+
+
+def _default_manifest(llm_model: Optional[str]) -> Path:
+    # Same default model as eval_llm_astar, so traces and manifest agree
+    model = llm_model or 'deepseek/deepseek-chat'
+    return Path('logs') / 'manifests' / f"{model.replace('/', '_')}.json"
 
 
 def main() -> int:
@@ -82,6 +180,7 @@ def main() -> int:
     parser.add_argument('--max_steps', type=int, default=None)
     parser.add_argument('--max_fails', type=int, default=None)
     parser.add_argument('--smooth_nav', action='store_true')
+    parser.add_argument('--nav_replanner', choices=['astar', 'dstar'], default=None)
     parser.add_argument('--debug', action='store_true')
     parser.add_argument('--llm_model', type=str, default=None)
     parser.add_argument('--max_tokens', type=int, default=None)
@@ -89,10 +188,50 @@ def main() -> int:
     parser.add_argument('--top_p', type=float, default=None)
     parser.add_argument('--frequency_penalty', type=float, default=None)
     parser.add_argument('--presence_penalty', type=float, default=None)
+    parser.add_argument('--llm_base_url', type=str, default=None,
+                        help='LLM API base URL, e.g. a local mock server')
+    parser.add_argument('--llm_timeout', type=float, default=None)
+    parser.add_argument('--llm_max_retries', type=int, default=None)
+    parser.add_argument('--llm_rpm', type=int, default=None,
+                        help='Requests per minute shared by all workers (cross-process token bucket)')
+    parser.add_argument('--llm_tpm', type=int, default=None,
+                        help='Tokens per minute shared by all workers')
+    parser.add_argument('--llm_rate_limit_file', type=Path, default=None,
+                        help='State file of the shared rate limiter')
+    parser.add_argument('--stream_plan', action='store_true',
+                        help='Stream plans and start executing before generation finishes')
+    parser.add_argument('--validate_plan', action='store_true',
+                        help='Flag plan actions that are bound to fail')
+    parser.add_argument('--replan_invalid', action='store_true',
+                        help='Re-plan once when plan validation finds problems')
+    parser.add_argument('--skip_invalid_actions', action='store_true',
+                        help='With --validate_plan, do not execute flagged actions')
+    parser.add_argument('--prompt_token_budget', type=int, default=None,
+                        help='Token budget for the object list in LLM prompts')
+    parser.add_argument('--llm_cache', type=Path, default=None,
+                        help='Shared persistent LLM response cache (SQLite file)')
+    parser.add_argument('--llm_cache_mode', type=str, default='read_through',
+                        choices=['off', 'read_through', 'record', 'replay'])
     parser.add_argument('--dry_run', action='store_true',
                         help='Only print the commands that would be executed')
     parser.add_argument('--workers', type=int, default=1,
                         help='Number of parallel workers (default: 1)')
+    parser.add_argument('--persistent', action='store_true',
+                        help='Keep one simulator per worker alive across episodes instead of a process per episode')
+    parser.add_argument('--scene_affinity', action='store_true',
+                        help='With --persistent, keep workers on one FloorPlan and balance by work stealing')
+    parser.add_argument('--manifest', type=Path, default=None,
+                        help='Job manifest for resuming (default: logs/manifests/<model>.json)')
+    parser.add_argument('--no_manifest', action='store_true',
+                        help='Run every job without recording or skipping finished ones')
+    parser.add_argument('--queue_dir', type=Path, default=None,
+                        help='Shared work-queue directory; every node started with it pulls jobs from the same queue')
+    parser.add_argument('--lease', type=float, default=300.0,
+                        help='With --queue_dir, seconds without heartbeat before a claimed job is reclaimed')
+    parser.add_argument('--job_timeout', type=float, default=900,
+                        help='With --persistent, restart a worker whose episode runs longer than this (seconds)')
+    parser.add_argument('--max_attempts', type=int, default=2,
+                        help='Attempts per episode before it counts as failed')
 
     args = parser.parse_args()
 
@@ -107,15 +246,55 @@ def main() -> int:
         return 1
 
     commands: List[List[str]] = []
+    jobs: List[Tuple[Path, int]] = []
     for task_dir in _iter_task_dirs(data_root, args.pattern):
         for traj_file in _iter_traj_files(task_dir):
             for ridx in args.ridx:
-                commands.append(_build_command(eval_script, traj_file, ridx, args, repo_root))
+                cmd = _build_command(eval_script, traj_file, ridx, args, repo_root)
+                commands.append(cmd)
+                jobs.append((Path(cmd[3]), ridx))
 
     if not commands:
         print('No matching trajectories found.')
         return 0
 
+    if str(repo_root) not in sys.path:
+        sys.path.insert(0, str(repo_root))
+    if args.queue_dir is not None:
+        from models.eval.file_queue import FileWorkQueue
+        from models.utils.episode_index import find_complete_trace
+
+        logging.basicConfig(level=logging.INFO, format='[queue] %(message)s')
+        work_queue = FileWorkQueue(str(args.queue_dir), lease=args.lease, max_attempts=args.max_attempts)
+        model = args.llm_model or 'deepseek/deepseek-chat'
+        added = sum(work_queue.enqueue(str(traj_arg), ridx) for traj_arg, ridx in jobs
+                    if find_complete_trace(str(traj_arg), ridx, model) is None)
+        print(f"Queue {args.queue_dir}: enqueued {added} new job(s); {work_queue.counts()}")
+        if args.dry_run:
+            return 0
+        # The queue records job states for all nodes, so the per-node manifest is not used
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = [executor.submit(_run_queue_worker, work_queue, eval_script, args, repo_root)
+                       for _ in range(max(1, args.workers))]
+            failures = sum(future.result() for future in futures)
+        print(f"Queue drained on this node with {failures} failed attempt(s); {work_queue.counts()}")
+        return 0 if failures == 0 else 1
+
+    manifest = None
+    if not args.no_manifest:
+        from models.eval.job_manifest import JobManifest
+
+        manifest = JobManifest(args.manifest or _default_manifest(args.llm_model),
+                               model=args.llm_model or 'deepseek/deepseek-chat', max_attempts=args.max_attempts)
+        selected = [manifest.register(traj_arg, ridx) for traj_arg, ridx in jobs]
+        skipped = len(jobs) - sum(selected)
+        commands = [cmd for cmd, keep in zip(commands, selected) if keep]
+        jobs = [job for job, keep in zip(jobs, selected) if keep]
+        manifest.save()
+        print(f"Manifest {manifest.path}: skipping {skipped} finished or exhausted job(s); {manifest.progress()}")
+        if not commands:
+            return 0
+
     if args.dry_run:
         for cmd in commands:
             print('DRY RUN:', ' '.join(cmd))
@@ -124,14 +303,16 @@ def main() -> int:
 
     failures = 0
     workers = max(1, args.workers)
-    if workers == 1:
+    if args.persistent or args.scene_affinity:
+        failures = _run_pool(jobs, commands[0], args, manifest)
+    elif workers == 1:
         for cmd in commands:
-            ret = _run_command(cmd)
+            ret = _run_command(cmd, manifest, workers)
             if ret != 0:
                 failures += 1
     else:
         with ThreadPoolExecutor(max_workers=workers) as executor:
-            future_to_cmd = {executor.submit(_run_command, cmd): cmd for cmd in commands}
+            future_to_cmd = {executor.submit(_run_command, cmd, manifest, workers): cmd for cmd in commands}
             for future in as_completed(future_to_cmd):
                 ret = future.result()
                 if ret != 0:
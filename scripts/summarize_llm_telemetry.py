@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Summarize LLM call telemetry recorded in trajectory traces.
+
+Every trace written by the LLM evaluators carries an `llm` block with one record
+per LLM call (latency, time to first byte, token usage, retries, model id). This
+script aggregates those records per model into latency percentiles, token
+throughput and retry/error rates, and reports which share of episode wall time
+was spent waiting on the LLM.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from models.utils.episode_index import iter_trace_files, parse_trace_path  # noqa: E402
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; None for an empty sample"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+@dataclass
+class ModelTelemetry:
+    calls: int = 0
+    failed: int = 0
+    cached: int = 0
+    retries: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    ttfbs: List[float] = field(default_factory=list)
+
+    def add(self, call: Dict) -> None:
+        self.calls += 1
+        self.failed += int(not call.get("ok", True))
+        self.retries += call.get("retries") or 0
+        if call.get("cached"):
+            # Cache hits say nothing about the provider; count them but keep them out of latencies
+            self.cached += 1
+            return
+        self.prompt_tokens += call.get("prompt_tokens") or 0
+        self.completion_tokens += call.get("completion_tokens") or 0
+        self.cost += call.get("cost") or 0.0
+        if call.get("latency") is not None:
+            self.latencies.append(call["latency"])
+        if call.get("ttfb") is not None:
+            self.ttfbs.append(call["ttfb"])
+
+    def as_dict(self) -> Dict[str, object]:
+        busy = sum(self.latencies)
+        summary: Dict[str, object] = {
+            "calls": self.calls,
+            "failed": self.failed,
+            "cached": self.cached,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": self.cost,
+            "completion_tokens_per_second": self.completion_tokens / busy if busy else None,
+        }
+        for pct in PERCENTILES:
+            summary[f"latency_p{pct}"] = percentile(self.latencies, pct)
+            summary[f"ttfb_p{pct}"] = percentile(self.ttfbs, pct)
+        return summary
+
+
+@dataclass
+class TelemetryReport:
+    models: Dict[str, ModelTelemetry] = field(default_factory=lambda: defaultdict(ModelTelemetry))
+    episodes: int = 0
+    episode_seconds: float = 0.0
+    llm_seconds: float = 0.0
+
+
+def collect(root: Path, model_dir: Optional[str] = None) -> TelemetryReport:
+    report = TelemetryReport()
+    for path, _ in iter_trace_files(root):
+        if model_dir and parse_trace_path(path.relative_to(root))["model"] != model_dir:
+            continue
+        try:
+            with path.open("r", encoding="utf-8") as handle:
+                payload = json.load(handle)
+        except (OSError, json.JSONDecodeError):
+            continue
+        llm = payload.get("llm") if isinstance(payload, dict) else None
+        if not llm:
+            continue
+        report.episodes += 1
+        report.episode_seconds += (payload.get("timing") or {}).get("episode_seconds") or 0.0
+        report.llm_seconds += llm.get("latency_seconds") or 0.0
+        for call in llm.get("calls") or []:
+            report.models[call.get("model") or "unknown"].add(call)
+    return report
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def print_report(report: TelemetryReport) -> None:
+    if not report.models:
+        print("No traces with LLM telemetry found.")
+        return
+    header = (f"{'model':<40} {'calls':>6} {'fail':>5} {'cached':>6} {'retry':>6} "
+              f"{'p50':>7} {'p90':>7} {'p99':>7} {'ttfb50':>7} {'ttfb90':>7} {'in_tok':>9} {'out_tok':>9} {'tok/s':>7}")
+    print(header)
+    print("-" * len(header))
+    for model, telemetry in sorted(report.models.items()):
+        row = telemetry.as_dict()
+        print(f"{model:<40} {row['calls']:>6} {row['failed']:>5} {row['cached']:>6} {row['retries']:>6} "
+              f"{_fmt(row['latency_p50']):>7} {_fmt(row['latency_p90']):>7} {_fmt(row['latency_p99']):>7} "
+              f"{_fmt(row['ttfb_p50']):>7} {_fmt(row['ttfb_p90']):>7} "
+              f"{row['prompt_tokens']:>9} {row['completion_tokens']:>9} {_fmt(row['completion_tokens_per_second']):>7}")
+    if report.episode_seconds:
+        share = report.llm_seconds / report.episode_seconds
+        print(f"\n{report.episodes} episodes: {report.llm_seconds:.1f}s of {report.episode_seconds:.1f}s "
+              f"episode time waiting on the LLM ({share:.1%})")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Summarize LLM call telemetry per model")
+    parser.add_argument(
+        "--root",
+        type=Path,
+        default=Path("logs/trajectories"),
+        help="Root directory containing trajectory logs (default: logs/trajectories)",
+    )
+    parser.add_argument("--model-dir", type=str, default=None, help="Only include traces under this model directory")
+    parser.add_argument("--json", action="store_true", help="Emit JSON instead of a table")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    root = args.root.resolve()
+    if not root.exists():
+        raise SystemExit(f"Root directory not found: {root}")
+    report = collect(root, args.model_dir)
+    if args.json:
+        print(json.dumps({
+            "episodes": report.episodes,
+            "episode_seconds": report.episode_seconds,
+            "llm_seconds": report.llm_seconds,
+            "models": {model: telemetry.as_dict() for model, telemetry in report.models.items()},
+        }, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,28 @@
 This script scans trajectory rollout files under `logs/trajectories` and reports,
 for each model directory, how many trajectories completed successfully and how
 many contain no error messages.
+
+By default the per-trace results are kept in an incremental episode index
+(`episodes.sqlite` under the root), so reruns only parse new or modified traces.
+Changed traces are scanned for their success flags only, across `--workers`
+processes, and the scan reports its throughput.
 """
 
 from __future__ import annotations
 
 import argparse
 import json
+import os
+import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, Iterator, Tuple
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from models.utils.episode_index import DEFAULT_INDEX_NAME, EpisodeIndex, summary_key  # noqa: E402
 
 
 @dataclass
@@ -39,12 +52,7 @@ def iter_traj_files(root: Path) -> Iterator[Tuple[str, Path]]:
         except ValueError:
             # Should not happen, but guard against it.
             rel = path.name
-        parts = rel.parts if isinstance(rel, Path) else tuple(rel.split("/"))
-        if len(parts) >= 2:
-            model_key = "/".join(parts[:2])
-        else:
-            model_key = parts[0]
-        yield model_key, path
+        yield summary_key(rel), path
 
 
 def load_json(path: Path) -> Dict:
@@ -87,6 +95,25 @@ def summarize(root: Path) -> Dict[str, TrajectoryMetrics]:
     return metrics
 
 
+def summarize_indexed(root: Path, db_path: Optional[Path] = None, rebuild: bool = False,
+                      workers: int = 1) -> Dict[str, TrajectoryMetrics]:
+    """Same as ``summarize`` but answered from the incremental episode index."""
+    db_path = db_path or root / DEFAULT_INDEX_NAME
+    if rebuild:
+        for suffix in ("", "-wal", "-shm"):
+            stale = Path(str(db_path) + suffix)
+            if stale.exists():
+                stale.unlink()
+    with EpisodeIndex(root, db_path) as index:
+        stats = index.scan(workers=workers)
+        print(f"Index {index.db_path}: {stats}")
+        counts = index.summarize(ridx=0)
+    return {
+        model_key: TrajectoryMetrics(total=entry["total"], success=entry["success"], valid=entry["valid"])
+        for model_key, entry in counts.items()
+    }
+
+
 def print_summary(metrics: Dict[str, TrajectoryMetrics]) -> None:
     if not metrics:
         print("No trajectory files found.")
@@ -113,6 +140,28 @@ def build_parser() -> argparse.ArgumentParser:
         type=Path,
         help="Optional path to dump the summary as JSON",
     )
+    parser.add_argument(
+        "--index",
+        type=Path,
+        default=None,
+        help="Episode index database (default: <root>/episodes.sqlite)",
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Parse every trace instead of using the incremental episode index",
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="Discard the episode index and rebuild it from scratch",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes used to parse new or changed traces (default: number of CPUs)",
+    )
     return parser
 
 
@@ -124,7 +173,11 @@ def main() -> None:
     if not root.exists():
         raise SystemExit(f"Root directory not found: {root}")
 
-    metrics = summarize(root)
+    if args.no_index:
+        metrics = summarize(root)
+    else:
+        metrics = summarize_indexed(root, args.index, rebuild=args.rebuild_index,
+                                    workers=max(1, args.workers))
     print_summary(metrics)
 
     if args.json:
@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from models.utils.episode_index import EpisodeIndex, filesystem_type  # noqa: E402
+
+
+def test_filesystem_type_uses_longest_mount_point(tmp_path):
+    shared = tmp_path / "shared"
+    (shared / "logs").mkdir(parents=True)
+    mounts = tmp_path / "mounts"
+    mounts.write_text(f"/dev/sda1 / ext4 rw 0 0\n"
+                      f"server:/export {shared} nfs4 rw 0 0\n", encoding="utf-8")
+    assert filesystem_type(shared / "logs", mounts) == "nfs4"
+    assert filesystem_type(tmp_path, mounts) == "ext4"
+    assert filesystem_type(tmp_path, tmp_path / "missing") is None
+
+
+def test_journal_mode_can_be_forced(tmp_path):
+    with EpisodeIndex(tmp_path, journal_mode="delete") as index:
+        assert index._conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    with EpisodeIndex(tmp_path, journal_mode="wal") as index:
+        assert index._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
@@ -0,0 +1,40 @@
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+_SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "summarize_trajectory_metrics.py"
+_spec = importlib.util.spec_from_file_location("summarize_trajectory_metrics", _SCRIPT)
+summarize_trajectory_metrics = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = summarize_trajectory_metrics
+_spec.loader.exec_module(summarize_trajectory_metrics)
+
+
+def _write_trace(root, rel_path, success, step_flags):
+    path = root / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {"trajectory": [{"action": "MoveAhead", "success": flag} for flag in step_flags],
+               "success": success}
+    with path.open("w", encoding="utf-8") as handle:
+        json.dump(payload, handle, indent=2)
+
+
+def test_indexed_summary_matches_full_parse(tmp_path):
+    root = tmp_path / "trajectories"
+    task = "pick_and_place_simple-Apple-None-Fridge-1"
+    _write_trace(root, f"gpt-4o/valid_seen/{task}/trial_T0/r0_20240101.json", True, [True, True])
+    _write_trace(root, f"gpt-4o/valid_seen/{task}/trial_T1/r0_20240101.json", False, [True, False])
+    _write_trace(root, f"gpt-4o/valid_unseen/{task}/trial_T0/r0_20240101.json", True, [True])
+    _write_trace(root, f"openai/gpt-4o-mini/valid_seen/{task}/trial_T0/r0_20240101.json", False, [True])
+    _write_trace(root, f"openai/gpt-4o-mini/valid_seen/{task}/trial_T0/r1_20240101.json", True, [True])
+    broken = root / f"gpt-4o/valid_seen/{task}/trial_T2/r0_20240101.json"
+    broken.parent.mkdir(parents=True)
+    broken.write_text("{not json")
+
+    full = summarize_trajectory_metrics.summarize(root)
+    indexed = summarize_trajectory_metrics.summarize_indexed(root, tmp_path / "episodes.sqlite")
+
+    assert {key: stats.as_dict() for key, stats in indexed.items()} == \
+        {key: stats.as_dict() for key, stats in full.items()}
+    assert sorted(full) == ["gpt-4o/valid_seen", "gpt-4o/valid_unseen", "openai/gpt-4o-mini"]
+    assert full["gpt-4o/valid_seen"].as_dict() == {"total_trajs": 3, "success_trajs": 1, "valid_trajs": 1}